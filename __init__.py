@@ -18,112 +18,20 @@ bl_info = {
 # sys.path.append(directory)
 
 
-reload = False
-if "props" in locals():
-    reload = True
-
-
-import bpy
-from bpy.props import CollectionProperty, BoolProperty
-from bpy.utils import register_class, unregister_class
-from bpy.types import WindowManager
-
-from . import log
-from . import props
-from . import drawing
-from . import operators
-from . import panels
-from . import solver
-
-if reload:
-    # When using script.reload in blender
-    # For development...
-    import importlib
-
-    importlib.reload(props)
-    importlib.reload(drawing)
-    importlib.reload(operators)
-    operators.reload()
-    importlib.reload(panels)
-    importlib.reload(solver)
-    importlib.reload(log)
-
-
-def register():
-    log.logger().debug("Start")
-    # Properties
-    WindowManager.mesh_constraints_draw_constraints_definition = BoolProperty(
-        default=False
-    )
-
-    register_class(props.MeshConstraintProperties)
-    register_class(props.MeshConstraintsContainer)
-    bpy.types.Object.MeshConstraintGenerator = CollectionProperty(
-        type=props.MeshConstraintsContainer
-    )
-
-    # Operators
-    register_class(operators.MESH_CONSTRAINTS_OT_DrawConstraintsDefinition)
-    register_class(operators.MESH_CONSTRAINTS_OT_Solve)
-    register_class(operators.MESH_CONSTRAINTS_OT_DeleteConstraint)
-    register_class(operators.MESH_CONSTRAINTS_OT_DeleteAllConstraints)
-    register_class(operators.MESH_CONSTRAINTS_OT_HideAllConstraints)
-    register_class(operators.MESH_CONSTRAINTS_OT_ShowAllConstraints)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintDistance2Vertices)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixXCoord)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixYCoord)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixZCoord)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixXYCoord)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixXZCoord)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixYZCoord)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixXYZCoord)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintParallel2Edges)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintPerpendicular2Edges)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintOnX)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintOnY)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintOnZ)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintSameDistance2Edges)
-    register_class(operators.MESH_CONSTRAINTS_OT_ConstraintAngle)
-
-    # Panels
-    register_class(panels.MeshConstraintsPanelMain)
-    register_class(panels.MeshConstraintsPanelAdd)
-    register_class(panels.MeshConstraintsPanelItems)
-
-    log.logger().debug("End")
-
-
-def unregister():
-    log.logger().debug("Start")
-    # Panels
-    unregister_class(panels.MeshConstraintsPanelAdd)
-    unregister_class(panels.MeshConstraintsPanelItems)
-    unregister_class(panels.MeshConstraintsPanelMain)
-
-    # Operators
-    unregister_class(operators.MESH_CONSTRAINTS_OT_DrawConstraintsDefinition)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_Solve)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_DeleteConstraint)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_DeleteAllConstraints)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_HideAllConstraints)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ShowAllConstraints)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintDistance2Vertices)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixXCoord)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixYCoord)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixZCoord)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixXYCoord)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixXZCoord)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixYZCoord)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintFixXYZCoord)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintParallel2Edges)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintPerpendicular2Edges)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintOnX)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintOnY)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintOnZ)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintSameDistance2Edges)
-    unregister_class(operators.MESH_CONSTRAINTS_OT_ConstraintAngle)
-
-    # Properties
-    unregister_class(props.MeshConstraintsContainer)
-    unregister_class(props.MeshConstraintProperties)
-    log.logger().debug("End")
+try:
+    import bpy
+except ImportError:
+    # Imported outside of blender : by the solver worker processes, which
+    # import the package again with the spawn start method, or to use the
+    # solver alone. Nothing to register then
+    bpy = None
+
+if bpy is not None:
+    if "addon" in locals():
+        # When using script.reload in blender
+        import importlib
+
+        importlib.reload(addon)
+
+    from . import addon
+    from .addon import register, unregister
@@ -0,0 +1,440 @@
+# Linear algebra backends used by the NewtonSolver
+#
+# A backend owns the storage of the numeric matrices (a, b, aat, z, x)
+# and the few operations needed for a least squares Gauss-Newton step.
+# All backends must produce the same steps, the python one is the reference.
+#
+# The jacobian is always described by its non zero positions, a list of (row, col),
+# dense backends just fill the zeros.
+
+import numpy
+
+from . import krylov, log
+from .budget import NO_BUDGET
+
+# scipy is not shipped with blender, so the sparse backend is optional.
+# It takes a while to import, so it is imported on first use, see sparse_available
+scipy = None
+_scipy_imported = False
+
+BACKEND_PYTHON = "python"
+BACKEND_NUMPY = "numpy"
+BACKEND_SPARSE = "sparse"
+# Matrix free conjugate gradients (krylov.py), for the biggest meshes,
+# jacobi or incomplete cholesky preconditioner
+BACKEND_KRYLOV = "krylov"
+BACKEND_KRYLOV_CHOLESKY = "krylov_cholesky"
+# numpy for small systems, sparse for big ones, or krylov_cholesky if scipy
+# is not available
+BACKEND_AUTO = "auto"
+
+# Number of equations from which the auto backend goes sparse
+SPARSE_MIN_EQUATIONS = 300
+# Sparse LU of a singular a * a.transpose() : relative residual over which
+# the LU solution is rejected, and relative shift of the diagonal used instead
+SINGULAR_TOLERANCE = 1e-8
+SINGULAR_SHIFT = 1e-10
+
+
+class PythonBackend:
+    """Reference backend : lists of lists and pure python loops"""
+
+    name = BACKEND_PYTHON
+
+    def vector(self, size):
+        return [0 for i in range(size)]
+
+    def matrix(self, rows, cols):
+        return [[0 for j in range(cols)] for i in range(rows)]
+
+    def jacobian(self, rows, cols, nonzero):
+        """Allocate a jacobian of rows * cols with nonzero positions"""
+        return self.matrix(rows, cols)
+
+    def nonzero_terms(self, a):
+        """Return (rows, cols, values) arrays of the non zero terms of a"""
+        terms = [
+            (i, j, v) for i, row in enumerate(a) for j, v in enumerate(row) if v != 0
+        ]
+        if len(terms) == 0:
+            return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int), numpy.zeros(0)
+        rows, cols, values = zip(*terms)
+        return numpy.array(rows), numpy.array(cols), numpy.array(values, dtype=float)
+
+    def set_vector(self, vector, values):
+        """Copy values in vector"""
+        vector[:] = values
+
+    def set_jacobian(self, a, nonzero, values):
+        """Reset a to 0 and copy values at nonzero positions, a list of (row, col)"""
+        for row in a:
+            for j in range(len(row)):
+                row[j] = 0
+        for (i, j), value in zip(nonzero, values):
+            a[i][j] = value
+
+    def compute_aat(self, a, aat):
+        """Compute value of a * a.transpose() and push results in aat, returned"""
+        nb_equations = len(a)
+        nb_params = len(a[0]) if nb_equations > 0 else 0
+        for r in range(nb_equations):
+            for c in range(nb_equations):
+                s = 0
+                for i in range(nb_params):
+                    s += a[r][i] * a[c][i]
+                aat[r][c] = s
+        return aat
+
+    def solve_linear_system(self, aat, b, z):
+        """Solve the system aat * z = b, for z
+        by gaussian elimination with partial pivoting.
+        aat and b are modified in place"""
+        nb_equations = len(aat)
+        for i in range(nb_equations):
+            # Try to eliminate term in column i for rows > i
+            # First find pivot for rows >= i
+            vmax = 0
+            imax = 0
+            for ip in range(i, nb_equations):
+                if abs(aat[ip][i]) > vmax:
+                    imax = ip
+                    vmax = abs(aat[ip][i])
+
+            if abs(vmax) < 1e-20:
+                # Maybe a singular matrix, but I don't care
+                # my job here is done : column i term is already 0
+                continue
+
+            # Swap for pivot row imax <-> i
+            for j in range(nb_equations):
+                aat[i][j], aat[imax][j] = aat[imax][j], aat[i][j]
+            b[i], b[imax] = b[imax], b[i]
+
+            # Now term elimination in column i for rows > i+1 (because row i is the row of the pivot)
+            for ip in range(i + 1, nb_equations):
+                frac = aat[ip][i] / aat[i][i]
+                for jp in range(i, nb_equations):
+                    aat[ip][jp] -= frac * aat[i][jp]
+                b[ip] -= frac * b[i]
+
+        # Now aat is in triangular shape with lower half = 0
+        # It is time for backward substitution
+        for i in range(nb_equations - 1, -1, -1):
+            if abs(aat[i][i]) < 1e-20:
+                # The factor for this parameter is 0
+                # So I won't be able to do anything with it
+                # Just continue for the others
+                # Same type of strategy as 10 lines up
+                continue
+
+            t = b[i]
+            for j in range(nb_equations - 1, i, -1):
+                # Add already solved parameters
+                t -= z[j] * aat[i][j]
+
+            z[i] = t / aat[i][i]
+
+    def add_diagonal(self, aat, value):
+        """Add value to the diagonal of aat, returned"""
+        for i in range(len(aat)):
+            aat[i][i] += value
+        return aat
+
+    def max_diagonal(self, aat):
+        """Biggest term of the diagonal of aat"""
+        return max((aat[i][i] for i in range(len(aat))), default=0)
+
+    def multiply_transpose(self, a, z, x):
+        """Compute a.transpose() * z and push results in x"""
+        nb_equations = len(a)
+        for c in range(len(x)):
+            s = 0
+            for i in range(nb_equations):
+                s += a[i][c] * z[i]
+            x[c] = s
+
+
+class NumpyBackend:
+    """float64 arrays and vectorized BLAS/LAPACK calls"""
+
+    name = BACKEND_NUMPY
+
+    def vector(self, size):
+        return numpy.zeros(size)
+
+    def matrix(self, rows, cols):
+        return numpy.zeros((rows, cols))
+
+    def __init__(self):
+        # Index arrays of the jacobian nonzero positions
+        self.nonzero = None
+        self.rows = None
+        self.cols = None
+
+    def jacobian(self, rows, cols, nonzero):
+        """Allocate a jacobian of rows * cols with nonzero positions"""
+        self._index_nonzero(nonzero)
+        return self.matrix(rows, cols)
+
+    def _index_nonzero(self, nonzero):
+        """Convert nonzero positions to index arrays, once per structure"""
+        self.nonzero = nonzero
+        if len(nonzero) > 0:
+            self.rows, self.cols = numpy.array(nonzero, dtype=int).T
+        else:
+            self.rows = self.cols = numpy.zeros(0, dtype=int)
+
+    def nonzero_terms(self, a):
+        """Return (rows, cols, values) arrays of the non zero terms of a"""
+        rows, cols = numpy.nonzero(a)
+        return rows, cols, a[rows, cols]
+
+    def set_vector(self, vector, values):
+        """Copy values in vector"""
+        vector[:] = values
+
+    def set_jacobian(self, a, nonzero, values):
+        """Reset a to 0 and copy values at nonzero positions, a list of (row, col)"""
+        if nonzero is not self.nonzero:
+            self._index_nonzero(nonzero)
+        a.fill(0)
+        a[self.rows, self.cols] = values
+
+    def compute_aat(self, a, aat):
+        """Compute value of a * a.transpose() and push results in aat, returned"""
+        numpy.matmul(a, a.T, out=aat)
+        return aat
+
+    def solve_linear_system(self, aat, b, z):
+        """Solve the system aat * z = b, for z.
+        Least squares solution so a singular aat still gives a usable z"""
+        z[:] = numpy.linalg.lstsq(aat, b, rcond=None)[0]
+
+    def add_diagonal(self, aat, value):
+        """Add value to the diagonal of aat, returned"""
+        aat[numpy.diag_indices_from(aat)] += value
+        return aat
+
+    def max_diagonal(self, aat):
+        """Biggest term of the diagonal of aat"""
+        return float(aat.diagonal().max()) if aat.shape[0] > 0 else 0
+
+    def multiply_transpose(self, a, z, x):
+        """Compute a.transpose() * z and push results in x"""
+        numpy.matmul(a.T, z, out=x)
+
+
+class SparseBackend:
+    """scipy CSR jacobian and sparse LU solve of the normal equations.
+    The jacobian structure is fixed at allocation, only its data is updated"""
+
+    name = BACKEND_SPARSE
+
+    def __init__(self):
+        if not sparse_available():
+            raise Exception("Sparse backend needs scipy, and it is not installed")
+        # For each slot of the CSR data, index in the nonzero list
+        self.order = None
+
+    def vector(self, size):
+        return numpy.zeros(size)
+
+    def matrix(self, rows, cols):
+        return scipy.sparse.csr_matrix((rows, cols))
+
+    def jacobian(self, rows, cols, nonzero):
+        """Allocate a jacobian of rows * cols with nonzero positions"""
+        if len(nonzero) == 0:
+            self.order = numpy.zeros(0, dtype=int)
+            return self.matrix(rows, cols)
+        r, c = zip(*nonzero)
+        # Data is the position in nonzero, so I know where each value goes after
+        # the conversion to CSR
+        positions = numpy.arange(1, len(nonzero) + 1, dtype=float)
+        a = scipy.sparse.csr_matrix((positions, (r, c)), shape=(rows, cols))
+        self.order = a.data.astype(int) - 1
+        a.data[:] = 0
+        return a
+
+    def nonzero_terms(self, a):
+        """Return (rows, cols, values) arrays of the non zero terms of a"""
+        coo = a.tocoo()
+        nonzero = coo.data != 0
+        return coo.row[nonzero], coo.col[nonzero], coo.data[nonzero]
+
+    def set_vector(self, vector, values):
+        """Copy values in vector"""
+        vector[:] = values
+
+    def set_jacobian(self, a, nonzero, values):
+        """Copy values in a, values are in the order of nonzero"""
+        if len(self.order) > 0:
+            a.data[:] = numpy.asarray(values, dtype=float)[self.order]
+
+    def compute_aat(self, a, aat):
+        """Compute value of a * a.transpose(), returned as a new sparse matrix"""
+        return (a @ a.T).tocsc()
+
+    def solve_linear_system(self, aat, b, z):
+        """Solve the system aat * z = b, for z.
+        Sparse LU, and a regularized LU if aat is singular"""
+        if aat.shape[0] == 0:
+            return
+        try:
+            z[:] = scipy.sparse.linalg.splu(aat).solve(b)
+            if self._solved(aat, b, z):
+                return
+        except RuntimeError:
+            pass
+        # Singular matrix, redundant equations : splu either fails or gives a
+        # huge z. A small shift of the diagonal gives the z of the minimum
+        # norm step a.transpose() * z
+        shift = SINGULAR_SHIFT * max(self.max_diagonal(aat), 1)
+        z[:] = scipy.sparse.linalg.splu(self.add_diagonal(aat, shift)).solve(b)
+
+    def _solved(self, aat, b, z):
+        """Whether z is a finite and accurate solution of aat * z = b"""
+        if not numpy.all(numpy.isfinite(z)):
+            return False
+        residual = numpy.linalg.norm(aat @ z - b)
+        return residual <= SINGULAR_TOLERANCE * max(numpy.linalg.norm(b), 1e-300)
+
+    def add_diagonal(self, aat, value):
+        """Add value to the diagonal of aat, returned as a new sparse matrix"""
+        return (aat + value * scipy.sparse.identity(aat.shape[0])).tocsc()
+
+    def max_diagonal(self, aat):
+        """Biggest term of the diagonal of aat"""
+        return float(aat.diagonal().max()) if aat.shape[0] > 0 else 0
+
+    def multiply_transpose(self, a, z, x):
+        """Compute a.transpose() * z and push results in x"""
+        x[:] = a.T @ z
+
+
+class KrylovBackend:
+    """Matrix free : the jacobian is kept as its non zero terms and
+    a * a.transpose() is never built, the least squares steps are solved by
+    preconditioned conjugate gradients, only as accurate as needed by
+    the Newton iterations (see krylov.py)"""
+
+    name = BACKEND_KRYLOV
+    preconditioner = krylov.PRECONDITIONER_JACOBI
+
+    def __init__(self):
+        self.forcing_term = krylov.ForcingTerm()
+        # Conjugate gradients iterations of the last linear solve
+        self.iterations = 0
+        # Number of linear solves stopped at krylov.MAX_ITERATIONS
+        self.exhausted = 0
+        # Budget of the solve, checked at each iteration, see budget.py
+        self.budget = NO_BUDGET
+
+    def vector(self, size):
+        return numpy.zeros(size)
+
+    def matrix(self, rows, cols):
+        # a * a.transpose() is never stored, see compute_aat
+        return None
+
+    def jacobian(self, rows, cols, nonzero):
+        """Allocate a jacobian of rows * cols with nonzero positions"""
+        return krylov.Jacobian(rows, cols, nonzero)
+
+    def nonzero_terms(self, a):
+        """Return (rows, cols, values) arrays of the non zero terms of a"""
+        nonzero = a.values != 0
+        return a.rows[nonzero], a.cols[nonzero], a.values[nonzero]
+
+    def set_vector(self, vector, values):
+        """Copy values in vector"""
+        vector[:] = values
+
+    def set_jacobian(self, a, nonzero, values):
+        """Copy values in a, values are in the order of nonzero"""
+        a.values[:] = values
+
+    def compute_aat(self, a, aat):
+        """Return a * a.transpose() as an operator"""
+        return krylov.NormalOperator(a)
+
+    def solve_linear_system(self, aat, b, z):
+        """Solve the system aat * z = b, for z, up to the forcing term"""
+        tolerance = self.forcing_term.next(b)
+        z[:], self.iterations, converged = krylov.least_squares(
+            aat,
+            b,
+            krylov.preconditioner(self.preconditioner, aat),
+            tolerance,
+            krylov.MAX_ITERATIONS,
+            self.budget.check,
+        )
+        if not converged:
+            log.logger().debug(
+                f"krylov {self.preconditioner} stopped at {self.iterations} "
+                f"iterations, before the forcing term {tolerance}"
+            )
+            self.exhausted += 1
+            self.forcing_term.missed = True
+            # Jacobi is too weak for this mesh, the next steps would not be
+            # more accurate
+            self.preconditioner = krylov.PRECONDITIONER_INCOMPLETE_CHOLESKY
+
+    def add_diagonal(self, aat, value):
+        """Add value to the diagonal of aat, returned as a new operator"""
+        return krylov.NormalOperator(aat.a, aat.damping + value)
+
+    def max_diagonal(self, aat):
+        """Biggest term of the diagonal of aat"""
+        return float(aat.diagonal().max()) if aat.a.shape[0] > 0 else 0
+
+    def multiply_transpose(self, a, z, x):
+        """Compute a.transpose() * z and push results in x"""
+        x[:] = a.transpose_dot(z)
+
+
+class KrylovCholeskyBackend(KrylovBackend):
+    """Krylov with the incomplete cholesky preconditioner"""
+
+    name = BACKEND_KRYLOV_CHOLESKY
+    preconditioner = krylov.PRECONDITIONER_INCOMPLETE_CHOLESKY
+
+
+BACKENDS = {
+    BACKEND_PYTHON: PythonBackend,
+    BACKEND_NUMPY: NumpyBackend,
+    BACKEND_SPARSE: SparseBackend,
+    BACKEND_KRYLOV: KrylovBackend,
+    BACKEND_KRYLOV_CHOLESKY: KrylovCholeskyBackend,
+}
+
+DEFAULT_BACKEND = BACKEND_AUTO
+
+
+def sparse_available():
+    """True if scipy is installed, imported by the first call"""
+    global scipy, _scipy_imported
+    if not _scipy_imported:
+        _scipy_imported = True
+        try:
+            import scipy.sparse
+            import scipy.sparse.linalg
+        except ImportError:
+            scipy = None
+    return scipy is not None
+
+
+def get_backend(name, nb_equations=0):
+    """Return a backend instance from its name,
+    nb_equations is used to choose the backend if name is BACKEND_AUTO"""
+    if name == BACKEND_AUTO:
+        if nb_equations < SPARSE_MIN_EQUATIONS:
+            name = BACKEND_NUMPY
+        elif sparse_available():
+            name = BACKEND_SPARSE
+        else:
+            # A dense a * a.transpose() is too big
+            name = BACKEND_KRYLOV_CHOLESKY
+    if name not in BACKENDS:
+        raise Exception(f"Unknown backend '{name}'")
+    return BACKENDS[name]()
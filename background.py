@@ -0,0 +1,80 @@
+# Solve in a background thread, see operators/solve.py
+#
+# The solve runs in a thread while the blender main thread stays responsive :
+# it polls the values given by the progress callback of the solve to update
+# the mesh, and the result once the thread is done. No bpy in here, the main
+# thread is the only one touching the mesh.
+
+import threading
+
+from .budget import CancelToken
+from .solver import DEFAULT_PROGRESS_INTERVAL
+
+
+class BackgroundSolve:
+    """Solver.solve of a solver in a thread
+    - solver: Solver, not to be used by another thread until done
+    - workers, time_budget, progress_interval: see Solver.solve"""
+
+    def __init__(
+        self,
+        solver,
+        workers=None,
+        time_budget=None,
+        progress_interval=DEFAULT_PROGRESS_INTERVAL,
+    ):
+        self.solver = solver
+        self.workers = workers
+        self.time_budget = time_budget
+        self.progress_interval = progress_interval
+        self.token = CancelToken()
+        # Values given by the solve and not yet polled, (point, axis) -> value
+        self._values = {}
+        self._lock = threading.Lock()
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._result = self.solver.solve(
+                workers=self.workers,
+                time_budget=self.time_budget,
+                cancel=self.token,
+                progress=self._progress,
+                progress_interval=self.progress_interval,
+            )
+        except Exception as e:
+            # Raised again by result(), in the main thread
+            self._error = e
+
+    def _progress(self, values):
+        with self._lock:
+            self._values.update(values)
+
+    def progress(self):
+        """Values given by the solve since the last call, (point, axis) -> value"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    @property
+    def done(self):
+        return self._thread.ident is not None and not self._thread.is_alive()
+
+    def cancel(self):
+        """Stop the solve and wait for the thread, result() is then
+        a "cancelled" solve result"""
+        self.token.cancel()
+        self._thread.join()
+
+    def result(self):
+        """Wait for the solve and return its result, see Solver.solve"""
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
@@ -0,0 +1,73 @@
+# Time budget and cooperative cancellation of a solve, see Solver.solve
+#
+# The solvers check their Budget between iterations and in the loops preparing
+# the systems (presolve, jacobian structure, sympy equations). When it is over
+# they stop with the best values found so far, see NewtonSolver.solve.
+# Not checked inside a linear solve or a rank analysis.
+
+import threading
+import time
+
+REASON_TIMEOUT = "timeout"
+REASON_CANCELLED = "cancelled"
+REASONS = (REASON_TIMEOUT, REASON_CANCELLED)
+
+
+class CancelToken:
+    """Cancel a running solve, cancel() can be called from another thread"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class Interrupted(Exception):
+    """Raised by Budget.check, caught by the solvers"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Budget:
+    """Deadline and cancel token of a solve
+    - time_budget: seconds from now, None for no deadline
+    - token: CancelToken or None"""
+
+    def __init__(self, time_budget=None, token=None):
+        self.deadline = None
+        if time_budget is not None:
+            self.deadline = time.perf_counter() + time_budget
+        self.token = token
+
+    @property
+    def cancelled(self):
+        return self.token is not None and self.token.cancelled
+
+    def remaining(self):
+        """Seconds left, None if there is no deadline"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def reason(self):
+        """REASON_CANCELLED or REASON_TIMEOUT if the solve is to stop, else None"""
+        if self.cancelled:
+            return REASON_CANCELLED
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return REASON_TIMEOUT
+        return None
+
+    def check(self):
+        reason = self.reason()
+        if reason is not None:
+            raise Interrupted(reason)
+
+
+NO_BUDGET = Budget()
@@ -0,0 +1,135 @@
+# Warm start cache of the previous solves, one entry per object
+#
+# An entry keeps the Solver of the last successful solve of an object.
+# The next solve of this object reuses it if the mesh topology and the structure
+# of the equations (kinds, points, axes) are the same, only the values of the
+# constraints can be different. Then :
+# - the built systems of the cached solver are reused, see Solver.systems
+# - points still at their last solved coordinates start from the full precision
+# solution, blender keeps only 32 bits floats coordinates.
+# If constraints were added or removed, the new solver only solves the components
+# touched by the edit, see Solver.last_solve.
+# A topology edit invalidates the entry.
+#
+# The best coordinates of an interrupted solve (time budget or cancel) are kept
+# apart in PartialResults, until they are applied to the mesh or discarded.
+
+import collections
+
+import numpy
+
+from .solver import SOLVED_TOLERANCE
+
+# Maximum number of objects in the cache
+DEFAULT_MAX_ENTRIES = 8
+# Maximum number of equations of all the cached solvers
+DEFAULT_MAX_EQUATIONS = 500000
+
+
+class SolutionCache:
+    """LRU cache of the last solved Solver of each object"""
+
+    def __init__(
+        self, max_entries=DEFAULT_MAX_ENTRIES, max_equations=DEFAULT_MAX_EQUATIONS
+    ):
+        self.max_entries = max_entries
+        self.max_equations = max_equations
+        # key -> (topology, solver), least recently used first
+        self.entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def warm_start(self, key, solver, topology=None):
+        """Return the solver to use to solve solver, not solved yet :
+        the cached solver of key updated with the points and the equations
+        values of solver if it has the same topology and structure, solver otherwise
+        - topology: anything comparable describing the mesh topology"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return solver
+        cached_topology, cached = entry
+        if cached_topology != topology:
+            # Topology edited, nothing to reuse
+            self.invalidate(key)
+            return solver
+        self.entries.move_to_end(key)
+
+        points, solved = solver.points, cached.points
+        unchanged = numpy.flatnonzero(~points.moved(solved, SOLVED_TOLERANCE))
+        solved_rows = [solved.rows[points.indices[row]] for row in unchanged]
+        points.coordinates[unchanged] = solved.coordinates[solved_rows]
+
+        if cached.structure() == solver.structure():
+            cached.update(solver)
+            return cached
+        # Constraints added or removed : the solver is new but the components
+        # not touched by the edit are not solved again
+        solver.last_solve = cached.last_solve
+        return solver
+
+    def store(self, key, solver, topology=None):
+        """Keep solver, successfully solved, for the next solve of key"""
+        self.entries[key] = (topology, solver)
+        self.entries.move_to_end(key)
+        self._evict()
+
+    def invalidate(self, key):
+        """Forget key, after a topology edit for example"""
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def _nb_equations(self):
+        return sum(len(s.equations_records) for _, s in self.entries.values())
+
+    def _evict(self):
+        """Remove least recently used entries while over the limits"""
+        while len(self.entries) > 0 and (
+            len(self.entries) > self.max_entries
+            or self._nb_equations() > self.max_equations
+        ):
+            self.entries.popitem(last=False)
+
+
+# Cache used by the solve operator, key is the object name
+SOLUTIONS = SolutionCache()
+
+
+class PartialResults:
+    """Best coordinates of the last interrupted solve of each object"""
+
+    def __init__(self):
+        # key -> partial result
+        self.entries = {}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def store(self, key, solution, topology=None):
+        """Keep "partial_points", "residual" and "reason" of an interrupted solve
+        and the topology of its mesh"""
+        self.entries[key] = {
+            "partial_points": solution["partial_points"],
+            "residual": solution["residual"],
+            "reason": solution["reason"],
+            "topology": topology,
+        }
+
+    def get(self, key):
+        """Partial result of key, None if there is none"""
+        return self.entries.get(key)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# Interrupted solves of the solve operators, key is the object name
+PARTIAL_RESULTS = PartialResults()
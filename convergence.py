@@ -0,0 +1,91 @@
+# Convergence history of the solves, see Solver.solve(history=True)
+#
+# One row per Newton step of each component, in a float array of the
+# columns of COLUMNS :
+# - component: index of the component in the solve "components" reports
+# - iteration: number of jacobian evaluations when the step was done
+# - residual_norm: norm of the equations values after the step, the first row
+# of a component is the start of its solve (no step)
+# - step_norm: norm of the step
+# - damping: of Levenberg-Marquardt, 0 for the other methods
+# - worst_equation: index of the equation with the biggest residual
+# - accepted: 1 if the values of the step are kept, 0 if the step is rejected
+# (Levenberg-Marquardt or Broyden backtracking) or failed
+# residual_norm is nan and worst_equation -1 when the equations could not be
+# evaluated after the step.
+
+import csv
+import json
+import math
+
+import numpy
+
+COLUMNS = (
+    "component",
+    "iteration",
+    "residual_norm",
+    "step_norm",
+    "damping",
+    "worst_equation",
+    "accepted",
+)
+COMPONENT = COLUMNS.index("component")
+WORST_EQUATION = COLUMNS.index("worst_equation")
+# Columns exported as integers
+INTEGER_COLUMNS = ("component", "iteration", "worst_equation", "accepted")
+
+
+def as_array(rows):
+    """History array of a list of rows"""
+    return numpy.array(rows, dtype=float).reshape(-1, len(COLUMNS))
+
+
+def remap(history, indices):
+    """Copy of history with its equations renumbered, equation i being indices[i]"""
+    history = history.copy()
+    worst = history[:, WORST_EQUATION].astype(int)
+    known = worst >= 0
+    history[known, WORST_EQUATION] = numpy.asarray(indices)[worst[known]]
+    return history
+
+
+def concatenate(histories):
+    return numpy.concatenate([as_array([])] + list(histories))
+
+
+def rows(history, constraints=None):
+    """History as lists of python values.
+    - constraints: dict equation index -> constraint, adds the constraint
+    of the worst equation to each row"""
+    integers = [column in INTEGER_COLUMNS for column in COLUMNS]
+    result = []
+    for values in history.tolist():
+        row = [
+            int(value) if integer else value
+            for value, integer in zip(values, integers)
+        ]
+        if constraints is not None:
+            row.append(constraints.get(row[WORST_EQUATION]))
+        result.append(row)
+    return result
+
+
+def _columns(constraints):
+    return list(COLUMNS) + (["worst_constraint"] if constraints is not None else [])
+
+
+def to_csv(history, file, constraints=None):
+    """Write history in CSV to file, a text file object, see rows for constraints"""
+    writer = csv.writer(file)
+    writer.writerow(_columns(constraints))
+    writer.writerows(rows(history, constraints))
+
+
+def to_json(history, constraints=None):
+    """History as a JSON string {"columns": [...], "rows": [[...], ...]},
+    nan written as null, see rows for constraints"""
+    data = [
+        [None if isinstance(v, float) and math.isnan(v) else v for v in row]
+        for row in rows(history, constraints)
+    ]
+    return json.dumps({"columns": _columns(constraints), "rows": data}, default=str)
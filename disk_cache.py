@@ -0,0 +1,158 @@
+# Persistent cache of the structure of the equations systems
+#
+# Splitting the equations in components, the presolve and the jacobian structure
+# of each system only depend on the structure of the equations (kinds, points,
+# axes, see Solver.structure), not on their values nor on the coordinates.
+# They are stored on disk (Solver.dump_structure) in a file named by a hash of
+# this structure, so solving the same constraints again, after reopening a blend
+# file for example, skips them (Solver.load_structure).
+# Files are stamped with a hash of the modules building the structure,
+# an update of the addon invalidates them. The least recently used files are
+# removed when the cache is over its size.
+#
+# Kernels are plain python, there is nothing compiled to store.
+
+import hashlib
+import os
+import pickle
+
+from . import log
+
+# Directory of the cache if MESH_CONSTRAINTS_CACHE is not set
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "mesh_constraints")
+# Maximum size of the cache files, in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Change it when the content of the files changes
+FORMAT_VERSION = 1
+EXTENSION = ".structure"
+# Modules building the cached structure
+SOURCES = ("solver.py", "graph.py", "kernels.py")
+
+
+def default_directory():
+    """Cache directory, from MESH_CONSTRAINTS_CACHE or DEFAULT_DIRECTORY"""
+    return os.environ.get("MESH_CONSTRAINTS_CACHE", DEFAULT_DIRECTORY)
+
+
+def source_stamp():
+    """Hash of FORMAT_VERSION and of the source of the modules building
+    the structure"""
+    h = hashlib.sha256(str(FORMAT_VERSION).encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCES:
+        with open(os.path.join(directory, name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class StructureCache:
+    """Files of Solver.dump_structure, named by the hash of the structure"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory if directory is not None else default_directory()
+        self.max_bytes = max_bytes
+        # Computed on first use
+        self._stamp = None
+
+    @property
+    def stamp(self):
+        if self._stamp is None:
+            self._stamp = source_stamp()
+        return self._stamp
+
+    def path(self, solver):
+        """Path of the file of the structure of solver"""
+        key = hashlib.sha256(repr((self.stamp, solver.structure())).encode())
+        return os.path.join(self.directory, key.hexdigest() + EXTENSION)
+
+    def load(self, solver):
+        """Load the stored structure of solver in it,
+        return False if there is none"""
+        path = self.path(solver)
+        try:
+            with open(path, "rb") as f:
+                stamp, structure = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            # Broken file, a crash while writing it ?
+            log.logger().debug(f"{path}: {e}")
+            self._remove(path)
+            return False
+        if stamp != self.stamp:
+            self._remove(path)
+            return False
+        solver.load_structure(structure)
+        self._touch(path)
+        return True
+
+    def store(self, solver):
+        """Store the structure of solver, solved"""
+        path = self.path(solver)
+        if os.path.exists(path):
+            self._touch(path)
+            return
+        # Written aside and renamed, a file is complete or not there
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "wb") as f:
+                pickle.dump(
+                    (self.stamp, solver.dump_structure()),
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp, path)
+        except OSError as e:
+            # Only a cache, the solve is done anyway
+            log.logger().debug(f"{path}: {e}")
+            self._remove(tmp)
+            return
+        self._evict()
+
+    def clear(self):
+        for path, _, _ in self._files():
+            self._remove(path)
+
+    def _files(self):
+        """List of (path, size, last use) of the cache files"""
+        if not os.path.isdir(self.directory):
+            return []
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _evict(self):
+        """Remove least recently used files while over max_bytes"""
+        files = sorted(self._files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _touch(self, path):
+        """Mark path as recently used"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Cache used by the solve operator
+STRUCTURES = StructureCache()
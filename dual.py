@@ -0,0 +1,140 @@
+# Forward mode automatic differentiation with dual numbers
+#
+# A Dual is a value with its gradient relative to the variables of an equation.
+# A residual written with the usual operators and the functions of this module
+# (sqrt, cos...) gives its exact gradient in the same evaluation : no hand written
+# derivatives and no sympy at runtime.
+# The value is a float, or an array of shape (n,) to evaluate n equations at once,
+# the gradient is then an array of shape (n, number of variables).
+
+import math
+import numpy
+
+
+class Dual:
+    __slots__ = ("value", "gradient")
+
+    def __init__(self, value, gradient):
+        self.value = value
+        self.gradient = gradient
+
+    def __repr__(self):
+        return f"Dual({self.value}, {self.gradient})"
+
+    def __neg__(self):
+        return Dual(-self.value, -self.gradient)
+
+    def __pos__(self):
+        return self
+
+    def __add__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.value + other.value, self.gradient + other.gradient)
+        return Dual(self.value + other, self.gradient)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.value - other.value, self.gradient - other.gradient)
+        return Dual(self.value - other, self.gradient)
+
+    def __rsub__(self, other):
+        return Dual(other - self.value, -self.gradient)
+
+    def __mul__(self, other):
+        if isinstance(other, Dual):
+            return Dual(
+                self.value * other.value,
+                _scale(self.gradient, other.value) + _scale(other.gradient, self.value),
+            )
+        return Dual(self.value * other, _scale(self.gradient, other))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if isinstance(other, Dual):
+            value = self.value / other.value
+            return Dual(
+                value,
+                _scale(self.gradient - _scale(other.gradient, value), 1 / other.value),
+            )
+        return Dual(self.value / other, _scale(self.gradient, 1 / other))
+
+    def __rtruediv__(self, other):
+        value = other / self.value
+        return Dual(value, _scale(self.gradient, -value / self.value))
+
+    def __pow__(self, exponent):
+        if isinstance(exponent, Dual):
+            raise Exception("Only constant exponents are supported")
+        return _chain(
+            self,
+            self.value**exponent,
+            exponent * self.value ** (exponent - 1),
+        )
+
+
+def _scale(gradient, factor):
+    """gradient * factor, factor being one value per equation"""
+    if numpy.ndim(factor) > 0:
+        return gradient * factor[:, None]
+    return gradient * factor
+
+
+def _chain(x, value, derivative):
+    """f(x) from value = f(x.value) and derivative = f'(x.value)"""
+    return Dual(value, _scale(x.gradient, derivative))
+
+
+def variables(q):
+    """Duals of the values q of the variables, each with its own unit gradient.
+    q is a list of floats, or an array of shape (n, number of variables)
+    for n equations"""
+    q = numpy.asarray(q, dtype=float)
+    nb_variables = q.shape[-1]
+    duals = []
+    for i in range(nb_variables):
+        gradient = numpy.zeros(q.shape)
+        gradient[..., i] = 1.0
+        duals.append(Dual(q[..., i] if q.ndim > 1 else float(q[i]), gradient))
+    return duals
+
+
+def value_and_gradient(result, q):
+    """Value and gradient of result, computed from variables(q),
+    a constant result has a zero gradient"""
+    if isinstance(result, Dual):
+        return result.value, result.gradient
+    q = numpy.asarray(q, dtype=float)
+    return numpy.broadcast_to(result, q.shape[:-1]) + 0.0, numpy.zeros(q.shape)
+
+
+# Functions for floats, arrays and Dual
+
+
+def sqrt(x):
+    if isinstance(x, Dual):
+        value = numpy.sqrt(x.value)
+        return _chain(x, value, 0.5 / value)
+    return numpy.sqrt(x) if numpy.ndim(x) > 0 else math.sqrt(x)
+
+
+def cos(x):
+    if isinstance(x, Dual):
+        return _chain(x, numpy.cos(x.value), -numpy.sin(x.value))
+    return numpy.cos(x) if numpy.ndim(x) > 0 else math.cos(x)
+
+
+def sin(x):
+    if isinstance(x, Dual):
+        return _chain(x, numpy.sin(x.value), numpy.cos(x.value))
+    return numpy.sin(x) if numpy.ndim(x) > 0 else math.sin(x)
+
+
+def acos(x):
+    if isinstance(x, Dual):
+        return _chain(
+            x, numpy.arccos(x.value), -1 / numpy.sqrt(1 - x.value * x.value)
+        )
+    return numpy.arccos(x) if numpy.ndim(x) > 0 else math.acos(x)
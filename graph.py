@@ -0,0 +1,381 @@
+# Structural analysis of the equations system
+#
+# The system is seen as a bipartite graph : equations on one side,
+# variables on the other, and an edge when a variable appears in an equation.
+# Everything here works on indices only, no sympy involved.
+
+
+class DisjointSet:
+    """Union-find on integers 0..size-1, with path compression and union by size"""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1 for _ in range(size)]
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        """Merge sets of i and j, return the root of the merged set"""
+        ri = self.find(i)
+        rj = self.find(j)
+        if ri == rj:
+            return ri
+        if self.size[ri] < self.size[rj]:
+            ri, rj = rj, ri
+        self.parent[rj] = ri
+        self.size[ri] += self.size[rj]
+        return ri
+
+
+class AffineDisjointSet:
+    """Union-find of variables (any hashable) linked by affine relations :
+    each variable is v = scale * root + offset, and a root can be bound
+    to a constant value"""
+
+    def __init__(self):
+        # v -> (parent, scale, offset) with v = scale * parent + offset
+        self.parent = {}
+        self.size = {}
+        # root -> value
+        self.constants = {}
+
+    def find(self, v):
+        """Return (root, scale, offset) with v = scale * root + offset"""
+        path = []
+        root = v
+        while root in self.parent:
+            path.append(root)
+            root = self.parent[root][0]
+        # Path compression, from the root side
+        scale, offset = 1.0, 0.0
+        for node in reversed(path):
+            _, s, o = self.parent[node]
+            scale, offset = s * scale, s * offset + o
+            self.parent[node] = (root, scale, offset)
+        if len(path) == 0:
+            return v, 1.0, 0.0
+        _, scale, offset = self.parent[v]
+        return root, scale, offset
+
+    def bind(self, v, value):
+        """Bind v to value, return False if its root is already bound"""
+        root, scale, offset = self.find(v)
+        if root in self.constants:
+            return False
+        self.constants[root] = (value - offset) / scale
+        return True
+
+    def union(self, u, v, scale=1.0, offset=0.0):
+        """Link u = scale * v + offset, return False if u and v are already
+        linked or both bound to a constant"""
+        ru, su, ou = self.find(u)
+        rv, sv, ov = self.find(v)
+        if ru == rv or (ru in self.constants and rv in self.constants):
+            return False
+        # su * ru + ou = scale * (sv * rv + ov) + offset
+        # so ru = a * rv + b
+        a = scale * sv / su
+        b = (scale * ov + offset - ou) / su
+        if self.size.get(ru, 1) > self.size.get(rv, 1):
+            # Attach the smallest tree : rv = (ru - b) / a
+            ru, rv, a, b = rv, ru, 1 / a, -b / a
+        self.parent[ru] = (rv, a, b)
+        self.size[rv] = self.size.get(rv, 1) + self.size.get(ru, 1)
+        if ru in self.constants:
+            self.constants[rv] = (self.constants.pop(ru) - b) / a
+        return True
+
+    def value(self, v):
+        """Constant value of v, None if not bound"""
+        root, scale, offset = self.find(v)
+        if root not in self.constants:
+            return None
+        return scale * self.constants[root] + offset
+
+
+def connected_components(equations_variables):
+    """Split the equations system in independent parts
+    - equations_variables: list, for each equation, of the variables it uses
+    (any hashable)
+    Return a list of components, each component is the sorted list of its
+    equations indices. Components are in the order of their first equation"""
+    nb_equations = len(equations_variables)
+    ds = DisjointSet(nb_equations)
+    # variable -> first equation seen using it
+    variables_equation = {}
+    for i, variables in enumerate(equations_variables):
+        for variable in variables:
+            if variable in variables_equation:
+                ds.union(i, variables_equation[variable])
+            else:
+                variables_equation[variable] = i
+
+    components = {}
+    for i in range(nb_equations):
+        components.setdefault(ds.find(i), []).append(i)
+    return list(components.values())
+
+
+def _index_variables(equations_variables):
+    """Number variables, return (variables, adjacency) with variables the list of
+    the variables and adjacency, for each equation, the list of its variables indices"""
+    variables_index = {}
+    variables = []
+    adjacency = []
+    for equation_variables in equations_variables:
+        columns = []
+        for variable in equation_variables:
+            if variable not in variables_index:
+                variables_index[variable] = len(variables)
+                variables.append(variable)
+            columns.append(variables_index[variable])
+        adjacency.append(columns)
+    return variables, adjacency
+
+
+def maximum_matching(adjacency, nb_columns):
+    """Maximum matching of the bipartite graph rows/columns (Hopcroft-Karp)
+    - adjacency: for each row, the list of its columns
+    Return (match_row, match_col), the matched column of each row and the
+    matched row of each column, -1 if unmatched"""
+    nb_rows = len(adjacency)
+    match_row = [-1] * nb_rows
+    match_col = [-1] * nb_columns
+    infinity = nb_rows + 1
+
+    # Greedy first pass, most of the job on mesh like systems
+    for r in range(nb_rows):
+        for c in adjacency[r]:
+            if match_col[c] == -1:
+                match_row[r] = c
+                match_col[c] = r
+                break
+
+    while True:
+        # BFS : layers of rows from free rows along alternating paths
+        dist = [infinity] * nb_rows
+        queue = [r for r in range(nb_rows) if match_row[r] == -1]
+        for r in queue:
+            dist[r] = 0
+        found = False
+        head = 0
+        while head < len(queue):
+            r = queue[head]
+            head += 1
+            for c in adjacency[r]:
+                r2 = match_col[c]
+                if r2 == -1:
+                    found = True
+                elif dist[r2] == infinity:
+                    dist[r2] = dist[r] + 1
+                    queue.append(r2)
+        if not found:
+            break
+
+        # DFS : vertex disjoint shortest augmenting paths, following the layers
+        position = [0] * nb_rows
+        for root in range(nb_rows):
+            if match_row[root] != -1:
+                continue
+            stack = [root]
+            # path_cols[k] is the column used to leave stack[k]
+            path_cols = []
+            while stack:
+                r = stack[-1]
+                advanced = False
+                while position[r] < len(adjacency[r]):
+                    c = adjacency[r][position[r]]
+                    position[r] += 1
+                    r2 = match_col[c]
+                    if r2 == -1:
+                        # Augment along the path
+                        path_cols.append(c)
+                        for rr, cc in zip(stack, path_cols):
+                            match_row[rr] = cc
+                            match_col[cc] = rr
+                        stack = []
+                        advanced = True
+                        break
+                    if dist[r2] == dist[r] + 1:
+                        path_cols.append(c)
+                        stack.append(r2)
+                        advanced = True
+                        break
+                if not advanced:
+                    # Dead end, never try this row again in this phase
+                    dist[r] = infinity
+                    stack.pop()
+                    if path_cols:
+                        path_cols.pop()
+
+    return match_row, match_col
+
+
+def strongly_connected_components(successors):
+    """Strongly connected components of a directed graph (Tarjan, iterative)
+    - successors: for each node, the list of its successors
+    Return the list of components, a successor component always comes before
+    its predecessors"""
+    nb_nodes = len(successors)
+    index = [-1] * nb_nodes
+    lowlink = [0] * nb_nodes
+    on_stack = [False] * nb_nodes
+    stack = []
+    components = []
+    counter = 0
+    for start in range(nb_nodes):
+        if index[start] != -1:
+            continue
+        # (node, position in its successors)
+        work = [(start, 0)]
+        while work:
+            node, position = work.pop()
+            if position == 0:
+                index[node] = counter
+                lowlink[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            recurse = False
+            while position < len(successors[node]):
+                successor = successors[node][position]
+                position += 1
+                if index[successor] == -1:
+                    work.append((node, position))
+                    work.append((successor, 0))
+                    recurse = True
+                    break
+                elif on_stack[successor]:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            if recurse:
+                continue
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    n = stack.pop()
+                    on_stack[n] = False
+                    component.append(n)
+                    if n == node:
+                        break
+                components.append(component)
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+    return components
+
+
+def dulmage_mendelsohn(equations_variables):
+    """Dulmage-Mendelsohn decomposition of the equations system
+    - equations_variables: list, for each equation, of the variables it uses
+    (any hashable)
+    Return a dict with
+    - "over": (equations, variables) of the over-determined part
+    - "blocks": list of (equations, variables) of the square blocks
+    - "under": (equations, variables) of the under-determined part
+    equations are indices in equations_variables.
+
+    The system can be solved in this order : over-determined part, blocks
+    one after the other (a block only uses variables of the over-determined part
+    and of the previous blocks) then the under-determined part"""
+    variables, adjacency = _index_variables(equations_variables)
+    nb_rows = len(adjacency)
+    nb_columns = len(variables)
+    match_row, match_col = maximum_matching(adjacency, nb_columns)
+
+    # Over-determined : reachable from unmatched equations
+    # equation -> its variables -> their matched equations
+    over_rows = set(r for r in range(nb_rows) if match_row[r] == -1)
+    over_cols = set()
+    queue = list(over_rows)
+    while queue:
+        r = queue.pop()
+        for c in adjacency[r]:
+            if c in over_cols:
+                continue
+            over_cols.add(c)
+            r2 = match_col[c]
+            if r2 != -1 and r2 not in over_rows:
+                over_rows.add(r2)
+                queue.append(r2)
+
+    # Under-determined : reachable from unmatched variables
+    # variable -> equations using it -> their matched variables
+    columns_rows = [[] for _ in range(nb_columns)]
+    for r in range(nb_rows):
+        for c in adjacency[r]:
+            columns_rows[c].append(r)
+    under_cols = set(c for c in range(nb_columns) if match_col[c] == -1)
+    under_rows = set()
+    queue = list(under_cols)
+    while queue:
+        c = queue.pop()
+        for r in columns_rows[c]:
+            if r in under_rows:
+                continue
+            under_rows.add(r)
+            c2 = match_row[r]
+            if c2 != -1 and c2 not in under_cols:
+                under_cols.add(c2)
+                queue.append(c2)
+
+    # Square part : everything else, perfectly matched
+    square_rows = [
+        r for r in range(nb_rows) if r not in over_rows and r not in under_rows
+    ]
+    square_position = {r: i for i, r in enumerate(square_rows)}
+    # An equation depends on the equations matched with its variables
+    successors = []
+    for r in square_rows:
+        successors.append(
+            [
+                square_position[match_col[c]]
+                for c in adjacency[r]
+                if match_col[c] in square_position and match_col[c] != r
+            ]
+        )
+    blocks = []
+    for component in strongly_connected_components(successors):
+        rows = sorted(square_rows[i] for i in component)
+        blocks.append((rows, [variables[match_row[r]] for r in rows]))
+
+    return {
+        "over": (sorted(over_rows), [variables[c] for c in sorted(over_cols)]),
+        "blocks": blocks,
+        "under": (sorted(under_rows), [variables[c] for c in sorted(under_cols)]),
+    }
+
+
+def reverse_cuthill_mckee(adjacency):
+    """Reverse Cuthill-McKee ordering of an undirected graph, nodes linked
+    together end up close in the order, so the bandwidth of its matrix is small
+    - adjacency: for each node, the list of its neighbours
+    Return the list of the nodes in their new order"""
+    nb_nodes = len(adjacency)
+    degree = [len(neighbours) for neighbours in adjacency]
+    visited = [False] * nb_nodes
+    order = []
+    # Breadth first from a node of lowest degree, for each connected part
+    for start in sorted(range(nb_nodes), key=degree.__getitem__):
+        if visited[start]:
+            continue
+        visited[start] = True
+        head = len(order)
+        order.append(start)
+        while head < len(order):
+            node = order[head]
+            head += 1
+            neighbours = [n for n in adjacency[node] if not visited[n]]
+            neighbours.sort(key=degree.__getitem__)
+            for n in neighbours:
+                if not visited[n]:
+                    visited[n] = True
+                    order.append(n)
+    order.reverse()
+    return order
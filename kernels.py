@@ -0,0 +1,280 @@
+# Closed form residual and gradient of each kind of equation
+#
+# An equation record is (kind, points, axis, value), see solver.py.
+# Its variables are (point, axis) couples, only the coordinates it really uses :
+# - fix : p0[axis]
+# - equal : p0[axis], p1[axis]
+# - distance : p0 xyz, p1 xyz
+# - others : p0 xyz, p1 xyz, p2 xyz, p3 xyz
+# Kernels are batched : they evaluate all the equations of a kind at once from
+# the values q of their variables, in this order, see BATCH_KERNELS.
+# No sympy here, only numpy arrays.
+#
+# The residual of each kind is also written once for any arithmetic (RESIDUALS) :
+# with sympy for the symbolic equations (solver.build_equation), with dual numbers
+# for the kinds without hand written kernels (register_kind).
+
+import math
+import numpy
+
+from . import dual
+
+# Kinds of equations, a constraint is made of one or more equations
+# p0, p1... are the points of the equation record
+# p0.x - p1.x for axis 0
+EQUATION_EQUAL = "equal"
+# p0.x - value for axis 0
+EQUATION_FIX = "fix"
+# |p0-p1| - value
+EQUATION_DISTANCE = "distance"
+# |p0-p1| - |p2-p3|
+EQUATION_SAME_DISTANCE = "same_distance"
+# (p1-p0) x (p3-p2), component axis
+EQUATION_PARALLEL = "parallel"
+# (p1-p0) . (p3-p2)
+EQUATION_PERPENDICULAR = "perpendicular"
+# (p1-p0) . (p3-p2) / (|p1-p0| * |p3-p2|) - cos(value), value in degrees
+EQUATION_ANGLE = "angle"
+
+
+def equation_points_variables(record):
+    """Variables of the equation, in the order of the kernel q,
+    a variable can be there more than once if a point is used twice"""
+    kind, points, axis, value = record
+    if kind == EQUATION_FIX:
+        return [(points[0], axis)]
+    if kind == EQUATION_EQUAL:
+        return [(points[0], axis), (points[1], axis)]
+    return [(p, a) for p in points for a in range(3)]
+
+
+def equation_variables(record):
+    """Variables of the equation, without duplicates"""
+    return list(dict.fromkeys(equation_points_variables(record)))
+
+
+# Residuals, params is the list of the (x, y, z) of each point of the equation,
+# f a module with sqrt and cos (sympy or dual)
+
+
+def _equal_residual(params, axis, value, f):
+    return params[0][axis] - params[1][axis]
+
+
+def _fix_residual(params, axis, value, f):
+    return params[0][axis] - value
+
+
+def _length(f, x, y, z):
+    return f.sqrt(x * x + y * y + z * z)
+
+
+def _distance_residual(params, axis, value, f):
+    (x0, y0, z0), (x1, y1, z1) = params[0], params[1]
+    return _length(f, x0 - x1, y0 - y1, z0 - z1) - value
+
+
+def _same_distance_residual(params, axis, value, f):
+    (x0, y0, z0), (x1, y1, z1), (x2, y2, z2), (x3, y3, z3) = params
+    return _length(f, x0 - x1, y0 - y1, z0 - z1) - _length(f, x2 - x3, y2 - y3, z2 - z3)
+
+
+def _vectors_residual(params):
+    """v0 = p1 - p0 and v1 = p3 - p2"""
+    v0 = [params[1][i] - params[0][i] for i in range(3)]
+    v1 = [params[3][i] - params[2][i] for i in range(3)]
+    return v0, v1
+
+
+def _parallel_residual(params, axis, value, f):
+    v0, v1 = _vectors_residual(params)
+    # Component axis of the cross product of v0 and v1
+    i = (axis + 1) % 3
+    j = (axis + 2) % 3
+    return v0[i] * v1[j] - v0[j] * v1[i]
+
+
+def _perpendicular_residual(params, axis, value, f):
+    v0, v1 = _vectors_residual(params)
+    return v0[0] * v1[0] + v0[1] * v1[1] + v0[2] * v1[2]
+
+
+def _angle_residual(params, axis, value, f):
+    v0, v1 = _vectors_residual(params)
+    # dot product of v0 and v1 / (v0.length * v1.length) = cos(angle in radian)
+    dot_product = v0[0] * v1[0] + v0[1] * v1[1] + v0[2] * v1[2]
+    lengths = _length(f, *v0) * _length(f, *v1)
+    return dot_product / lengths - f.cos(value * math.pi / 180)
+
+
+RESIDUALS = {
+    EQUATION_EQUAL: _equal_residual,
+    EQUATION_FIX: _fix_residual,
+    EQUATION_DISTANCE: _distance_residual,
+    EQUATION_SAME_DISTANCE: _same_distance_residual,
+    EQUATION_PARALLEL: _parallel_residual,
+    EQUATION_PERPENDICULAR: _perpendicular_residual,
+    EQUATION_ANGLE: _angle_residual,
+}
+
+
+def _residual_params(q):
+    """params of a residual from the q of its kernel.
+    One axis kinds (fix, equal) only read their axis, so their q values
+    are given for the 3 axes"""
+    if len(q) < 3:
+        return [(v, v, v) for v in q]
+    return [tuple(q[3 * k : 3 * k + 3]) for k in range(len(q) // 3)]
+
+
+def dual_kernel(residual):
+    """Kernel of a residual, gradient by automatic differentiation"""
+
+    def kernel(q, axis, value):
+        params = _residual_params(dual.variables(q))
+        r, gradient = dual.value_and_gradient(residual(params, axis, value, dual), q)
+        return float(r), gradient.tolist()
+
+    return kernel
+
+
+def dual_batch_kernel(residual, vectorize=True):
+    """Batched kernel of a residual, gradients by automatic differentiation.
+    If vectorize, the residual is evaluated once for all the equations
+    with the same axis, else once per equation"""
+    kernel = dual_kernel(residual)
+
+    def batch_kernel(q, axes, values):
+        residuals = numpy.empty(len(q))
+        gradients = numpy.empty(q.shape)
+        if not vectorize:
+            for n in range(len(q)):
+                residuals[n], gradients[n] = kernel(q[n], int(axes[n]), values[n])
+            return residuals, gradients
+        for axis in numpy.unique(axes):
+            rows = axes == axis
+            q_rows = q[rows]
+            params = _residual_params(dual.variables(q_rows))
+            residuals[rows], gradients[rows] = dual.value_and_gradient(
+                residual(params, int(axis), values[rows], dual), q_rows
+            )
+        return residuals, gradients
+
+    return batch_kernel
+
+
+def register_kind(kind, residual, vectorize=True):
+    """Add a kind of equation from its residual(params, axis, value, f), written
+    with the operators and the f functions (sqrt, cos, sin, acos) : its gradient
+    is computed by automatic differentiation (dual.py) and its sympy equation
+    is built with f = sympy. Its variables are the xyz of all its points.
+    - vectorize: evaluate the residual once for all the equations of the kind,
+    the residual has then arrays for values and params
+    Register it at import, before any solve, worker processes need it too"""
+    if kind in RESIDUALS:
+        raise Exception(f"Kind of equation {kind} is already registered")
+    RESIDUALS[kind] = residual
+    BATCH_KERNELS[kind] = dual_batch_kernel(residual, vectorize)
+
+
+# Batched kernels, for all the equations of a same kind at once
+# q is an array of shape (n, len(q)) of the values of the n equations variables,
+# axes and values are arrays of shape (n,). They return residuals of shape (n,)
+# and gradients of shape (n, len(q)), each row in the order of its q.
+
+
+def _batch_equal(q, axes, values):
+    gradient = numpy.empty((len(q), 2))
+    gradient[:, 0] = 1.0
+    gradient[:, 1] = -1.0
+    return q[:, 0] - q[:, 1], gradient
+
+
+def _batch_fix(q, axes, values):
+    return q[:, 0] - values, numpy.ones((len(q), 1))
+
+
+def _batch_length(d):
+    return numpy.sqrt(numpy.einsum("ij,ij->i", d, d))
+
+
+def _batch_distance(q, axes, values):
+    d = q[:, 0:3] - q[:, 3:6]
+    length = _batch_length(d)
+    g = d / length[:, None]
+    return length - values, numpy.hstack((g, -g))
+
+
+def _batch_same_distance(q, axes, values):
+    d0 = q[:, 0:3] - q[:, 3:6]
+    d1 = q[:, 6:9] - q[:, 9:12]
+    l0 = _batch_length(d0)
+    l1 = _batch_length(d1)
+    g0 = d0 / l0[:, None]
+    g1 = d1 / l1[:, None]
+    return l0 - l1, numpy.hstack((g0, -g0, -g1, g1))
+
+
+def _batch_vectors(q):
+    """v0 = p1 - p0 and v1 = p3 - p2"""
+    return q[:, 3:6] - q[:, 0:3], q[:, 9:12] - q[:, 6:9]
+
+
+def _batch_vectors_gradient(g0, g1):
+    """Gradient on the 4 points from gradients on v0 and v1"""
+    return numpy.hstack((-g0, g0, -g1, g1))
+
+
+def _batch_parallel(q, axes, values):
+    v0, v1 = _batch_vectors(q)
+    # Component axis of the cross product v0 x v1
+    n = numpy.arange(len(q))
+    i = (axes + 1) % 3
+    j = (axes + 2) % 3
+    v0i, v0j = v0[n, i], v0[n, j]
+    v1i, v1j = v1[n, i], v1[n, j]
+    g0 = numpy.zeros((len(q), 3))
+    g1 = numpy.zeros((len(q), 3))
+    g0[n, i] = v1j
+    g0[n, j] = -v1i
+    g1[n, j] = v0i
+    g1[n, i] = -v0j
+    return v0i * v1j - v0j * v1i, _batch_vectors_gradient(g0, g1)
+
+
+def _batch_perpendicular(q, axes, values):
+    v0, v1 = _batch_vectors(q)
+    return numpy.einsum("ij,ij->i", v0, v1), _batch_vectors_gradient(v1, v0)
+
+
+def _batch_angle(q, axes, values):
+    v0, v1 = _batch_vectors(q)
+    dot = numpy.einsum("ij,ij->i", v0, v1)
+    l0 = _batch_length(v0)
+    l1 = _batch_length(v1)
+    l01 = (l0 * l1)[:, None]
+    cos_angle = dot / (l0 * l1)
+    g0 = v1 / l01 - cos_angle[:, None] * v0 / (l0 * l0)[:, None]
+    g1 = v0 / l01 - cos_angle[:, None] * v1 / (l1 * l1)[:, None]
+    residuals = cos_angle - numpy.cos(values * math.pi / 180)
+    return residuals, _batch_vectors_gradient(g0, g1)
+
+
+BATCH_KERNELS = {
+    EQUATION_EQUAL: _batch_equal,
+    EQUATION_FIX: _batch_fix,
+    EQUATION_DISTANCE: _batch_distance,
+    EQUATION_SAME_DISTANCE: _batch_same_distance,
+    EQUATION_PARALLEL: _batch_parallel,
+    EQUATION_PERPENDICULAR: _batch_perpendicular,
+    EQUATION_ANGLE: _batch_angle,
+}
+
+
+def batch_residual_and_gradient(kind, q, axes, values):
+    """Residuals and gradients of n equations of the same kind, see above.
+    A division by zero raises (FloatingPointError)"""
+    if kind not in BATCH_KERNELS:
+        raise Exception(f"Unknown kind of equation {kind}")
+    with numpy.errstate(divide="raise", invalid="raise", over="raise"):
+        return BATCH_KERNELS[kind](q, axes, values)
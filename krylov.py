@@ -0,0 +1,308 @@
+# Matrix free least squares steps, for the meshes too big for a * a.transpose()
+#
+# For the biggest meshes a * a.transpose() and its factorization do not fit in
+# memory. Conjugate gradients on the normal equations (CGLS, same iterates as
+# LSQR) only need products by a and a.transpose(), the jacobian is kept as its
+# non zero terms. Started from 0, they give the minimum norm least squares step
+# x = a.transpose() * z, like the direct backends, even with redundant equations.
+#
+# Preconditioners M ~ a * a.transpose() = L * L.transpose() on the equations :
+# the least squares are solved for L^-1 * a and L^-1 * b, same steps when the
+# equations are compatible, only a different weighting of the residual otherwise.
+# The damping of Levenberg-Marquardt is sqrt(damping) * identity added to the
+# columns of a, the equations are then always compatible.
+# - jacobi : the diagonal of a * a.transpose(), the squared norms of the rows.
+# Too weak for ill conditioned meshes (long chains, big grids), the
+# iterations stop at MAX_ITERATIONS far from the forcing term
+# - incomplete cholesky : exact Cholesky of the block tridiagonal part of
+# a * a.transpose(), equations ordered by reverse Cuthill-McKee (see rank.py),
+# the dropped terms added to the diagonal so it stays positive.
+# Blocks are dense, factorized and applied with numpy. Less iterations than
+# jacobi, but each one is slower, applying it is a loop on the blocks.
+#
+# Inexact Newton : the conjugate gradients stop at a relative residual
+# (forcing term) following the convergence of the Newton iterations
+# (Eisenstat-Walker), loose far from the solution and tight near it.
+
+import numpy
+
+from .rank import band_order, gram_terms
+
+PRECONDITIONER_JACOBI = "jacobi"
+PRECONDITIONER_INCOMPLETE_CHOLESKY = "incomplete_cholesky"
+# Size of the dense blocks of the incomplete cholesky
+BLOCK_SIZE = 128
+# Biggest forcing term, the accuracy of the first steps : a smaller one gives
+# more accurate steps, more conjugate gradient iterations for each
+MAX_FORCING_TERM = 0.1
+# Smallest forcing term, under it the rounding errors dominate
+MIN_FORCING_TERM = 1e-12
+MAX_ITERATIONS = 1000
+# Relative residual of the normal equations stopping the iterations when the
+# equations are incompatible. Not the forcing term : this residual is under
+# it long before the step is accurate on ill conditioned meshes
+INCOMPATIBLE_TOLERANCE = 1e-6
+# Relative increase of the diagonal of the incomplete cholesky : redundant
+# equations make a * a.transpose() singular, their residual is not to be weighted
+# by the inverse of its tiny eigenvalues
+CHOLESKY_SHIFT = 1e-3
+# Diagonal shift of a block without a cholesky (zero rows), relative to its
+# biggest diagonal term, multiplied by 100 until it has one
+BLOCK_SHIFT = 1e-10
+
+
+class Jacobian:
+    """Sparse matrix as its non zero terms, only for products"""
+
+    def __init__(self, rows, cols, nonzero):
+        self.shape = (rows, cols)
+        if len(nonzero) > 0:
+            self.rows, self.cols = numpy.array(nonzero, dtype=int).T
+        else:
+            self.rows = self.cols = numpy.zeros(0, dtype=int)
+        self.values = numpy.zeros(len(nonzero))
+        # Order of the equations for the incomplete cholesky, only depends
+        # on the structure, see BlockCholesky
+        self.order = None
+
+    def dot(self, v):
+        """a * v"""
+        return numpy.bincount(
+            self.rows, weights=self.values * v[self.cols], minlength=self.shape[0]
+        )
+
+    def transpose_dot(self, w):
+        """a.transpose() * w"""
+        return numpy.bincount(
+            self.cols, weights=self.values * w[self.rows], minlength=self.shape[1]
+        )
+
+    def rows_norms(self):
+        """Squared norm of each row"""
+        return numpy.bincount(
+            self.rows, weights=self.values * self.values, minlength=self.shape[0]
+        )
+
+
+class NormalOperator:
+    """a * a.transpose() + damping * identity, never built"""
+
+    def __init__(self, a, damping=0.0):
+        self.a = a
+        self.damping = damping
+
+    def diagonal(self):
+        return self.a.rows_norms() + self.damping
+
+
+class Jacobi:
+    def __init__(self, operator):
+        diagonal = operator.diagonal()
+        # Zero rows are left as they are
+        self.inverse_sqrt = numpy.ones(len(diagonal))
+        nonzero = diagonal > 0
+        self.inverse_sqrt[nonzero] = 1 / numpy.sqrt(diagonal[nonzero])
+
+    def forward(self, r):
+        """L^-1 * r"""
+        return r * self.inverse_sqrt
+
+    def backward(self, r):
+        """L.transpose()^-1 * r"""
+        return r * self.inverse_sqrt
+
+
+class BlockCholesky:
+    """Incomplete Cholesky of the normal operator : the exact Cholesky of its
+    block tridiagonal part. Blocks are BLOCK_SIZE equations in the order
+    of a.order, the band order of a * a.transpose()"""
+
+    def __init__(self, operator):
+        a = operator.a
+        n = a.shape[0]
+        i, j, values = gram_terms(a.rows, a.cols, a.values)
+        if a.order is None:
+            a.order = band_order(i, j, n)
+        self.position = a.order
+        nb_blocks = max(1, -(-n // BLOCK_SIZE))
+
+        pi, pj = self.position[i], self.position[j]
+        high, low = numpy.maximum(pi, pj), numpy.minimum(pi, pj)
+        block_high, block_low = high // BLOCK_SIZE, low // BLOCK_SIZE
+        local_high, local_low = high % BLOCK_SIZE, low % BLOCK_SIZE
+        diagonal = numpy.zeros((nb_blocks, BLOCK_SIZE, BLOCK_SIZE))
+        below = numpy.zeros((nb_blocks, BLOCK_SIZE, BLOCK_SIZE))
+        inside = block_high == block_low
+        numpy.add.at(
+            diagonal,
+            (block_high[inside], local_high[inside], local_low[inside]),
+            values[inside],
+        )
+        off = inside & (local_high != local_low)
+        numpy.add.at(
+            diagonal,
+            (block_high[off], local_low[off], local_high[off]),
+            values[off],
+        )
+        next_block = block_high == block_low + 1
+        numpy.add.at(
+            below,
+            (block_high[next_block], local_high[next_block], local_low[next_block]),
+            values[next_block],
+        )
+        # Terms further from the diagonal are dropped, and added to their
+        # diagonals (absolute values) : the kept part stays positive
+        dropped = ~inside & ~next_block
+        for block, local in ((block_high, local_high), (block_low, local_low)):
+            numpy.add.at(
+                diagonal,
+                (block[dropped], local[dropped], local[dropped]),
+                numpy.abs(values[dropped]),
+            )
+        k = numpy.arange(BLOCK_SIZE)
+        diagonal[:, k, k] *= 1 + CHOLESKY_SHIFT
+        diagonal[:, k, k] += operator.damping
+        # Padding equations of the last block
+        padding = nb_blocks * BLOCK_SIZE - n
+        if padding > 0:
+            diagonal[-1, k[-padding:], k[-padding:]] = 1.0
+
+        # L[b] * L[b].transpose() = diagonal[b] - W[b] * W[b].transpose()
+        # with W[b] = below[b] * inverse(L[b - 1]).transpose(), L[b] stored
+        # as its inverse, W[b] in self.below
+        self.inverses = numpy.empty((nb_blocks, BLOCK_SIZE, BLOCK_SIZE))
+        self.below = numpy.zeros((nb_blocks, BLOCK_SIZE, BLOCK_SIZE))
+        for b in range(nb_blocks):
+            block = diagonal[b]
+            if b > 0:
+                w = below[b] @ self.inverses[b - 1].T
+                self.below[b] = w
+                block = block - w @ w.T
+            self.inverses[b] = numpy.linalg.inv(_cholesky(block))
+
+    def forward(self, r):
+        """L^-1 * r"""
+        ordered = numpy.zeros(self.inverses.shape[:2])
+        ordered.ravel()[self.position] = r
+        previous = numpy.zeros(BLOCK_SIZE)
+        for b in range(len(ordered)):
+            previous = self.inverses[b] @ (ordered[b] - self.below[b] @ previous)
+            ordered[b] = previous
+        return ordered.ravel()[self.position]
+
+    def backward(self, r):
+        """L.transpose()^-1 * r"""
+        ordered = numpy.zeros(self.inverses.shape[:2])
+        ordered.ravel()[self.position] = r
+        following = numpy.zeros(BLOCK_SIZE)
+        for b in range(len(ordered) - 1, -1, -1):
+            if b < len(ordered) - 1:
+                following = self.below[b + 1].T @ following
+            following = self.inverses[b].T @ (ordered[b] - following)
+            ordered[b] = following
+        return ordered.ravel()[self.position]
+
+
+def _cholesky(block):
+    """Cholesky factor of a block, shifted if it is singular"""
+    try:
+        return numpy.linalg.cholesky(block)
+    except numpy.linalg.LinAlgError:
+        pass
+    shift = BLOCK_SHIFT * max(float(numpy.max(numpy.diagonal(block))), 1.0)
+    identity = numpy.eye(len(block))
+    while True:
+        try:
+            return numpy.linalg.cholesky(block + shift * identity)
+        except numpy.linalg.LinAlgError:
+            shift *= 100
+
+
+PRECONDITIONERS = {
+    PRECONDITIONER_JACOBI: Jacobi,
+    PRECONDITIONER_INCOMPLETE_CHOLESKY: BlockCholesky,
+}
+
+
+def preconditioner(name, operator):
+    if name not in PRECONDITIONERS:
+        raise Exception(f"Unknown preconditioner '{name}'")
+    return PRECONDITIONERS[name](operator)
+
+
+def least_squares(operator, b, preconditioner, tolerance, max_iterations, check=None):
+    """Solve operator * z = b, operator being a * a.transpose() + damping, by
+    preconditioned conjugate gradients on the normal equations of the least
+    squares of [a, sqrt(damping) * identity] * x = b, x = a.transpose() * z.
+    Stop like LSQR, when the residual is under tolerance times its initial
+    value, or for incompatible equations when the normal equations residual
+    is under INCOMPATIBLE_TOLERANCE * |a| * residual.
+    check, if not None, is called at each iteration and can raise to stop.
+    Return z, the number of iterations and whether it stopped before
+    max_iterations"""
+    a, scale = operator.a, numpy.sqrt(operator.damping)
+    # Iterates are the variables of a and of the damping, the step z is
+    # kept with them, x = a.transpose() * L^-T * z
+    z = numpy.zeros(len(b))
+    r = preconditioner.forward(numpy.asarray(b, dtype=float))
+    u = preconditioner.backward(r)
+    p, p_damping, p_z = a.transpose_dot(u), scale * u, r.copy()
+    gamma = p @ p + p_damping @ p_damping
+    target = tolerance * numpy.linalg.norm(r)
+    # Estimation of |L^-1 * [a, sqrt(damping)]|, the biggest |q| / |p|
+    norm = 0.0
+    for iteration in range(max_iterations):
+        if check is not None:
+            check()
+        residual = numpy.linalg.norm(r)
+        if residual <= target or gamma <= (
+            INCOMPATIBLE_TOLERANCE * norm * residual
+        ) ** 2:
+            return preconditioner.backward(z), iteration, True
+        q = preconditioner.forward(a.dot(p) + scale * p_damping)
+        qq = q @ q
+        norm = max(norm, numpy.sqrt(qq / (p @ p + p_damping @ p_damping)))
+        alpha = gamma / qq
+        z += alpha * p_z
+        r -= alpha * q
+        u = preconditioner.backward(r)
+        s, s_damping = a.transpose_dot(u), scale * u
+        gamma, previous = s @ s + s_damping @ s_damping, gamma
+        beta = gamma / previous
+        p = s + beta * p
+        p_damping = s_damping + beta * p_damping
+        p_z = r + beta * p_z
+    return preconditioner.backward(z), max_iterations, False
+
+
+class ForcingTerm:
+    """Relative tolerance of each linear solve of a Newton solve
+    (Eisenstat-Walker choice 2), from the norms of the successive b.
+    missed is set when the last linear solve stopped at MAX_ITERATIONS,
+    before reaching the forcing term"""
+
+    def __init__(self):
+        self.norm = None
+        self.value = MAX_FORCING_TERM
+        self.missed = False
+
+    def next(self, b):
+        norm = float(numpy.linalg.norm(b))
+        if self.norm is not None and norm >= self.norm:
+            # No progress, a step rejected by Levenberg-Marquardt for example,
+            # the inexact step may be the reason
+            self.value = max(MIN_FORCING_TERM, 0.1 * self.value)
+        elif self.norm is not None:
+            value = 0.9 * (norm / self.norm) ** 2
+            # Safeguard against a too fast decrease
+            if 0.9 * self.value**2 > 0.1:
+                value = max(value, 0.9 * self.value**2)
+            value = min(MAX_FORCING_TERM, max(MIN_FORCING_TERM, value))
+            if self.missed:
+                # The last step was less accurate than asked, the progress
+                # it gave is not a reason to ask for less
+                value = min(value, self.value)
+            self.value = value
+        self.norm = norm
+        self.missed = False
+        return self.value
@@ -14,7 +14,12 @@ if "constraints" in locals():
 
 from . import base
 from .draw import MESH_CONSTRAINTS_OT_DrawConstraintsDefinition
-from .solve import MESH_CONSTRAINTS_OT_Solve
+from .solve import (
+    MESH_CONSTRAINTS_OT_Solve,
+    MESH_CONSTRAINTS_OT_SolveBackground,
+    MESH_CONSTRAINTS_OT_ApplyPartialResult,
+    MESH_CONSTRAINTS_OT_DiscardPartialResult,
+)
 from .constraints import (
     MESH_CONSTRAINTS_OT_ConstraintDistance2Vertices,
     MESH_CONSTRAINTS_OT_ConstraintFixXCoord,
@@ -54,6 +59,9 @@ __all__ = [
     "reload",
     "MESH_CONSTRAINTS_OT_DrawConstraintsDefinition",
     "MESH_CONSTRAINTS_OT_Solve",
+    "MESH_CONSTRAINTS_OT_SolveBackground",
+    "MESH_CONSTRAINTS_OT_ApplyPartialResult",
+    "MESH_CONSTRAINTS_OT_DiscardPartialResult",
     "MESH_CONSTRAINTS_OT_DeleteConstraint",
     "MESH_CONSTRAINTS_OT_ConstraintDistance2Vertices",
     "MESH_CONSTRAINTS_OT_ConstraintFixXCoord",
@@ -2,9 +2,148 @@ import bmesh
 
 from . import base
 from .. import props
+from .. import preferences
+from .. import cache
+from .. import disk_cache
 from .. import solver
+from .. import background
+from .. import budget
 from .. import log
 
+# Seconds between two updates of the mesh by the background solve
+TIMER_INTERVAL = 0.1
+# Events still handled by blender during a background solve, the view can move
+# but the mesh must not be edited
+NAVIGATION_EVENTS = {
+    "MOUSEMOVE",
+    "INBETWEEN_MOUSEMOVE",
+    "MIDDLEMOUSE",
+    "WHEELUPMOUSE",
+    "WHEELDOWNMOUSE",
+    "TRACKPADPAN",
+    "TRACKPADZOOM",
+    "NDOF_MOTION",
+}
+# Names of the objects with a background solve running, not to be solved again
+# until it is done : the cached solver is in use by the solve thread
+RUNNING = set()
+
+
+def _poll(context):
+    # A selected mesh in edit mode : I'm in, but not for the rest
+    o = context.object
+    return o is not None and o.type == "MESH" and context.mode == "EDIT_MESH" and "MeshConstraintGenerator" in o and len(o.MeshConstraintGenerator[0].constraints) > 0 and o.name not in RUNNING
+
+
+def _topology(bm):
+    return (len(bm.verts), len(bm.edges), len(bm.faces))
+
+
+def _build_solver(context, o, bm, mc):
+    """Solver of the constraints of o, warm started from the last solve.
+    Return it and the topology of the mesh, key of cache.SOLUTIONS"""
+    ConstraintsKind = props.ConstraintsKind
+
+    # Points are loaded once the constraints are known
+    s = solver.Solver(
+        solver.PointStore(),
+        method=preferences.method(context),
+        backend=preferences.backend(context),
+    )
+    for index, c in enumerate(mc):
+        log.logger().debug(f"{index}: {c}")
+        if c.kind == ConstraintsKind.DISTANCE_BETWEEN_2_VERTICES:
+            s.distance_2_vertices(index, c.point0, c.point1, c.distance)
+        elif c.kind == ConstraintsKind.FIX_X_COORD:
+            s.fix_x(index, c.point, c.x)
+        elif c.kind == ConstraintsKind.FIX_Y_COORD:
+            s.fix_y(index, c.point, c.y)
+        elif c.kind == ConstraintsKind.FIX_Z_COORD:
+            s.fix_z(index, c.point, c.z)
+        elif c.kind == ConstraintsKind.FIX_XY_COORD:
+            s.fix_x(index, c.point, c.x)
+            s.fix_y(index, c.point, c.y)
+        elif c.kind == ConstraintsKind.FIX_XZ_COORD:
+            s.fix_x(index, c.point, c.x)
+            s.fix_z(index, c.point, c.z)
+        elif c.kind == ConstraintsKind.FIX_YZ_COORD:
+            s.fix_y(index, c.point, c.y)
+            s.fix_z(index, c.point, c.z)
+        elif c.kind == ConstraintsKind.FIX_XYZ_COORD:
+            s.fix_x(index, c.point, c.x)
+            s.fix_y(index, c.point, c.y)
+            s.fix_z(index, c.point, c.z)
+        elif c.kind == ConstraintsKind.PARALLEL:
+            s.parallel(index, c.point0, c.point1, c.point2, c.point3)
+        elif c.kind == ConstraintsKind.PERPENDICULAR:
+            s.perpendicular(index, c.point0, c.point1, c.point2, c.point3)
+        elif c.kind == ConstraintsKind.ON_X:
+            s.on_x(index, c.point0, c.point1)
+        elif c.kind == ConstraintsKind.ON_Y:
+            s.on_y(index, c.point0, c.point1)
+        elif c.kind == ConstraintsKind.ON_Z:
+            s.on_z(index, c.point0, c.point1)
+        elif c.kind == ConstraintsKind.SAME_DISTANCE:
+            s.same_distance(index, c.point0, c.point1, c.point2, c.point3)
+        elif c.kind == ConstraintsKind.ANGLE:
+            s.angle(index, c.point0, c.point1, c.point2, c.point3, c.angle)
+        else:
+            raise Exception(f"Unknown kind of constraints {c.kind}")
+
+    # Only the constrained vertices, not the whole mesh
+    bm.verts.ensure_lookup_table()
+    s.points = solver.PointStore.from_vertices(bm.verts, s.points_indices())
+
+    # Same mesh and same constraints structure : restart from the last solve
+    topology = _topology(bm)
+    s = cache.SOLUTIONS.warm_start(o.name, s, topology)
+    if len(s.systems) == 0:
+        # Not in memory, maybe solved in a previous session
+        disk_cache.STRUCTURES.load(s)
+    return s, topology
+
+
+def _apply_solution(operator, area, o, bm, mc, s, topology, solution):
+    """Apply a solve result to the mesh, or flag the constraints in error.
+    The best coordinates of an interrupted solve are kept to be applied
+    or discarded later, see MESH_CONSTRAINTS_OT_ApplyPartialResult"""
+    if solution["solved"]:
+        cache.SOLUTIONS.store(o.name, s, topology)
+        disk_cache.STRUCTURES.store(s)
+        for point in solution["points"]:
+            bm.verts[point.index].co = point.xyz
+        bmesh.update_edit_mesh(o.data, loop_triangles=True, destructive=False)
+        operator.info("Solved !")
+        area.tag_redraw()
+        log.logger().debug("end ok")
+        return {"FINISHED"}
+    else:
+        cache.SOLUTIONS.invalidate(o.name)
+        nb_in_errors = len(solution["equations_in_error"])
+        for in_error in solution["equations_in_error"]:
+            mc.set_in_error(in_error)
+        area.tag_redraw()
+        if solution["reason"] in budget.REASONS:
+            cache.PARTIAL_RESULTS.store(o.name, solution, topology)
+            log.logger().debug("end interrupted")
+            return operator.warning(
+                f"Not Solved : {solution['reason']}, residual {solution['residual']:.3g}, "
+                "the partial result can be applied or discarded"
+            )
+        log.logger().debug("end nok")
+        if nb_in_errors:
+            return operator.error(
+                f"Not Solved : Constraints did not converged, {nb_in_errors} conflicting..."
+            )
+        else:
+            return operator.error(f"Not Solved : Constraints did not converged")
+
+
+def _set_values(bm, values):
+    """Move vertices to values, dict (point, axis) -> value"""
+    for (index, axis), value in values.items():
+        bm.verts[index].co[axis] = value
+
 
 class MESH_CONSTRAINTS_OT_Solve(base.MeshConstraintsOperator):
     bl_idname = "mesh_constraints.solve"
@@ -13,9 +152,7 @@ class MESH_CONSTRAINTS_OT_Solve(base.MeshConstraintsOperator):
 
     @classmethod
     def poll(cls, context):
-        # A selected mesh in edit mode : I'm in, but not for the rest
-        o = context.object
-        return o is not None and o.type == "MESH" and context.mode == "EDIT_MESH" and "MeshConstraintGenerator" in o and len(o.MeshConstraintGenerator[0].constraints) > 0
+        return _poll(context)
 
     def execute(self, context):
         if context.area.type != "VIEW_3D":
@@ -27,75 +164,199 @@ class MESH_CONSTRAINTS_OT_Solve(base.MeshConstraintsOperator):
 
         log.logger().debug("start")
 
-        mesh = o.data
-        bm = bmesh.from_edit_mesh(mesh)
+        bm = bmesh.from_edit_mesh(o.data)
         mc = props.MeshConstraints(o.MeshConstraintGenerator)
 
         mc.clear_in_errors()
+        cache.PARTIAL_RESULTS.discard(o.name)
+
+        s, topology = _build_solver(context, o, bm, mc)
 
-        ConstraintsKind = props.ConstraintsKind
-
-        s = solver.Solver([solver.MeshPoint(v.index, v.co) for v in bm.verts])
-        for index, c in enumerate(mc):
-            log.logger().debug(f"{index}: {c}")
-            if c.kind == ConstraintsKind.DISTANCE_BETWEEN_2_VERTICES:
-                s.distance_2_vertices(index, c.point0, c.point1, c.distance)
-            elif c.kind == ConstraintsKind.FIX_X_COORD:
-                s.fix_x(index, c.point, c.x)
-            elif c.kind == ConstraintsKind.FIX_Y_COORD:
-                s.fix_y(index, c.point, c.y)
-            elif c.kind == ConstraintsKind.FIX_Z_COORD:
-                s.fix_z(index, c.point, c.z)
-            elif c.kind == ConstraintsKind.FIX_XY_COORD:
-                s.fix_x(index, c.point, c.x)
-                s.fix_y(index, c.point, c.y)
-            elif c.kind == ConstraintsKind.FIX_XZ_COORD:
-                s.fix_x(index, c.point, c.x)
-                s.fix_z(index, c.point, c.z)
-            elif c.kind == ConstraintsKind.FIX_YZ_COORD:
-                s.fix_y(index, c.point, c.y)
-                s.fix_z(index, c.point, c.z)
-            elif c.kind == ConstraintsKind.FIX_XYZ_COORD:
-                s.fix_x(index, c.point, c.x)
-                s.fix_y(index, c.point, c.y)
-                s.fix_z(index, c.point, c.z)
-            elif c.kind == ConstraintsKind.PARALLEL:
-                s.parallel(index, c.point0, c.point1, c.point2, c.point3)
-            elif c.kind == ConstraintsKind.PERPENDICULAR:
-                s.perpendicular(index, c.point0, c.point1, c.point2, c.point3)
-            elif c.kind == ConstraintsKind.ON_X:
-                s.on_x(index, c.point0, c.point1)
-            elif c.kind == ConstraintsKind.ON_Y:
-                s.on_y(index, c.point0, c.point1)
-            elif c.kind == ConstraintsKind.ON_Z:
-                s.on_z(index, c.point0, c.point1)
-            elif c.kind == ConstraintsKind.SAME_DISTANCE:
-                s.same_distance(index, c.point0, c.point1, c.point2, c.point3)
-            elif c.kind == ConstraintsKind.ANGLE:
-                s.angle(index, c.point0, c.point1, c.point2, c.point3, c.angle)
-            else:
-                raise Exception(f"Unknown kind of constraints {c.kind}")
-
-        solution = s.solve()
+        solution = s.solve(
+            workers=preferences.workers(context),
+            time_budget=preferences.time_budget(context),
+        )
         log.logger().debug(f"solution: {solution}")
 
-        if solution["solved"]:
-            for point in solution["points"]:
-                bm.verts[point.index].co = point.xyz
-            bmesh.update_edit_mesh(mesh, loop_triangles=True, destructive=False)
-            self.info("Solved !")
-            context.area.tag_redraw()
-            log.logger().debug("end ok")
-            return {"FINISHED"}
-        else:
-            nb_in_errors = len(solution["equations_in_error"])
-            for in_error in solution["equations_in_error"]:
-                mc.set_in_error(in_error)
-            context.area.tag_redraw()
-            log.logger().debug("end nok")
-            if nb_in_errors:
-                return self.error(
-                    f"Not Solved : Constraints did not converged, {nb_in_errors} conflicting..."
-                )
-            else:
-                return self.error(f"Not Solved : Constraints did not converged")
+        return _apply_solution(self, context.area, o, bm, mc, s, topology, solution)
+
+
+class MESH_CONSTRAINTS_OT_SolveBackground(base.MeshConstraintsOperator):
+    """Solve in a thread (see background.py), the mesh is updated every few
+    iterations while blender stays responsive, only the view can move.
+    Esc cancels the solve and restores the vertices, the best coordinates
+    found can still be applied. The vertices are restored too if the solve fails"""
+
+    bl_idname = "mesh_constraints.solve_background"
+    bl_label = "Solve in background"
+    bl_description = (
+        "Solve constraints definition in the background, the mesh is updated "
+        "while solving, Esc to cancel"
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return _poll(context)
+
+    def invoke(self, context, event):
+        if context.area.type != "VIEW_3D":
+            return self.warning("I'm not able to find VIEW_3D, so I won't run")
+
+        o = context.edit_object
+        if "MeshConstraintGenerator" not in o:
+            return self.warning("I'm not able to find constraints on this mesh")
+
+        log.logger().debug("start")
+
+        self.object = o
+        self.area = context.area
+        self.bm = bmesh.from_edit_mesh(o.data)
+        self.mc = props.MeshConstraints(o.MeshConstraintGenerator)
+
+        self.mc.clear_in_errors()
+        cache.PARTIAL_RESULTS.discard(o.name)
+
+        self.solver, self.topology = _build_solver(context, o, self.bm, self.mc)
+        # Coordinates restored if the solve is cancelled
+        self.original = self.solver.points.copy()
+        self.background = background.BackgroundSolve(
+            self.solver,
+            workers=preferences.workers(context),
+            time_budget=preferences.time_budget(context),
+            progress_interval=preferences.progress_interval(context),
+        ).start()
+
+        RUNNING.add(o.name)
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(TIMER_INTERVAL, window=context.window)
+        wm.modal_handler_add(self)
+        self.info("Solving... Esc to cancel")
+        return {"RUNNING_MODAL"}
+
+    def _stop(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        RUNNING.discard(self.object.name)
+        self.area.tag_redraw()
+
+    def _restore(self):
+        """Vertices back to their coordinates before the solve"""
+        for point in self.original:
+            self.bm.verts[point.index].co = point.xyz
+        self._update_mesh()
+
+    def _apply(self, solution):
+        return _apply_solution(
+            self,
+            self.area,
+            self.object,
+            self.bm,
+            self.mc,
+            self.solver,
+            self.topology,
+            solution,
+        )
+
+    def _update_mesh(self):
+        bmesh.update_edit_mesh(self.object.data, loop_triangles=True, destructive=False)
+
+    def modal(self, context, event):
+        if not self.bm.is_valid:
+            # Edit mode left, the mesh is not mine anymore
+            self.background.cancel()
+            self._stop(context)
+            cache.SOLUTIONS.invalidate(self.object.name)
+            log.logger().debug("end edit mode left")
+            return self.warning("Solve cancelled, edit mode left")
+
+        if _topology(self.bm) != self.topology:
+            # Edited anyway, vertices indices may not be the solved ones
+            self.background.cancel()
+            self._stop(context)
+            cache.SOLUTIONS.invalidate(self.object.name)
+            log.logger().debug("end topology changed")
+            return self.warning("Solve cancelled, the mesh was edited")
+
+        if event.type == "ESC" and event.value == "PRESS":
+            self.background.cancel()
+            self._stop(context)
+            self._restore()
+            solution = self.background.result()
+            if "partial_points" in solution:
+                # Best coordinates found, to be applied or discarded
+                return self._apply(solution)
+            # Solved or failed just before the cancel
+            cache.SOLUTIONS.invalidate(self.object.name)
+            log.logger().debug("end cancelled")
+            self.info("Solve cancelled")
+            return {"CANCELLED"}
+
+        if event.type in NAVIGATION_EVENTS:
+            return {"PASS_THROUGH"}
+        if event.type != "TIMER":
+            # No edit of the mesh while solving
+            return {"RUNNING_MODAL"}
+
+        values = self.background.progress()
+        if len(values) > 0:
+            _set_values(self.bm, values)
+            self._update_mesh()
+            self.area.tag_redraw()
+        if not self.background.done:
+            return {"RUNNING_MODAL"}
+
+        self._stop(context)
+        try:
+            solution = self.background.result()
+        except Exception:
+            self._restore()
+            raise
+        log.logger().debug(f"solution: {solution}")
+        if not solution["solved"]:
+            # Not left at an intermediate iterate, like the solve operator
+            self._restore()
+        return self._apply(solution)
+
+
+def _poll_partial_result(context):
+    o = context.object
+    return o is not None and o.type == "MESH" and context.mode == "EDIT_MESH" and o.name in cache.PARTIAL_RESULTS and o.name not in RUNNING
+
+
+class MESH_CONSTRAINTS_OT_ApplyPartialResult(base.MeshConstraintsOperator):
+    bl_idname = "mesh_constraints.apply_partial_result"
+    bl_label = "Apply partial result"
+    bl_description = "Move the vertices to the best coordinates found by the interrupted solve"
+
+    @classmethod
+    def poll(cls, context):
+        return _poll_partial_result(context)
+
+    def execute(self, context):
+        o = context.edit_object
+        partial = cache.PARTIAL_RESULTS.get(o.name)
+        cache.PARTIAL_RESULTS.discard(o.name)
+        bm = bmesh.from_edit_mesh(o.data)
+        if _topology(bm) != partial["topology"]:
+            return self.warning("The mesh was edited since the solve, partial result discarded")
+        bm.verts.ensure_lookup_table()
+        for point in partial["partial_points"]:
+            bm.verts[point.index].co = point.xyz
+        bmesh.update_edit_mesh(o.data, loop_triangles=True, destructive=False)
+        context.area.tag_redraw()
+        self.info(f"Partial result applied, residual {partial['residual']:.3g}")
+        return {"FINISHED"}
+
+
+class MESH_CONSTRAINTS_OT_DiscardPartialResult(base.MeshConstraintsOperator):
+    bl_idname = "mesh_constraints.discard_partial_result"
+    bl_label = "Discard partial result"
+    bl_description = "Forget the best coordinates found by the interrupted solve"
+
+    @classmethod
+    def poll(cls, context):
+        return _poll_partial_result(context)
+
+    def execute(self, context):
+        cache.PARTIAL_RESULTS.discard(context.edit_object.name)
+        context.area.tag_redraw()
+        return {"FINISHED"}
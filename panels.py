@@ -1,6 +1,7 @@
 from bpy.types import Panel
 
 from . import props
+from . import cache
 
 
 class MeshConstraintsPanelBase(Panel):
@@ -18,6 +19,9 @@ class MeshConstraintsPanelMain(MeshConstraintsPanelBase):
 
         row = box.row()
         row.operator("mesh_constraints.solve", text="Solve", icon="SNAP_ON")
+        row.operator(
+            "mesh_constraints.solve_background", text="Background", icon="TIME"
+        )
 
         icon = (
             "PAUSE"
@@ -28,6 +32,21 @@ class MeshConstraintsPanelMain(MeshConstraintsPanelBase):
             "mesh_constraints.draw_constraints_definition", text="Definition", icon=icon
         )
 
+        o = context.object
+        partial = None if o is None else cache.PARTIAL_RESULTS.get(o.name)
+        if partial is not None:
+            # Interrupted solve, see MESH_CONSTRAINTS_OT_ApplyPartialResult
+            box.label(
+                text=f"Not solved ({partial['reason']}), residual {partial['residual']:.3g}"
+            )
+            row = box.row()
+            row.operator(
+                "mesh_constraints.apply_partial_result", text="Apply", icon="CHECKMARK"
+            )
+            row.operator(
+                "mesh_constraints.discard_partial_result", text="Discard", icon="X"
+            )
+
         # TODO display Solver error here ?
         # o = context.object
         # if o is not None and "MeshConstraintGenerator" in o:
@@ -0,0 +1,138 @@
+from bpy.types import AddonPreferences
+from bpy.props import IntProperty, EnumProperty, FloatProperty
+
+from . import backends, solver
+
+
+class MeshConstraintsPreferences(AddonPreferences):
+    bl_idname = __package__
+
+    workers: IntProperty(
+        name="Solver processes",
+        description="Number of processes used to solve independent parts of the constraints",
+        default=solver.DEFAULT_WORKERS,
+        min=1,
+        max=64,
+    )
+
+    method: EnumProperty(
+        name="Solver method",
+        description="Steps used by the numerical solver",
+        items=[
+            (solver.METHOD_NEWTON, "Newton", "Full Newton steps, fast on good meshes"),
+            (
+                solver.METHOD_LEVENBERG_MARQUARDT,
+                "Levenberg-Marquardt",
+                "Damped steps, more robust on meshes far from the solution",
+            ),
+            (
+                solver.METHOD_BROYDEN,
+                "Broyden",
+                "Jacobian updated between evaluations, for big nearly linear systems",
+            ),
+        ],
+        default=solver.DEFAULT_METHOD,
+    )
+
+    backend: EnumProperty(
+        name="Linear solver",
+        description="Linear algebra of the solver steps",
+        items=[
+            (
+                backends.BACKEND_AUTO,
+                "Auto",
+                "Exact steps, dense or sparse depending on the size. Big meshes "
+                "use Krylov incomplete Cholesky if scipy is not installed",
+            ),
+            (
+                backends.BACKEND_KRYLOV,
+                "Krylov",
+                "Approximate iterative steps, for very big meshes",
+            ),
+            (
+                backends.BACKEND_KRYLOV_CHOLESKY,
+                "Krylov incomplete Cholesky",
+                "Iterative steps with a stronger preconditioner, less iterations "
+                "but each one is slower",
+            ),
+        ],
+        default=backends.DEFAULT_BACKEND,
+    )
+
+    time_budget: FloatProperty(
+        name="Solve time limit",
+        description="Seconds after which a solve is stopped, its best coordinates "
+        "can then be applied or discarded. 0 for no limit",
+        default=0.0,
+        min=0.0,
+        unit="TIME",
+    )
+
+    progress_interval: IntProperty(
+        name="Background solve updates",
+        description="Number of solver iterations between two updates of the mesh "
+        "by the background solve",
+        default=solver.DEFAULT_PROGRESS_INTERVAL,
+        min=1,
+        max=1000,
+    )
+
+    def draw(self, context):
+        self.layout.prop(self, "workers")
+        self.layout.prop(self, "method")
+        self.layout.prop(self, "backend")
+        self.layout.prop(self, "time_budget")
+        self.layout.prop(self, "progress_interval")
+
+
+def _preferences(context):
+    """Addon preferences, None if not available"""
+    addon = context.preferences.addons.get(__package__)
+    if addon is None:
+        return None
+    return addon.preferences
+
+
+def workers(context):
+    """Number of solver processes from the addon preferences,
+    solver.default_workers() if preferences are not available"""
+    preferences = _preferences(context)
+    if preferences is None:
+        return solver.default_workers()
+    return preferences.workers
+
+
+def method(context):
+    """Solver method from the addon preferences,
+    solver.DEFAULT_METHOD if preferences are not available"""
+    preferences = _preferences(context)
+    if preferences is None:
+        return solver.DEFAULT_METHOD
+    return preferences.method
+
+
+def backend(context):
+    """Linear algebra backend from the addon preferences,
+    backends.DEFAULT_BACKEND if preferences are not available"""
+    preferences = _preferences(context)
+    if preferences is None:
+        return backends.DEFAULT_BACKEND
+    return preferences.backend
+
+
+def progress_interval(context):
+    """Iterations between two mesh updates of the background solve from the addon
+    preferences, solver.DEFAULT_PROGRESS_INTERVAL if preferences are not available"""
+    preferences = _preferences(context)
+    if preferences is None:
+        return solver.DEFAULT_PROGRESS_INTERVAL
+    return preferences.progress_interval
+
+
+def time_budget(context):
+    """Seconds after which a solve is stopped from the addon preferences,
+    None for no limit or if preferences are not available"""
+    preferences = _preferences(context)
+    if preferences is None or preferences.time_budget <= 0:
+        return None
+    return preferences.time_budget
@@ -0,0 +1,189 @@
+# Numerical rank of the jacobian, and its redundant equations
+#
+# The rank of a is the one of its gram matrix a * a.transpose(), factorized by
+# Cholesky, skipping the pivots under the tolerance : an equation is redundant
+# if its distance to the space of the previous independent equations is under
+# the tolerance. Same result as a Gram-Schmidt orthogonalization of the rows.
+#
+# The gram matrix of mesh constraints is sparse, and banded once the equations
+# are ordered by reverse Cuthill-McKee. So it is factorized by dense blocks
+# on a window sliding along the band : numpy matrix products for
+# nb_equations * bandwidth² operations, and bandwidth² of memory.
+# Some systems have no small band (random pairs of points), their
+# factorization is nb_equations³ : it can be skipped over a number of
+# operations, see rank_analysis(max_work).
+# No scipy here, it is not shipped with blender.
+
+import numpy
+
+from .graph import reverse_cuthill_mckee
+
+# Number of equations factorized before updating the rest of the window
+BLOCK_SIZE = 64
+# Rounding errors of a pivot, relative to the squared norm of its row
+# (the gram matrix squares the rounding errors of the rows)
+PIVOT_PRECISION = 1e-12
+
+
+def gram_terms(rows, cols, values):
+    """Non zero terms (i, j, value) of a * a.transpose() from the non zero terms
+    (rows, cols, values arrays) of a, only i >= j.
+    Terms can be there more than once, their values are to be summed"""
+    rows = numpy.asarray(rows, dtype=int)
+    cols = numpy.asarray(cols, dtype=int)
+    values = numpy.asarray(values, dtype=float)
+    nonzero = values != 0
+    rows, cols, values = rows[nonzero], cols[nonzero], values[nonzero]
+    if len(rows) == 0:
+        return rows, rows, values
+    # Each term is multiplied by all the terms of its column
+    order = numpy.argsort(cols, kind="stable")
+    rows, cols, values = rows[order], cols[order], values[order]
+    starts = numpy.flatnonzero(numpy.diff(cols, prepend=-1))
+    counts = numpy.diff(numpy.append(starts, len(cols)))
+    group_start = numpy.repeat(starts, counts)
+    group_count = numpy.repeat(counts, counts)
+    first = numpy.repeat(numpy.arange(len(cols)), group_count)
+    position = numpy.arange(len(first)) - numpy.repeat(
+        numpy.cumsum(group_count) - group_count, group_count
+    )
+    second = numpy.repeat(group_start, group_count) + position
+    lower = rows[first] >= rows[second]
+    first, second = first[lower], second[lower]
+    return rows[first], rows[second], values[first] * values[second]
+
+
+def _profile(i, j, nb_equations):
+    """First column of each row of a lower triangular sparse matrix"""
+    first = numpy.arange(nb_equations)
+    numpy.minimum.at(first, i, j)
+    return first
+
+
+def band_order(i, j, nb_equations):
+    """Order of the equations giving a small band to the gram matrix,
+    returned as the position of each equation in the order"""
+    natural = numpy.arange(nb_equations)
+    first = _profile(i, j, nb_equations)
+    if nb_equations == 0 or numpy.max(natural - first) <= BLOCK_SIZE:
+        return natural
+    adjacency = [[] for _ in range(nb_equations)]
+    for a, b in zip(i.tolist(), j.tolist()):
+        if a != b:
+            adjacency[a].append(b)
+            adjacency[b].append(a)
+    position = numpy.empty(nb_equations, dtype=int)
+    position[reverse_cuthill_mckee(adjacency)] = natural
+    pi, pj = position[i], position[j]
+    pi, pj = numpy.maximum(pi, pj), numpy.minimum(pi, pj)
+    if numpy.sum(natural - _profile(pi, pj, nb_equations)) < numpy.sum(
+        natural - first
+    ):
+        return position
+    return natural
+
+
+def _reach(i, j, nb_equations):
+    """A block of columns ending at k changes the rows up to reach[k - 1]"""
+    last_row = numpy.full(nb_equations, -1)
+    numpy.maximum.at(last_row, _profile(i, j, nb_equations), numpy.arange(nb_equations))
+    return numpy.maximum.accumulate(last_row) + 1
+
+
+def factorization_work(i, j, nb_equations):
+    """Number of operations of _factorize, from the lower terms of the gram
+    matrix, rows in order : each block updates its window"""
+    if nb_equations == 0:
+        return 0.0
+    reach = _reach(i, j, nb_equations)
+    starts = numpy.arange(0, nb_equations, BLOCK_SIZE)
+    ends = numpy.minimum(starts + BLOCK_SIZE, nb_equations)
+    sizes = (numpy.maximum(ends, reach[ends - 1]) - starts).astype(float)
+    return float(numpy.sum(sizes * sizes * (ends - starts)))
+
+
+def _factorize(i, j, values, nb_equations, tolerance):
+    """Rank revealing Cholesky of the gram matrix given by its lower terms,
+    rows in order. Return the list of the rows under the tolerance"""
+    tolerance = tolerance * tolerance
+    diagonal = numpy.zeros(nb_equations)
+    numpy.add.at(diagonal, i[i == j], values[i == j])
+    reach = _reach(i, j, nb_equations)
+    # Terms enter the window with their row
+    order = numpy.argsort(i, kind="stable")
+    i, j, values = i[order], j[order], values[order]
+    row_start = numpy.searchsorted(i, numpy.arange(nb_equations + 1))
+
+    redundant = []
+    # Dense window on rows and columns start..end of the gram matrix,
+    # updated by the factorized columns, lower part only
+    window = numpy.zeros((0, 0))
+    start = end = 0
+    while start < nb_equations:
+        block_end = min(start + BLOCK_SIZE, nb_equations)
+        new_end = max(block_end, int(reach[block_end - 1]))
+        if new_end > end:
+            grown = numpy.zeros((new_end - start, new_end - start))
+            grown[: end - start, : end - start] = window
+            terms = slice(row_start[end], row_start[new_end])
+            numpy.add.at(grown, (i[terms] - start, j[terms] - start), values[terms])
+            window, end = grown, new_end
+
+        size = block_end - start
+        for k in range(size):
+            if k > 0:
+                window[k:, k] -= window[k:, :k] @ window[k, :k]
+            pivot = window[k, k]
+            if pivot <= max(tolerance, PIVOT_PRECISION * diagonal[start + k]):
+                redundant.append(start + k)
+                window[k:, k] = 0
+            else:
+                window[k:, k] /= numpy.sqrt(pivot)
+        # Update of the rest of the window by the block
+        panel = window[size:, :size]
+        window[size:, size:] -= panel @ panel.T
+        window = window[size:, size:]
+        start = block_end
+    return redundant
+
+
+def rank_analysis(
+    rows, cols, values, nb_equations, tolerance, spectrum=False, max_work=None
+):
+    """Rank of a matrix a of nb_equations rows given by its non zero terms
+    (rows, cols, values arrays)
+    - tolerance: a row is redundant if its distance to the space of the
+    independent rows is under tolerance
+    - spectrum: also compute the singular values, a dense decomposition
+    so only for small matrices
+    - max_work: biggest factorization_work, None for no limit
+    Return a dict with "rank", "redundant" the sorted list of the redundant rows
+    and, if spectrum, "singular_values" in decreasing order.
+    All None if the factorization is over max_work"""
+    i, j, terms = gram_terms(rows, cols, values)
+    position = band_order(i, j, nb_equations)
+    pi, pj = position[i], position[j]
+    pi, pj = numpy.maximum(pi, pj), numpy.minimum(pi, pj)
+    if max_work is not None and factorization_work(pi, pj, nb_equations) > max_work:
+        ret = {"rank": None, "redundant": None}
+        if spectrum:
+            ret["singular_values"] = None
+        return ret
+    equations = numpy.empty(nb_equations, dtype=int)
+    equations[position] = numpy.arange(nb_equations)
+    redundant = sorted(
+        int(equations[k]) for k in _factorize(pi, pj, terms, nb_equations, tolerance)
+    )
+    ret = {"rank": nb_equations - len(redundant), "redundant": redundant}
+    if spectrum:
+        # Decomposition of a itself : the square roots of the eigenvalues of
+        # the gram matrix lose the small singular values in its rounding errors
+        nb_cols = int(cols.max()) + 1 if len(cols) > 0 else 0
+        a = numpy.zeros((nb_equations, nb_cols))
+        numpy.add.at(a, (rows, cols), values)
+        singular_values = numpy.zeros(nb_equations)
+        if nb_equations > 0 and nb_cols > 0:
+            decreasing = numpy.linalg.svd(a, compute_uv=False)
+            singular_values[: len(decreasing)] = decreasing
+        ret["singular_values"] = singular_values
+    return ret
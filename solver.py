@@ -3,18 +3,48 @@
 # point parameters are indices of the mesh, in fact not really used by the solver,
 # index is a nice and practical way to track parameters of the solver
 
-import itertools
+import concurrent.futures
+import os
 import sys
 import math
-from mathutils import Vector
-
-
-# sys.path.append("<your-sympy-install-path>")
-from sympy import symbols, sqrt, diff, cos
-from sympy.matrices import Matrix
-import mpmath
-
-from . import log
+import time
+import types
+import numpy
+
+
+from . import convergence, log
+from .backends import DEFAULT_BACKEND, get_backend
+from .budget import NO_BUDGET, REASON_CANCELLED, REASONS, Budget, Interrupted
+from .graph import AffineDisjointSet, connected_components, dulmage_mendelsohn
+from .rank import rank_analysis
+from .timings import (
+    NO_TIMINGS,
+    PHASE_COMPONENTS,
+    PHASE_EQUATIONS,
+    PHASE_JACOBIAN,
+    PHASE_LINEAR_SOLVE,
+    PHASE_OTHER,
+    PHASE_PRESOLVE,
+    PHASE_RANK,
+    PHASE_RESIDUALS,
+    PHASE_STRUCTURE,
+    PHASE_WORKERS,
+    Timings,
+    timed,
+)
+from .kernels import (
+    EQUATION_EQUAL,
+    EQUATION_FIX,
+    EQUATION_DISTANCE,
+    EQUATION_SAME_DISTANCE,
+    EQUATION_PARALLEL,
+    EQUATION_PERPENDICULAR,
+    EQUATION_ANGLE,
+    RESIDUALS,
+    equation_points_variables,
+    equation_variables,
+    batch_residual_and_gradient,
+)
 
 EPSILON = 1e-6
 CONVERGENCE_TOLERANCE = 1e-8
@@ -22,18 +52,124 @@ VERY_POSITIVE = 1e10
 VERY_NEGATIVE = -1e10
 MAX_ITERATIONS = 50
 RANK_MAG_TOLERANCE = 1e-4
+# Biggest number of operations of the rank analysis after a solve (see
+# rank.factorization_work), about half a second. Over it "rank", "rank_ok" and
+# "dof" are None and "redundant" is empty, solve(rank_max_work=None) to get them
+RANK_MAX_WORK = 2e9
+# Number of processes used to solve independent components
+# can be overridden by the MESH_CONSTRAINTS_WORKERS environment variable
+DEFAULT_WORKERS = 1
+# Number of iterations between two calls of the progress callback of a solve
+DEFAULT_PROGRESS_INTERVAL = 5
+# Solve components as a sequence of small blocks (Dulmage-Mendelsohn)
+DEFAULT_SEQUENCING = False
+# Evaluate equations with sympy instead of the closed form kernels
+DEFAULT_SYMBOLIC = False
+# Newton steps : full minimum norm Gauss-Newton steps
+METHOD_NEWTON = "newton"
+# Levenberg-Marquardt : damped steps, a step is only accepted if it lowers
+# the residual norm, otherwise the damping is raised and the step retried
+METHOD_LEVENBERG_MARQUARDT = "levenberg_marquardt"
+# Quasi-Newton : the jacobian is evaluated every BROYDEN_REFRESH steps only
+# and updated in between by sparse Broyden (Schubert) updates
+METHOD_BROYDEN = "broyden"
+METHODS = [METHOD_NEWTON, METHOD_LEVENBERG_MARQUARDT, METHOD_BROYDEN]
+DEFAULT_METHOD = METHOD_NEWTON
+# Initial damping, relative to the biggest diagonal term of a * a.transpose()
+LM_INITIAL_DAMPING = 1e-3
+# Damping factors after an accepted / rejected step
+LM_DAMPING_DECREASE = 3
+LM_DAMPING_INCREASE = 4
+# Relative damping from which the solver gives up, steps are too small to move
+LM_MAX_DAMPING = 1e12
+# Number of steps between two evaluations of the jacobian with METHOD_BROYDEN
+BROYDEN_REFRESH = 5
+# Maximum number of steps with METHOD_BROYDEN, steps are cheaper than Newton ones
+MAX_BROYDEN_STEPS = 4 * MAX_ITERATIONS
+# Relative tolerance to consider a coordinate is still the one of the last solve,
+# a bit more than the 32 bits floats precision of blender coordinates
+SOLVED_TOLERANCE = 1e-6
+# KernelNewtonSolver attributes only depending on the structure of the equations,
+# see KernelNewtonSolver.structure_state
+STRUCTURE_ATTRIBUTES = (
+    "kept",
+    "eliminated",
+    "params",
+    "bindings",
+    "variables",
+    "variables_index",
+    "variables_scale",
+    "variables_offset",
+    "a_nonzero",
+    "groups",
+    "gradient_mask",
+    "gradient_slots",
+)
+# Seconds between two checks of the cancel token while waiting for the workers
+CANCEL_POLL_INTERVAL = 0.05
+# Errors raised by compiled equations on degenerated values
+# (zero length vectors for angles, overflow...)
+EVALUATION_ERRORS = (ZeroDivisionError, ValueError, OverflowError, FloatingPointError)
+
+
+def _sympy():
+    """sympy module, imported on first use : only the symbolic solver needs it
+    and it takes a while to import, blender startup should not pay for it"""
+    # sys.path.append("<your-sympy-install-path>")
+    import sympy
+
+    return sympy
 
 
 def is_not_reasonable(x):
     math.isnan(x) or x > VERY_POSITIVE or x < VERY_NEGATIVE
 
 
+def check_method(method):
+    if method not in METHODS:
+        raise Exception(f"Unknown solver method '{method}'")
+    return method
+
+
+def first_not_reasonable(values):
+    """Index of the first not reasonable value of a numpy array, None if all are fine"""
+    indices = numpy.flatnonzero(
+        numpy.isnan(values) | (values > VERY_POSITIVE) | (values < VERY_NEGATIVE)
+    )
+    if len(indices) > 0:
+        return int(indices[0])
+    return None
+
+
 class NewtonSolver:
-    def __init__(self, equations, initial_values):
+    def __init__(
+        self,
+        equations,
+        initial_values,
+        backend=DEFAULT_BACKEND,
+        method=DEFAULT_METHOD,
+        timings=NO_TIMINGS,
+        budget=NO_BUDGET,
+    ):
         """Build a NewtonSolver around :
         - equations: list of equations
-        - initial_values: dict params -> values"""
+        - initial_values: dict params -> values
+        - backend: name of the linear algebra backend, see backends.py
+        - method: one of METHODS
+        - timings: Timings of the phases of the solve, see timings.py
+        - budget: Budget stopping the solve, see budget.py"""
         self.equations = equations
+        self.backend = get_backend(backend, len(equations))
+        self.method = check_method(method)
+        self.timings = timings
+        self.budget = budget
+        # Number of jacobian evaluations of the last solve
+        self.iterations = 0
+        # Called with the current values every progress_interval iterations
+        self.progress = None
+        self.progress_interval = DEFAULT_PROGRESS_INTERVAL
+        # Biggest work of the rank analysis, None for no limit
+        self.rank_max_work = RANK_MAX_WORK
 
         # First build list of params
         params = set()
@@ -52,120 +188,171 @@ class NewtonSolver:
         # For parameters being substitutes (simple equations)
         self.substitutes = {}
 
+    @property
+    def budget(self):
+        return self._budget
+
+    @budget.setter
+    def budget(self, budget):
+        self._budget = budget
+        # Iterative linear solves check it too, see KrylovBackend
+        self.backend.budget = budget
+
+    @timed(PHASE_STRUCTURE)
     def prepare_matrix(self):
         # For A and B dimensions
         self.nb_params = len(self.params)
         self.nb_equations = len(self.equations)
 
-        # Jacobian is rows * cols = nb_equations * nb_params
-        # Equations part
-        self.a_eq = [
-            [diff(self.equations[i], self.params[j]) for j in range(self.nb_params)]
-            for i in range(self.nb_equations)
-        ]
+        self._prepare_jacobian_structure()
+        # Same as a_nonzero as index arrays
+        if len(self.a_nonzero) > 0:
+            self.nonzero_rows, self.nonzero_cols = numpy.array(
+                self.a_nonzero, dtype=int
+            ).T
+        else:
+            self.nonzero_rows = self.nonzero_cols = numpy.zeros(0, dtype=int)
+
         # Values part
-        self.a = [[0 for j in range(self.nb_params)] for i in range(self.nb_equations)]
+        self.a = self.backend.jacobian(
+            self.nb_equations, self.nb_params, self.a_nonzero
+        )
+        # Values of the non zero terms of the jacobian, in the order of a_nonzero
+        self.nonzero_values = numpy.zeros(len(self.a_nonzero))
 
         # Value of equations values on current point
-        self.b = [0 for i in range(self.nb_equations)]
+        self.b = self.backend.vector(self.nb_equations)
 
         # Temps for _solve_least_squares
         # a @ a' square matrix of size nb_equations
-        self.aat = [
-            [0 for j in range(self.nb_equations)] for i in range(self.nb_equations)
-        ]
+        self.aat = self.backend.matrix(self.nb_equations, self.nb_equations)
         # z is a column vector of size nb_equations
-        self.z = [0 for i in range(self.nb_equations)]
+        self.z = self.backend.vector(self.nb_equations)
         # x is a column vector of size nb_params
-        self.x = [0 for i in range(self.nb_params)]
+        self.x = self.backend.vector(self.nb_params)
+
+        self._compile()
+
+    def _prepare_jacobian_structure(self):
+        """Compute self.a_nonzero, the list of (row, col) of the non zero terms
+        of the jacobian and self.a_eq_nonzero their symbolic expression.
+        Jacobian is rows * cols = nb_equations * nb_params
+        but an equation only depends on a few params, so only the derivatives
+        on its free symbols are computed and stored, with their position"""
+        params_index = {param: j for j, param in enumerate(self.params)}
+        self.a_nonzero = []
+        self.a_eq_nonzero = []
+        for i in range(self.nb_equations):
+            self.budget.check()
+            equation = self.equations[i]
+            columns = sorted(
+                params_index[param]
+                for param in equation.free_symbols
+                if param in params_index
+            )
+            for j in columns:
+                derivative = _sympy().diff(equation, self.params[j])
+                if derivative != 0:
+                    self.a_nonzero.append((i, j))
+                    self.a_eq_nonzero.append(derivative)
 
+    @property
+    def a_eq(self):
+        """Dense view of the symbolic jacobian, built on demand"""
+        zero = _sympy().S.Zero
+        a_eq = [
+            [zero for j in range(self.nb_params)] for i in range(self.nb_equations)
+        ]
+        for (i, j), derivative in zip(self.a_nonzero, self.a_eq_nonzero):
+            a_eq[i][j] = derivative
+        return a_eq
+
+    def _compile(self):
+        """Compile equations and jacobian into plain python functions working on floats.
+        Done once per solve, so iterations never go through sympy evalf again.
+        Both functions take the list of current values, in the order of self.params"""
+        lambdify = _sympy().lambdify
+        self.b_func = lambdify([self.params], self.equations, modules="math")
+        # Only the non zero terms of the jacobian are evaluated
+        self.a_func = lambdify([self.params], self.a_eq_nonzero, modules="math")
+
+    def _current_values(self):
+        """List of current values, in the order of self.params"""
+        return [self.values[param] for param in self.params]
+
+    @timed(PHASE_JACOBIAN)
     def _eval_jacobian(self):
         """Evaluate jacobian with the current values"""
-        for i in range(self.nb_equations):
-            for j in range(self.nb_params):
-                self.a[i][j] = self.a_eq[i][j].evalf(subs=self.values)
+        self.timings.count("jacobian_evaluations")
+        self.nonzero_values = numpy.array(
+            self.a_func(self._current_values()), dtype=float
+        )
+        self.backend.set_jacobian(self.a, self.a_nonzero, self.nonzero_values)
+
+    @timed(PHASE_JACOBIAN)
+    def _broyden_update(self, dx, db):
+        """Update the jacobian after a step dx that changed b by db, without
+        evaluating it. Schubert update : the Broyden rank one update is done
+        on each row restricted to its non zero terms, so the structure is kept"""
+        rows = self.nonzero_rows
+        dx_nonzero = dx[self.nonzero_cols]
+        # a * dx and squared norm of dx on each row structure
+        adx = numpy.bincount(
+            rows, weights=self.nonzero_values * dx_nonzero, minlength=self.nb_equations
+        )
+        norms = numpy.bincount(
+            rows, weights=dx_nonzero * dx_nonzero, minlength=self.nb_equations
+        )
+        factors = numpy.zeros(self.nb_equations)
+        moved = norms > 0
+        factors[moved] = (db - adx)[moved] / norms[moved]
+        self.nonzero_values += factors[rows] * dx_nonzero
+        self.backend.set_jacobian(self.a, self.a_nonzero, self.nonzero_values)
 
+    @timed(PHASE_RESIDUALS)
     def _eval_b(self):
         """Evaluate b with the current values"""
-        for i in range(self.nb_equations):
-            self.b[i] = self.equations[i].evalf(subs=self.values)
+        self.timings.count("residual_evaluations")
+        self.backend.set_vector(self.b, self.b_func(self._current_values()))
 
+    @timed(PHASE_LINEAR_SOLVE)
     def _compute_aat(self):
         """Compute value of a * a.transpose() and push results in self.aat"""
-        for r in range(self.nb_equations):
-            for c in range(self.nb_equations):
-                s = 0
-                for i in range(self.nb_params):
-                    s += self.a[r][i] * self.a[c][i]
-                self.aat[r][c] = s
+        self.aat = self.backend.compute_aat(self.a, self.aat)
 
     def _solve_linear_system(self):
-        """Solve the system self.aat * self.z = self.b, for z
-        by gaussian elimination with partial pivoting"""
-        for i in range(self.nb_equations):
-            # Try to eliminate term in column i for rows > i
-            # First find pivot for rows >= i
-            vmax = 0
-            imax = 0
-            for ip in range(i, self.nb_equations):
-                if abs(self.aat[ip][i]) > vmax:
-                    imax = ip
-                    vmax = abs(self.aat[ip][i])
-
-            if abs(vmax) < 1e-20:
-                # Maybe a singular matrix, but I don't care
-                # my job here is done : column i term is already 0
-                continue
-
-            # Swap for pivot row imax <-> i
-            for j in range(self.nb_equations):
-                self.aat[i][j], self.aat[imax][j] = self.aat[imax][j], self.aat[i][j]
-            self.b[i], self.b[imax] = self.b[imax], self.b[i]
-
-            # Now term elimination in column i for rows > i+1 (because row i is the row of the pivot)
-            for ip in range(i + 1, self.nb_equations):
-                frac = self.aat[ip][i] / self.aat[i][i]
-                for jp in range(i, self.nb_equations):
-                    self.aat[ip][jp] -= frac * self.aat[i][jp]
-                self.b[ip] -= frac * self.b[i]
-
-        # Now aat is in triangular shape with lower half = 0
-        # It is time for backward substitution
-        for i in range(self.nb_equations - 1, -1, -1):
-            if abs(self.aat[i][i]) < 1e-20:
-                # The factor for this parameter is 0
-                # So I won't be able to do anything with it
-                # Just continue for the others
-                # Same type of strategy as 10 lines up
-                continue
-
-            t = self.b[i]
-            for j in range(self.nb_equations - 1, i, -1):
-                # Add already solved parameters
-                t -= self.z[j] * self.aat[i][j]
+        """Solve the system self.aat * self.z = self.b, for z"""
+        self.backend.solve_linear_system(self.aat, self.b, self.z)
 
-            self.z[i] = t / self.aat[i][i]
-
-    def _solve_least_squares(self):
+    @timed(PHASE_LINEAR_SOLVE)
+    def _solve_least_squares(self, damping=0):
+        """Minimum norm least squares step in self.x, damped by
+        damping * identity on a * a.transpose() if damping is not 0"""
         # compute aat
         self._compute_aat()
-        # Gauss linear system solving z, for aat * z = b
+        if damping != 0:
+            self.aat = self.backend.add_diagonal(self.aat, damping)
+        # linear system solving z, for aat * z = b
         self._solve_linear_system()
         # now multiply z by aT for the solution
-        for c in range(self.nb_params):
-            s = 0
-            for i in range(self.nb_equations):
-                s += self.a[i][c] * self.z[i]
-            self.x[c] = s
+        self.backend.multiply_transpose(self.a, self.z, self.x)
 
+    @timed(PHASE_RANK)
     def test_rank(self):
         """Test rank of the current jacobian.
         Designed to be called just after solve
-        returning rank_ok (True if rank == number of rows) and rank"""
+        returning rank_ok (True if rank == number of rows) and rank, both None
+        if the analysis is over self.rank_max_work.
+        Set self.redundant, the indices of the equations depending on the previous ones"""
         # At the end of solve, the jacobian is not up to date
         # with the last values so update it
         self._eval_jacobian()
-        rank = self.calculate_rank()
+        analysis = self.rank_analysis(max_work=self.rank_max_work)
+        rank = analysis["rank"]
+        if rank is None:
+            self.redundant = []
+            return None, None
+        self.redundant = analysis["redundant"]
         return rank == self.nb_equations, rank
 
     def calculate_dof(self):
@@ -176,44 +363,42 @@ class NewtonSolver:
         return self.nb_params - self.nb_equations
 
     def calculate_rank(self):
-        """Calculate the rank of the Jacobian matrix, by Gram-Schimdt orthogonalization
-        in place. A row (~equation) is considered to be all zeros if its magnitude
-        is less than the tolerance RANK_MAG_TOLERANCE."""
-        tolerance = RANK_MAG_TOLERANCE * RANK_MAG_TOLERANCE
-        rowMagnitude = [0 for _ in range(self.nb_equations)]
-
-        rank = 0
-
-        for i in range(self.nb_equations):
-            # Subtract off this row's component in the direction of any previous rows
-            for iprev in range(i):
-                if rowMagnitude[iprev] < tolerance:
-                    # ignore zero rows
-                    continue
-
-                dot = 0
-                for j in range(self.nb_params):
-                    dot += self.a[iprev][j] * self.a[i][j]
-
-                for j in range(self.nb_params):
-                    self.a[i][j] -= (dot / rowMagnitude[iprev]) * self.a[iprev][j]
-
-            # Our row is now normal to all previous rows; calculate the
-            # magnitude of what's left
-            mag = 0
-            for j in range(self.nb_params):
-                mag += self.a[i][j] * self.a[i][j]
-
-            if mag > tolerance:
-                rank += 1
-
-            rowMagnitude[i] = mag
+        """Calculate the rank of the Jacobian matrix. A row (~equation) is
+        considered to be dependent of the previous ones if its distance
+        to them is less than the tolerance RANK_MAG_TOLERANCE."""
+        return self.rank_analysis()["rank"]
+
+    def rank_analysis(self, spectrum=False, max_work=None):
+        """Rank analysis of the Jacobian matrix (see rank.py) : "rank",
+        "redundant" indices of the dependent equations and if spectrum,
+        "singular_values" (dense, only for small systems).
+        All None if its work is over max_work"""
+        rows, cols, values = self.backend.nonzero_terms(self.a)
+        return rank_analysis(
+            rows,
+            cols,
+            values,
+            self.nb_equations,
+            RANK_MAG_TOLERANCE,
+            spectrum,
+            max_work,
+        )
 
-        return rank
+    @timed(PHASE_RANK)
+    def find_conflicting(self):
+        """Indices of a smallest set of equations to remove to get a full rank
+        jacobian at the current values. When the solve does not converge,
+        residuals are spread on all the equations of a conflict, but only its
+        dependent equations are to be removed"""
+        self._eval_jacobian()
+        # None if skipped, the equations with a residual are reported then
+        return self.rank_analysis(max_work=self.rank_max_work)["redundant"] or []
 
+    @timed(PHASE_PRESOLVE)
     def solve_by_substitution(self):
         # Build dict of possible substitute
         while True:
+            self.budget.check()
             sym = None
             value = None
             for equation in self.equations:
@@ -283,50 +468,123 @@ class NewtonSolver:
                 # Already removed so it's OK
                 pass
 
+    def _step(self):
+        """Newton step x(n+1) - x(n) = 0 - F(x(n)), move params values by -x.
+        Return the index of a param with a not reasonable value, None if all is fine"""
+        for i in range(self.nb_params):
+            param = self.params[i]
+            self.values[param] -= float(self.x[i])
+            if is_not_reasonable(self.values[param]):
+                return i
+        return None
+
+    def _check_convergence(self):
+        """Return (converged, index), converged is True if all equations values
+        are under the tolerance, index is the index of a not reasonable equation
+        value, None if all is fine"""
+        for i in range(self.nb_equations):
+            b = self.b[i]
+            if is_not_reasonable(b):
+                return False, i
+            if abs(b) > CONVERGENCE_TOLERANCE:
+                return False, None
+        return True, None
+
+    def _save_values(self):
+        """Copy of the current values, for _restore_values"""
+        return dict(self.values)
+
+    def _restore_values(self, saved):
+        self.values = dict(saved)
+
+    def _squared_norm_b(self):
+        return sum(float(b) * float(b) for b in self.b)
+
+    def _step_norm(self):
+        """Norm of the last step, self.x"""
+        return float(numpy.linalg.norm(numpy.asarray(self.x, dtype=float)))
+
+    def _record(self, step_norm=0.0, damping=0.0, accepted=True, evaluated=True):
+        """Add a row to self.history (see convergence.py) after a step,
+        b is up to date with its values if evaluated"""
+        residual_norm, worst = math.nan, -1
+        if evaluated:
+            b = numpy.abs(numpy.asarray(self.b, dtype=float).ravel())
+            residual_norm = float(numpy.sqrt(numpy.dot(b, b)))
+            if len(b) > 0:
+                worst = int(numpy.argmax(b))
+        self.history.append(
+            (0, self.iterations, residual_norm, step_norm, damping, worst, accepted)
+        )
+        # Best values so far, returned if the solve is interrupted
+        if evaluated and (self.best is None or residual_norm < self.best[0]):
+            self.best = (residual_norm, self._save_values())
+
+    def _checkpoint(self):
+        """Between two iterations : stop if the budget is over, and give the
+        current values to self.progress every self.progress_interval checkpoints"""
+        self.budget.check()
+        self.checkpoints += 1
+        if self.progress is not None and self.checkpoints % self.progress_interval == 0:
+            self.progress(self.values)
+
     def _solve(self):
         # Prepare matrix for solving storage
         self.prepare_matrix()
+        self.iterations = 0
         # Eval b now : values of equations with current values
-        self._eval_b()
+        try:
+            self._eval_b()
+        except EVALUATION_ERRORS:
+            return {"solved": False, "reason": "not_reasonable", "source": "b"}
+        self._record()
         log.logger().debug(f"{self.b}")
+        if self.method == METHOD_LEVENBERG_MARQUARDT:
+            return self._solve_levenberg_marquardt()
+        if self.method == METHOD_BROYDEN:
+            return self._solve_broyden()
         count = 0
         while True:
+            self._checkpoint()
             # Eval jacobian with current values
-            self._eval_jacobian()
+            try:
+                self._eval_jacobian()
+            except EVALUATION_ERRORS:
+                return {"solved": False, "reason": "not_reasonable", "source": "a"}
+            self.iterations += 1
 
             # Solve with least squares
             self._solve_least_squares()
+            step_norm = self._step_norm()
 
             # Use solutions in X to move param values, this is the newton step
-            # x(n+1) - x(n) = 0 - F(x(n))
-            for i in range(self.nb_params):
-                param = self.params[i]
-                self.values[param] -= self.x[i]
-                if is_not_reasonable(self.values[param]):
-                    return {
-                        "solved": False,
-                        "reason": "not_reasonable",
-                        "source": "params",
-                        "index": i,
-                    }
+            index = self._step()
+            if index is not None:
+                self._record(step_norm, accepted=False, evaluated=False)
+                return {
+                    "solved": False,
+                    "reason": "not_reasonable",
+                    "source": "params",
+                    "index": index,
+                }
 
             # Eval b now that values have changed
-            self._eval_b()
+            try:
+                self._eval_b()
+            except EVALUATION_ERRORS:
+                self._record(step_norm, accepted=False, evaluated=False)
+                return {"solved": False, "reason": "not_reasonable", "source": "b"}
+            self._record(step_norm)
 
             # Check convergence criteria in b
-            converged = True
-            for i in range(self.nb_equations):
-                b = self.b[i]
-                if is_not_reasonable(b):
-                    return {
-                        "solved": False,
-                        "reason": "not_reasonable",
-                        "source": "b",
-                        "index": i,
-                    }
-                if abs(b) > CONVERGENCE_TOLERANCE:
-                    converged = False
-                    break
+            converged, index = self._check_convergence()
+            if index is not None:
+                return {
+                    "solved": False,
+                    "reason": "not_reasonable",
+                    "source": "b",
+                    "index": index,
+                }
 
             log.logger().debug(f"{count} {self.b} {self.a}")
 
@@ -338,6 +596,159 @@ class NewtonSolver:
 
             count += 1
 
+    def _solve_levenberg_marquardt(self):
+        """Levenberg-Marquardt iterations, b is already evaluated.
+        A step is accepted only if it lowers the norm of b, otherwise
+        it is retried with a bigger damping from the same values"""
+        norm = self._squared_norm_b()
+        damping = None
+        while True:
+            converged, index = self._check_convergence()
+            if index is not None:
+                return {
+                    "solved": False,
+                    "reason": "not_reasonable",
+                    "source": "b",
+                    "index": index,
+                }
+            if converged:
+                return {"solved": True}
+            if self.iterations > MAX_ITERATIONS:
+                return {"solved": False, "reason": "count_over_max_iterations"}
+            self._checkpoint()
+
+            # Eval jacobian with current values
+            try:
+                self._eval_jacobian()
+            except EVALUATION_ERRORS:
+                return {"solved": False, "reason": "not_reasonable", "source": "a"}
+            self.iterations += 1
+
+            saved = self._save_values()
+            while True:
+                if damping is None:
+                    self._compute_aat()
+                    scale = self.backend.max_diagonal(self.aat)
+                    damping = LM_INITIAL_DAMPING * (scale if scale > 0 else 1)
+                    damping_max = LM_MAX_DAMPING * (scale if scale > 0 else 1)
+                else:
+                    self.budget.check()
+                self._solve_least_squares(damping)
+                step_norm = self._step_norm()
+                index = self._step()
+                accepted = evaluated = index is None
+                if accepted:
+                    try:
+                        self._eval_b()
+                        new_norm = self._squared_norm_b()
+                        accepted = new_norm < norm
+                    except EVALUATION_ERRORS:
+                        accepted = evaluated = False
+                self._record(step_norm, damping, accepted, evaluated)
+                if accepted:
+                    norm = new_norm
+                    damping /= LM_DAMPING_DECREASE
+                    break
+                # Backtrack : same values, more damping, so a shorter step
+                # b is evaluated again as the linear solve can modify it
+                self._restore_values(saved)
+                self._eval_b()
+                damping *= LM_DAMPING_INCREASE
+                if damping > damping_max:
+                    return {"solved": False, "reason": "stalled"}
+            log.logger().debug(f"{self.iterations} {damping} {norm}")
+
+    def _solve_broyden(self):
+        """Quasi-Newton iterations, b is already evaluated.
+        The jacobian is evaluated every BROYDEN_REFRESH steps and updated in
+        between. If a step with an updated jacobian does not lower the norm
+        of b, it is cancelled and the jacobian evaluated again"""
+        norm = self._squared_norm_b()
+        # Steps since the last evaluation of the jacobian, None to evaluate it
+        since_evaluation = None
+        steps = 0
+        while True:
+            converged, index = self._check_convergence()
+            if index is not None:
+                return {
+                    "solved": False,
+                    "reason": "not_reasonable",
+                    "source": "b",
+                    "index": index,
+                }
+            if converged:
+                return {"solved": True}
+            if steps > MAX_BROYDEN_STEPS:
+                return {"solved": False, "reason": "count_over_max_iterations"}
+            self._checkpoint()
+
+            if since_evaluation is None or since_evaluation >= BROYDEN_REFRESH:
+                try:
+                    self._eval_jacobian()
+                except EVALUATION_ERRORS:
+                    return {"solved": False, "reason": "not_reasonable", "source": "a"}
+                self.iterations += 1
+                since_evaluation = 0
+
+            saved = self._save_values()
+            # Copy as the linear solve can modify b
+            b = numpy.array(self.b, dtype=float)
+            self._solve_least_squares()
+            dx = -numpy.array(self.x, dtype=float)
+            step_norm = self._step_norm()
+            index = self._step()
+            steps += 1
+            if index is not None:
+                self._record(step_norm, accepted=False, evaluated=False)
+                return {
+                    "solved": False,
+                    "reason": "not_reasonable",
+                    "source": "params",
+                    "index": index,
+                }
+            try:
+                self._eval_b()
+                new_norm = self._squared_norm_b()
+            except EVALUATION_ERRORS:
+                new_norm = None
+            stalled = new_norm is None or (since_evaluation > 0 and new_norm >= norm)
+            self._record(step_norm, 0.0, not stalled, new_norm is not None)
+            if new_norm is None and since_evaluation == 0:
+                return {"solved": False, "reason": "not_reasonable", "source": "b"}
+
+            if since_evaluation > 0 and stalled:
+                # Stalled with an updated jacobian, back to the previous values
+                # and a real jacobian
+                self._restore_values(saved)
+                self._eval_b()
+                since_evaluation = None
+                continue
+
+            self._broyden_update(dx, numpy.array(self.b, dtype=float) - b)
+            since_evaluation += 1
+            norm = new_norm
+            log.logger().debug(f"{steps} {since_evaluation} {norm}")
+
+    def _interrupted(self, reason):
+        """Result of a solve stopped by its budget : "values" and "residual"
+        of the best values found, if any equation was evaluated"""
+        log.logger().debug(f"interrupted: {reason} {self.iterations}")
+        ret = {
+            "solved": False,
+            "reason": reason,
+            "equations_in_error": set(),
+            "iterations": self.iterations,
+            "history": convergence.as_array(self.history),
+        }
+        if self.best is not None:
+            residual, saved = self.best
+            self._restore_values(saved)
+            self.reduce_substitution()
+            ret["values"] = self.values
+            ret["residual"] = residual
+        return ret
+
+    @timed(PHASE_PRESOLVE)
     def reduce_substitution(self):
         # First substitute every values computed by _solve
         for param in self.values:
@@ -372,12 +783,29 @@ class NewtonSolver:
     def solve(self):
         # Substitutes all I can first
         log.logger().debug("start")
-        self.solve_by_substitution()
-        log.logger().debug(f"{self.substitutes}")
-        log.logger().debug(f"{self.equations}")
-        # Non substituted parts
-        if len(self.equations) > 0:
-            ret = self._solve()
+        # Rows of the convergence history, see convergence.py
+        self.history = []
+        # (residual norm, saved values) of the values with the smallest residual
+        self.best = None
+        # Iterations started, see _checkpoint
+        self.checkpoints = 0
+        try:
+            self.solve_by_substitution()
+            self.timings.count("eliminated_variables", len(self.substitutes))
+            log.logger().debug(f"{self.substitutes}")
+            log.logger().debug(f"{self.equations}")
+            # Non substituted parts
+            if len(self.equations) > 0:
+                ret = self._solve()
+            else:
+                # Nothing to solve, but keep matrix around for the rank
+                self.prepare_matrix()
+                ret = {"solved": True}
+        except Interrupted as e:
+            return self._interrupted(e.reason)
+        self.timings.count("equations", self.nb_equations)
+        self.timings.count("variables", self.nb_params)
+        self.timings.count("iterations", self.iterations)
         if ret["solved"]:
             rank_ok, rank = self.test_rank()
             dof = None
@@ -390,46 +818,507 @@ class NewtonSolver:
                 "dof": dof,
                 "rank_ok": rank_ok,
                 "rank": rank,
+                "redundant": self.redundant,
+                "iterations": self.iterations,
+                "history": convergence.as_array(self.history),
             }
         else:
             # Error find out which one of the equations are problematics
             equations_in_error = set()
-            for i in range(self.nb_equations):
-                if self.b[i] > CONVERGENCE_TOLERANCE or is_not_reasonable(self.b[i]):
-                    equations_in_error.add(i)
+            if ret["reason"] != "not_reasonable":
+                equations_in_error = set(self.find_conflicting())
+            if len(equations_in_error) == 0:
+                # Not a conflict, or values too broken to tell
+                for i in range(self.nb_equations):
+                    if self.b[i] > CONVERGENCE_TOLERANCE or is_not_reasonable(
+                        self.b[i]
+                    ):
+                        equations_in_error.add(i)
             ret["equations_in_error"] = equations_in_error
+            ret["iterations"] = self.iterations
+            ret["history"] = convergence.as_array(self.history)
             return ret
 
 
+class KernelNewtonSolver(NewtonSolver):
+    """NewtonSolver on equations records (see kernels.py), residuals and jacobian
+    are evaluated by the batched kernels, no sympy involved.
+    Equations are grouped by kind, so each iteration is a few numpy operations
+    per kind, whatever the number of equations.
+    Params are (point, axis) couples.
+
+    Fix and equal equations are first removed by a presolve, see _presolve"""
+
+    def __init__(
+        self,
+        records,
+        initial_values,
+        backend=DEFAULT_BACKEND,
+        fixed=(),
+        method=DEFAULT_METHOD,
+        structure=None,
+        timings=NO_TIMINGS,
+        budget=NO_BUDGET,
+    ):
+        """Build a KernelNewtonSolver around :
+        - records: list of equations records
+        - initial_values: dict (point, axis) -> values
+        - backend: name of the linear algebra backend, see backends.py
+        - fixed: params used as constants, not solved
+        - method: one of METHODS
+        - structure: structure_state() of a solver of the same records structure
+        and fixed params, the presolve is then skipped
+        - timings: Timings of the phases of the solve, see timings.py
+        - budget: Budget stopping the solve, see budget.py"""
+        self.backend = get_backend(backend, len(records))
+        self.method = check_method(method)
+        self.timings = timings
+        self.budget = budget
+        self.iterations = 0
+        self.progress = None
+        self.progress_interval = DEFAULT_PROGRESS_INTERVAL
+        self.rank_max_work = RANK_MAX_WORK
+        self.fixed = set(fixed)
+        if structure is None:
+            self._presolve(records, initial_values)
+            self._prepare_groups(records)
+        else:
+            for name in STRUCTURE_ATTRIBUTES:
+                setattr(self, name, structure[name])
+        self._presolve_values(records, initial_values)
+        # Jacobian, allocated by the first prepare_matrix
+        self.a = None
+        self.substitutes = {}
+
+    @timed(PHASE_PRESOLVE)
+    def _presolve(self, records, initial_values):
+        """Remove the fix (x - c) and equal (x - y) equations, and their variables,
+        from the system. Variables are linked with an AffineDisjointSet :
+        each variable is scale * root + offset, with root a param or a constant.
+        A fix or equal equation that would make a loop (redundant or conflicting
+        equation) is kept in the system.
+        Only depends on the structure of records, values are set by
+        _presolve_values. Set self.kept, the indices in records of the kept
+        equations, self.params the free roots and self.bindings the sources
+        of the constants"""
+        ds = AffineDisjointSet()
+        # All the variables in order of appearance
+        variables = {}
+        for record in records:
+            for variable in equation_points_variables(record):
+                variables[variable] = True
+        # Each successful bind is a different constant root in the end
+        # (variable, index of the fix record or None if a fixed param)
+        bindings = []
+        for variable in variables:
+            if variable not in initial_values:
+                raise Exception(f"Param '{variable}' is not in initial_values dict")
+            if variable in self.fixed and ds.bind(variable, 0.0):
+                bindings.append((variable, None))
+
+        self.kept = []
+        for i, (kind, points, axis, value) in enumerate(records):
+            self.budget.check()
+            if kind == EQUATION_FIX:
+                eliminated = ds.bind((points[0], axis), 0.0)
+                if eliminated:
+                    bindings.append(((points[0], axis), i))
+            elif kind == EQUATION_EQUAL:
+                eliminated = ds.union((points[0], axis), (points[1], axis))
+            else:
+                eliminated = False
+            if not eliminated:
+                self.kept.append(i)
+        # Each eliminated equation removed one param
+        self.eliminated = len(records) - len(self.kept)
+
+        # Roots : free ones are the params, then bound ones
+        roots = {variable: ds.find(variable) for variable in variables}
+        self.params = list(
+            dict.fromkeys(r[0] for r in roots.values() if r[0] not in ds.constants)
+        )
+        # Constant = (value - offset) / scale, from the value of its source
+        self.bindings = []
+        constants = []
+        for variable, i in bindings:
+            root, scale, offset = roots[variable]
+            self.bindings.append((variable, i, scale, offset))
+            constants.append(root)
+        roots_index = {root: k for k, root in enumerate(self.params + constants)}
+        # variable -> (index in self.q of its root, scale, offset)
+        self.variables_roots = {
+            variable: (roots_index[root], scale, offset)
+            for variable, (root, scale, offset) in roots.items()
+        }
+        # Variables of the solution, fixed ones are not part of it
+        self.variables = [v for v in variables if v not in self.fixed]
+        variables_roots = [self.variables_roots[v] for v in self.variables]
+        self.variables_index = numpy.array([r[0] for r in variables_roots], dtype=int)
+        self.variables_scale = numpy.array([r[1] for r in variables_roots])
+        self.variables_offset = numpy.array([r[2] for r in variables_roots])
+
+    @timed(PHASE_PRESOLVE)
+    def _presolve_values(self, records, initial_values):
+        """Set the values of the presolved system : self.q the values of
+        the roots, params then constants, and the values of the equations"""
+        self.records = records
+        self.equations = [records[i] for i in self.kept]
+        q = [float(initial_values[param]) for param in self.params]
+        for variable, i, scale, offset in self.bindings:
+            value = initial_values[variable] if i is None else records[i][3]
+            q.append((float(value) - offset) / scale)
+        self.q = numpy.array(q)
+        self.groups_values = [
+            numpy.array([self.equations[i][3] for i in rows], dtype=float)
+            for _, rows, _, _, _, _ in self.groups
+        ]
+        # Gradients of the last evaluation, valid until the next step
+        self.gradients = None
+
+    def structure_state(self):
+        """Dict of what only depends on the structure of the records and
+        on the fixed params, to build another solver with the same structure,
+        see __init__ structure"""
+        return {name: getattr(self, name) for name in STRUCTURE_ATTRIBUTES}
+
+    def restart(self, initial_values, records):
+        """Prepare a new solve of the same system, the presolve and already
+        allocated matrices are kept.
+        - initial_values: dict (point, axis) -> values
+        - records: same equations records, only their values can be different"""
+        self._presolve_values(records, initial_values)
+
+    def prepare_matrix(self):
+        """Only done once, a restarted system keeps its structure"""
+        if self.a is None:
+            super().prepare_matrix()
+
+    @property
+    def values(self):
+        """Dict variable -> current value"""
+        values = (
+            self.q[self.variables_index] * self.variables_scale + self.variables_offset
+        )
+        return dict(zip(self.variables, values.tolist()))
+
+    def test_rank(self):
+        """Eliminated equations are independent, and add one to the rank each"""
+        rank_ok, rank = super().test_rank()
+        return rank_ok, None if rank is None else rank + self.eliminated
+
+    def solve(self):
+        # Each eliminated equation removed one variable
+        self.timings.count("eliminated_variables", self.eliminated)
+        ret = super().solve()
+        # Indices in the records given to the solver
+        ret["history"] = convergence.remap(ret["history"], self.kept)
+        if ret["solved"]:
+            ret["redundant"] = [self.kept[i] for i in ret["redundant"]]
+        else:
+            ret["equations_in_error"] = set(
+                self.kept[i] for i in ret["equations_in_error"]
+            )
+        return ret
+
+    @timed(PHASE_STRUCTURE)
+    def _prepare_groups(self, records):
+        """Compute self.a_nonzero, the list of (row, col) of the non zero terms
+        of the jacobian, and group kept equations by kind in self.groups, a list of
+        (kind, rows, columns, scales, offsets, axes) arrays :
+        - rows: indices of the equations
+        - columns: for each equation, indices in self.q of the roots of
+        its kernel variables, with their scales and offsets
+        - axes: of each equation record
+        self.gradient_slots gives the position in a_nonzero of each gradient term
+        of the groups (concatenated), self.gradient_mask masks out the constants"""
+        nb_params = len(self.params)
+        self.a_nonzero = []
+        nonzero_index = {}
+        groups = {}
+        for row, i in enumerate(self.kept):
+            self.budget.check()
+            kind, points, axis, value = record = records[i]
+            roots = [
+                self.variables_roots[variable]
+                for variable in equation_points_variables(record)
+            ]
+            slots = []
+            for k, _, _ in roots:
+                if k >= nb_params:
+                    slots.append(-1)
+                    continue
+                if (row, k) not in nonzero_index:
+                    nonzero_index[(row, k)] = len(self.a_nonzero)
+                    self.a_nonzero.append((row, k))
+                slots.append(nonzero_index[(row, k)])
+            group = groups.setdefault(kind, ([], [], [], []))
+            group[0].append(row)
+            group[1].append(roots)
+            group[2].append(slots)
+            group[3].append(axis if axis is not None else 0)
+
+        self.groups = []
+        slots = [numpy.zeros(0, dtype=int)]
+        for kind, (rows, roots, kind_slots, axes) in groups.items():
+            roots = numpy.array(roots, dtype=float)
+            self.groups.append(
+                (
+                    kind,
+                    numpy.array(rows),
+                    roots[:, :, 0].astype(int),
+                    roots[:, :, 1],
+                    roots[:, :, 2],
+                    numpy.array(axes),
+                )
+            )
+            slots.append(numpy.array(kind_slots).ravel())
+        slots = numpy.concatenate(slots)
+        self.gradient_mask = slots >= 0
+        self.gradient_slots = slots[self.gradient_mask]
+
+    def _prepare_jacobian_structure(self):
+        """Already done by _prepare_groups"""
+        pass
+
+    def _compile(self):
+        """Nothing to compile, kernels are already plain python"""
+        pass
+
+    def _eval_kernels(self):
+        """Evaluate residuals and gradients of all groups with the current values,
+        returns residuals, gradients are kept in self.gradients"""
+        residuals = numpy.zeros(self.nb_equations)
+        gradients = [numpy.zeros(0)]
+        for (kind, rows, columns, scales, offsets, axes), values in zip(
+            self.groups, self.groups_values
+        ):
+            q = self.q[columns] * scales + offsets
+            r, g = batch_residual_and_gradient(kind, q, axes, values)
+            residuals[rows] = r
+            # Chain rule for the roots
+            gradients.append((g * scales).ravel())
+        self.gradients = numpy.concatenate(gradients)
+        return residuals
+
+    @timed(PHASE_JACOBIAN)
+    def _eval_jacobian(self):
+        """Evaluate jacobian with the current values"""
+        self.timings.count("jacobian_evaluations")
+        if self.gradients is None:
+            self._eval_kernels()
+        # A point can be used twice in an equation, so terms on the same
+        # slot are summed
+        self.nonzero_values = numpy.bincount(
+            self.gradient_slots,
+            weights=self.gradients[self.gradient_mask],
+            minlength=len(self.a_nonzero),
+        ).astype(float)
+        self.backend.set_jacobian(self.a, self.a_nonzero, self.nonzero_values)
+
+    @timed(PHASE_RESIDUALS)
+    def _eval_b(self):
+        """Evaluate b with the current values"""
+        self.timings.count("residual_evaluations")
+        self.backend.set_vector(self.b, self._eval_kernels())
+
+    def _step(self):
+        """Newton step on all params at once"""
+        params_values = self.q[: self.nb_params]
+        params_values -= numpy.asarray(self.x, dtype=float)
+        self.gradients = None
+        return first_not_reasonable(params_values)
+
+    def _save_values(self):
+        return self.q.copy()
+
+    def _restore_values(self, saved):
+        self.q[:] = saved
+        self.gradients = None
+
+    def _squared_norm_b(self):
+        b = numpy.asarray(self.b, dtype=float)
+        return float(numpy.dot(b, b))
+
+    def _check_convergence(self):
+        b = numpy.asarray(self.b, dtype=float)
+        index = first_not_reasonable(b)
+        if index is not None:
+            return False, index
+        return bool(numpy.all(numpy.abs(b) <= CONVERGENCE_TOLERANCE)), None
+
+    def solve_by_substitution(self):
+        """No substitution, fixed coordinates are simply solved by the first step"""
+        pass
+
+    def reduce_substitution(self):
+        pass
+
+
+def build_equation(record, params):
+    """Build the sympy equation of an equation record (kind, points, axis, value)
+    - params: list of the (x, y, z) params of each point of the record"""
+    kind, points, axis, value = record
+    if kind not in RESIDUALS:
+        raise Exception(f"Unknown kind of equation {kind}")
+    return RESIDUALS[kind](params, axis, value, _sympy())
+
+
+def _interrupted(reason):
+    """Result of equations not solved, their solve interrupted by its budget
+    before any evaluation"""
+    return {
+        "solved": False,
+        "reason": reason,
+        "equations_in_error": [],
+        "iterations": 0,
+        "history": convergence.as_array([]),
+    }
+
+
+def _add_rank(total, ret):
+    """Add "rank", "rank_ok" and "dof" of a solved ret to the ones of total,
+    None when unknown (rank analysis skipped, see RANK_MAX_WORK)"""
+    if total["rank_ok"] is False or ret["rank_ok"] is False:
+        total["rank_ok"] = False
+    elif total["rank_ok"] is None or ret["rank_ok"] is None:
+        total["rank_ok"] = None
+    for name in ("rank", "dof"):
+        if total[name] is None or ret[name] is None:
+            total[name] = None
+        else:
+            total[name] += ret[name]
+
+
+def default_workers():
+    """Number of worker processes, from MESH_CONSTRAINTS_WORKERS or DEFAULT_WORKERS"""
+    try:
+        return max(1, int(os.environ.get("MESH_CONSTRAINTS_WORKERS", DEFAULT_WORKERS)))
+    except ValueError:
+        return DEFAULT_WORKERS
+
+
+def solve_payload(payload):
+    """Solve a component described by a payload (see Solver._component_payload)
+    Run in a worker process, payload and returned value are plain python lists and
+    dicts, only indices and values, so they are cheap to pickle.
+    Return a dict with "solved", "values" (list of [point, axis, value] of the
+    variables of the equations only, point is an index in payload "coordinates")
+    and the same keys as NewtonSolver.solve() (equations_in_error are indices in
+    the payload equations), and "timings" if payload "profile" is True.
+    "values" are also the partial result of a solve interrupted by the payload
+    "deadline"""
+    points = PointStore(range(len(payload["coordinates"])), payload["coordinates"])
+    solver = Solver(
+        points,
+        backend=payload["backend"],
+        sequencing=payload["sequencing"],
+        symbolic=payload["symbolic"],
+        method=payload["method"],
+    )
+    if payload["profile"]:
+        solver.timings = Timings()
+    solver.rank_max_work = payload["rank_max_work"]
+    if payload["deadline"] is not None:
+        solver.budget = Budget(max(0.0, payload["deadline"] - time.time()))
+    for i, (kind, equation_points, axis, value) in enumerate(payload["equations"]):
+        solver._add_equation(i, kind, equation_points, axis, value)
+    ret = solver._solve_component(list(range(len(solver.equations_records))))
+    if payload["profile"]:
+        ret["timings"] = solver.timings.as_dict()
+    if "values" in ret:
+        # Other axes of the points may be variables of other components
+        ret["values"] = [[p, axis, value] for (p, axis), value in ret["values"].items()]
+    return ret
+
+
+def solve_payloads(payloads):
+    """solve_payload of a list of payloads, in one call to amortize
+    inter-process communication"""
+    return [solve_payload(payload) for payload in payloads]
+
+
 class MeshPoint:
+    """A point of the mesh, a view on its row of a (n, 3) coordinates array,
+    the one of a PointStore or its own one"""
+
+    __slots__ = ("index", "coordinates", "row", "_params")
+
+    @classmethod
+    def from_xyz(cls, index, x, y, z):
+        return cls(index, types.SimpleNamespace(x=x, y=y, z=z))
+
+    @classmethod
+    def view(cls, index, coordinates, row):
+        """Point index on the row of coordinates"""
+        point = cls.__new__(cls)
+        point.index = index
+        point.coordinates = coordinates
+        point.row = row
+        point._params = None
+        return point
+
     def __init__(self, index, co):
         self.index = index
-        self.x_value = co.x
-        self.y_value = co.y
-        self.z_value = co.z
-        self.x_param = symbols(f"x{self.index}")
-        self.y_param = symbols(f"y{self.index}")
-        self.z_param = symbols(f"z{self.index}")
+        self.coordinates = numpy.array([[co.x, co.y, co.z]], dtype=float)
+        self.row = 0
+        # sympy symbols, built on first use
+        self._params = None
 
     @property
     def xyz(self):
-        return (self.x_value, self.y_value, self.z_value)
+        x, y, z = self.coordinates[self.row].tolist()
+        return (x, y, z)
 
     @property
-    def x(self):
-        return self.x_value
+    def x_value(self):
+        return float(self.coordinates[self.row, 0])
+
+    @x_value.setter
+    def x_value(self, value):
+        self.coordinates[self.row, 0] = value
 
     @property
-    def y(self):
-        return self.y_value
+    def y_value(self):
+        return float(self.coordinates[self.row, 1])
+
+    @y_value.setter
+    def y_value(self, value):
+        self.coordinates[self.row, 1] = value
 
     @property
-    def z(self):
-        return self.z_value
+    def z_value(self):
+        return float(self.coordinates[self.row, 2])
+
+    @z_value.setter
+    def z_value(self, value):
+        self.coordinates[self.row, 2] = value
+
+    x = x_value
+    y = y_value
+    z = z_value
 
     @property
     def params(self):
-        return (self.x_param, self.y_param, self.z_param)
+        if self._params is None:
+            symbols = _sympy().symbols
+            self._params = (
+                symbols(f"x{self.index}"),
+                symbols(f"y{self.index}"),
+                symbols(f"z{self.index}"),
+            )
+        return self._params
+
+    @property
+    def x_param(self):
+        return self.params[0]
+
+    @property
+    def y_param(self):
+        return self.params[1]
+
+    @property
+    def z_param(self):
+        return self.params[2]
 
     def __repr__(self):
         return (
@@ -437,206 +1326,845 @@ class MeshPoint:
         )
 
 
+class PointStore:
+    """Coordinates of the points of the equations, one (n, 3) array.
+    Points are known by their index in the mesh, only the constrained ones
+    need to be there : the cost of a solve does not depend on the size of
+    the mesh. MeshPoint views of the points are built on demand"""
+
+    def __init__(self, indices=(), coordinates=None):
+        # Index in the mesh of each row
+        self.indices = [int(index) for index in indices]
+        # Index in the mesh -> row
+        self.rows = {index: row for row, index in enumerate(self.indices)}
+        if len(self.rows) != len(self.indices):
+            raise Exception("Points are there more than once")
+        if coordinates is None:
+            coordinates = numpy.zeros((len(self.indices), 3))
+        self.coordinates = numpy.array(coordinates, dtype=float).reshape(-1, 3)
+        if len(self.coordinates) != len(self.indices):
+            raise Exception("One row of coordinates is needed by point")
+        # Row -> MeshPoint view, built on demand
+        self._points = {}
+
+    @classmethod
+    def from_points(cls, points):
+        """Store of the coordinates of a list of MeshPoint, copied"""
+        return cls([p.index for p in points], [p.xyz for p in points])
+
+    @classmethod
+    def from_vertices(cls, vertices, indices):
+        """Store of the vertices of these indices, vertices being indexable
+        by index and with a co (blender BMVertSeq with a lookup table)"""
+        return cls(indices, [tuple(vertices[i].co) for i in indices])
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __contains__(self, index):
+        return index in self.rows
+
+    def __getitem__(self, index):
+        """MeshPoint view of the point index"""
+        row = self.rows[index]
+        point = self._points.get(row)
+        if point is None:
+            point = MeshPoint.view(index, self.coordinates, row)
+            self._points[row] = point
+        return point
+
+    def __iter__(self):
+        """MeshPoint views of all the points, in the order of the rows"""
+        return (self[index] for index in self.indices)
+
+    def __repr__(self):
+        return f"PointStore({len(self)} points)"
+
+    def xyz(self, index):
+        x, y, z = self.coordinates[self.rows[index]].tolist()
+        return (x, y, z)
+
+    def set_values(self, values):
+        """Update coordinates from a dict (point, axis) -> value"""
+        if len(values) == 0:
+            return
+        variables = list(values)
+        rows = [self.rows[p] for p, _ in variables]
+        axes = [axis for _, axis in variables]
+        self.coordinates[rows, axes] = list(values.values())
+
+    def copy(self):
+        return PointStore(self.indices, self.coordinates)
+
+    def moved(self, other, tolerance):
+        """Boolean array of the rows whose point is not in other,
+        or not at the same coordinates with a relative tolerance"""
+        moved = numpy.ones(len(self), dtype=bool)
+        common = [row for row, index in enumerate(self.indices) if index in other]
+        if len(common) == 0:
+            return moved
+        other_rows = [other.rows[self.indices[row]] for row in common]
+        current = self.coordinates[common]
+        reference = other.coordinates[other_rows]
+        moved[common] = numpy.any(
+            numpy.abs(current - reference)
+            > tolerance * numpy.maximum(1, numpy.abs(reference)),
+            axis=1,
+        )
+        return moved
+
+
 class Solver:
     """Solver functionnality"""
 
-    def __init__(self, points):
-        log.logger().debug(f"start: {points}")
-        # List of mesh points
+    def __init__(
+        self,
+        points,
+        backend=DEFAULT_BACKEND,
+        sequencing=DEFAULT_SEQUENCING,
+        symbolic=DEFAULT_SYMBOLIC,
+        method=DEFAULT_METHOD,
+    ):
+        log.logger().debug(f"start: {len(points)} points")
+        # PointStore of the points, built from a list of MeshPoint
+        if not isinstance(points, PointStore):
+            points = PointStore.from_points(points)
         self.points = points
-
-        # List of parameters from list of mesh points
-        self.params = list(itertools.chain(*[pt.params for pt in self.points]))
-        # List of values - same index as the param
-        self.values = list(itertools.chain(*[pt.xyz for pt in self.points]))
-        # Dict of initial values
-        self.initial_values = {}
-        for i in range(len(self.params)):
-            self.initial_values[self.params[i]] = self.values[i]
-
-        # List of equations
-        self.equations = []
+        # Linear algebra backend used by the NewtonSolver
+        self.backend = backend
+        # Solve components block by block, see _solve_component_sequenced
+        self.sequencing = sequencing
+        # Evaluate with sympy equations instead of kernels
+        self.symbolic = symbolic
+        # Newton or Levenberg-Marquardt steps, see NewtonSolver
+        self.method = check_method(method)
+        # Timings of the running solve, see solve(profile=True)
+        self.timings = NO_TIMINGS
+        # Budget of the running solve, see solve(time_budget, cancel)
+        self.budget = NO_BUDGET
+        # Progress callback of the running solve, see solve(progress)
+        self.progress = None
+        self.progress_interval = DEFAULT_PROGRESS_INTERVAL
+        # Biggest work of the rank analysis of the running solve, see solve()
+        self.rank_max_work = RANK_MAX_WORK
+
+        # List of equations records (kind, points, axis, value), see kernels.py
+        # No sympy in it, so it can be sent to another process
+        self.equations_records = []
+        # sympy equations, same index as the records, built on demand
+        self._equations = []
         # equations index -> constraint
         self.equations_constraints = {}
+        # Independent components, computed once
+        self._components = None
+        # Built KernelNewtonSolver of each solved part of the system, reused by
+        # the next solves while the equations structure is the same (see cache.py)
+        self.systems = {}
+        # structure_state() of systems not built yet, loaded from disk_cache.py
+        self.structures = {}
+        # Last successful solve of these points, with "points" a PointStore of
+        # the solved coordinates and "components" the report of each component keyed by
+        # its equations records. Components with the same equations and points
+        # that did not move are not solved again
+        self.last_solve = None
         log.logger().debug("end")
 
-    def _add_equation(self, constraint, equation):
-        self.equations.append(equation)
-        index = len(self.equations) - 1
+    def structure(self):
+        """Hashable description of the equations system without the values of
+        the equations. Solvers with the same structure can share their systems"""
+        return (
+            len(self.points),
+            tuple(
+                (kind, points, axis) for kind, points, axis, _ in self.equations_records
+            ),
+        )
+
+    def points_indices(self):
+        """Sorted indices of the points used by the equations"""
+        return sorted({p for record in self.equations_records for p in record[1]})
+
+    def update(self, solver):
+        """Take the points and the equations values of solver, which must have
+        the same structure, built systems are kept for the next solve"""
+        if solver.structure() != self.structure():
+            raise Exception("Solvers do not have the same structure")
+        self.points = solver.points
+        self.equations_records = solver.equations_records
+        self.equations_constraints = solver.equations_constraints
+        self._equations = []
+        options = (solver.backend, solver.sequencing, solver.symbolic, solver.method)
+        if options != (self.backend, self.sequencing, self.symbolic, self.method):
+            self.backend, self.sequencing, self.symbolic, self.method = options
+            self.systems = {}
+
+    def dump_structure(self):
+        """What only depends on the structure of the equations : the components
+        and the structure_state() of the built systems, see disk_cache.py"""
+        return {
+            "components": self.components(),
+            "systems": {
+                key: system.structure_state() for key, system in self.systems.items()
+            },
+        }
+
+    def load_structure(self, structure):
+        """Reuse a dump_structure() of a solver with the same structure,
+        components and systems are not computed again"""
+        self._components = structure["components"]
+        self.structures = dict(structure["systems"])
+
+    @property
+    def equations(self):
+        """sympy equations, same index as equations_records, built on demand"""
+        for record in self.equations_records[len(self._equations) :]:
+            self.budget.check()
+            self._equations.append(
+                build_equation(record, [self.points[p].params for p in record[1]])
+            )
+        return self._equations
+
+    @property
+    def initial_values(self):
+        """Dict sympy params -> values of all the points"""
+        initial_values = {}
+        for point in self.points:
+            initial_values.update(zip(point.params, point.xyz))
+        return initial_values
+
+    def _add_equation(self, constraint, kind, points, axis=None, value=0):
+        """Add an equation of kind on points, a tuple of indices in self.points
+        - axis: 0, 1, 2 for x, y, z if the kind is about one coordinate
+        - value: distance, coordinate or angle used by the kind"""
+        record = (kind, tuple(points), axis, value)
+        self.equations_records.append(record)
+        index = len(self.equations_records) - 1
         self.equations_constraints[index] = constraint
+        # Structure has changed
+        self._components = None
+        self.systems = {}
+        self.structures = {}
+
+    def custom_equation(self, constraint, kind, points, value=0):
+        """Add an equation of a kind added by kernels.register_kind"""
+        log.logger().debug(f"{kind} {points} {value}")
+        if kind not in RESIDUALS:
+            raise Exception(f"Unknown kind of equation {kind}")
+        self._add_equation(constraint, kind, points, value=value)
 
     def distance_2_vertices(self, constraint, point0, point1, distance):
         """Add a distance constraint between 2 vertices"""
         log.logger().debug(f"{point0} {point1} {distance}")
-        p0 = self.points[point0]
-        p1 = self.points[point1]
-        x0, y0, z0 = p0.x_param, p0.y_param, p0.z_param
-        x1, y1, z1 = p1.x_param, p1.y_param, p1.z_param
         self._add_equation(
-            constraint,
-            sqrt((x0 - x1) ** 2 + (y0 - y1) ** 2 + (z0 - z1) ** 2) - distance,
+            constraint, EQUATION_DISTANCE, (point0, point1), value=distance
         )
 
     def same_distance(self, constraint, point0, point1, point2, point3):
         """Add a same distance constraint between 2 edges p0-p1 and p2-p3"""
         log.logger().debug(f"{point0} {point1} {point2} {point3}")
-        p0 = self.points[point0]
-        p1 = self.points[point1]
-        p2 = self.points[point2]
-        p3 = self.points[point3]
-        x0, y0, z0 = p0.x_param, p0.y_param, p0.z_param
-        x1, y1, z1 = p1.x_param, p1.y_param, p1.z_param
-        x2, y2, z2 = p2.x_param, p2.y_param, p2.z_param
-        x3, y3, z3 = p3.x_param, p3.y_param, p3.z_param
         self._add_equation(
-            constraint,
-            sqrt((x0 - x1) ** 2 + (y0 - y1) ** 2 + (z0 - z1) ** 2)
-            - sqrt((x2 - x3) ** 2 + (y2 - y3) ** 2 + (z2 - z3) ** 2),
+            constraint, EQUATION_SAME_DISTANCE, (point0, point1, point2, point3)
         )
 
     def fix_x(self, constraint, point, x_value):
         """Add a fix x coordinate constraint"""
         log.logger().debug(f"{point} {x_value}")
-        p = self.points[point]
-        self._add_equation(constraint, p.x_param - x_value)
+        self._add_equation(constraint, EQUATION_FIX, (point,), axis=0, value=x_value)
 
     def fix_y(self, constraint, point, y_value):
         """Add a fix y coordinate constraint"""
         log.logger().debug(f"{point} {y_value}")
-        p = self.points[point]
-        self._add_equation(constraint, p.y_param - y_value)
+        self._add_equation(constraint, EQUATION_FIX, (point,), axis=1, value=y_value)
 
     def fix_z(self, constraint, point, z_value):
         """Add a fix z coordinate constraint"""
         log.logger().debug(f"{point} {z_value}")
-        p = self.points[point]
-        self._add_equation(constraint, p.z_param - z_value)
+        self._add_equation(constraint, EQUATION_FIX, (point,), axis=2, value=z_value)
 
     def parallel(self, constraint, point0, point1, point2, point3):
         """Add a parallel constraint between p0-p1 and p2-p3"""
         log.logger().debug(f"{point0} {point1} {point2} {point3}")
-        p0 = self.points[point0]
-        p1 = self.points[point1]
-        p2 = self.points[point2]
-        p3 = self.points[point3]
-
-        # v0 : vector p0-p1
-        v0x = p1.x_param - p0.x_param
-        v0y = p1.y_param - p0.y_param
-        v0z = p1.z_param - p0.z_param
-
-        # v1 : vector p2-p3
-        v1x = p3.x_param - p2.x_param
-        v1y = p3.y_param - p2.y_param
-        v1z = p3.z_param - p2.z_param
-
-        # Cross product of v0 and v1 = Vector(0, 0, 0)
-        self._add_equation(constraint, v0y * v1z - v0z * v1y)
-        self._add_equation(constraint, v0z * v1x - v0x * v1z)
-        self._add_equation(constraint, v0x * v1y - v0y * v1x)
+        # Cross product of v0 and v1 = Vector(0, 0, 0), one equation by axis
+        for axis in range(3):
+            self._add_equation(
+                constraint, EQUATION_PARALLEL, (point0, point1, point2, point3), axis
+            )
 
     def perpendicular(self, constraint, point0, point1, point2, point3):
         """Add a perpendicular constraint between p0-p1 and p2-p3"""
         log.logger().debug(f"{point0} {point1} {point2} {point3}")
-        p0 = self.points[point0]
-        p1 = self.points[point1]
-        p2 = self.points[point2]
-        p3 = self.points[point3]
-
-        # v0 : vector p0-p1
-        v0x = p1.x_param - p0.x_param
-        v0y = p1.y_param - p0.y_param
-        v0z = p1.z_param - p0.z_param
-
-        # v1 : vector p2-p3
-        v1x = p3.x_param - p2.x_param
-        v1y = p3.y_param - p2.y_param
-        v1z = p3.z_param - p2.z_param
-
-        # dot product of v0 and v1 should be 0
-        self._add_equation(constraint, v0x * v1x + v0y * v1y + v0z * v1z)
+        self._add_equation(
+            constraint, EQUATION_PERPENDICULAR, (point0, point1, point2, point3)
+        )
 
     def on_x(self, constraint, point0, point1):
         """Add a on X constraint for vector p0-p1"""
         log.logger().debug(f"{point0} {point1}")
-        p0 = self.points[point0]
-        p1 = self.points[point1]
-        self._add_equation(constraint, p0.y_param - p1.y_param)
-        self._add_equation(constraint, p0.z_param - p1.z_param)
+        self._add_equation(constraint, EQUATION_EQUAL, (point0, point1), axis=1)
+        self._add_equation(constraint, EQUATION_EQUAL, (point0, point1), axis=2)
 
     def on_y(self, constraint, point0, point1):
         """Add a on Y constraint for vector p0-p1"""
         log.logger().debug(f"{point0} {point1}")
-        p0 = self.points[point0]
-        p1 = self.points[point1]
-        self._add_equation(constraint, p0.x_param - p1.x_param)
-        self._add_equation(constraint, p0.z_param - p1.z_param)
+        self._add_equation(constraint, EQUATION_EQUAL, (point0, point1), axis=0)
+        self._add_equation(constraint, EQUATION_EQUAL, (point0, point1), axis=2)
 
     def on_z(self, constraint, point0, point1):
         """Add a on Z constraint for vector p0-p1"""
         log.logger().debug(f"{point0} {point1}")
-        p0 = self.points[point0]
-        p1 = self.points[point1]
-        self._add_equation(constraint, p0.x_param - p1.x_param)
-        self._add_equation(constraint, p0.y_param - p1.y_param)
+        self._add_equation(constraint, EQUATION_EQUAL, (point0, point1), axis=0)
+        self._add_equation(constraint, EQUATION_EQUAL, (point0, point1), axis=1)
 
     def angle(self, constraint, point0, point1, point2, point3, angle):
         """Add an angle constraint between 2 vectors p0-p1 and p2-p3
         - angle is expressed in degrees"""
         log.logger().debug(f"{point0} {point1} {point2} {point3} {angle}")
-        p0 = self.points[point0]
-        p1 = self.points[point1]
-        p2 = self.points[point2]
-        p3 = self.points[point3]
-
-        # v0 : vector p0-p1
-        v0x = p1.x_param - p0.x_param
-        v0y = p1.y_param - p0.y_param
-        v0z = p1.z_param - p0.z_param
-
-        # v1 : vector p2-p3
-        v1x = p3.x_param - p2.x_param
-        v1y = p3.y_param - p2.y_param
-        v1z = p3.z_param - p2.z_param
-
-        # dot product of v0 and v1 / (v0.length * v1.length) = cos(angle in radian)
-        dot_product = v0x * v1x + v0y * v1y + v0z * v1z
-        v0_length = sqrt(v0x ** 2 + v0y ** 2 + v0z ** 2)
-        v1_length = sqrt(v1x ** 2 + v1y ** 2 + v1z ** 2)
-        rad = angle * math.pi / 180
-        self._add_equation(constraint, dot_product / (v0_length * v1_length) - cos(rad))
+        self._add_equation(
+            constraint,
+            EQUATION_ANGLE,
+            (point0, point1, point2, point3),
+            value=angle,
+        )
 
+    def _equations_variables(self, equations_indices):
+        """List of the (point, axis) variables of each equation"""
+        return [equation_variables(self.equations_records[i]) for i in equations_indices]
+
+    def components(self):
+        """Split equations in independent components,
+        return a list of list of equations indices"""
+        if self._components is None:
+            self._components = connected_components(
+                self._equations_variables(range(len(self.equations_records)))
+            )
+        return self._components
+
+    def _component_key(self, equations_indices):
+        return tuple(self.equations_records[i] for i in equations_indices)
+
+    def _unchanged_components(self, components):
+        """Components of the last solve, with the same equations, and
+        points still at their solved coordinates.
+        Return a dict index in components -> last solve report"""
+        if self.last_solve is None:
+            return {}
+        moved = self.points.moved(self.last_solve["points"], SOLVED_TOLERANCE)
+        rows = self.points.rows
+        unchanged = {}
+        for index, equations_indices in enumerate(components):
+            report = self.last_solve["components"].get(
+                self._component_key(equations_indices)
+            )
+            if report is None:
+                continue
+            if report["rank"] is None and self.rank_max_work is None:
+                # Rank analysis skipped and now asked for
+                continue
+            if any(
+                moved[rows[p]]
+                for i in equations_indices
+                for p in self.equations_records[i][1]
+            ):
+                continue
+            # Redundant equations are kept as positions in the component,
+            # the last solve may have other equations before it
+            unchanged[index] = {
+                **report,
+                "redundant": [equations_indices[k] for k in report["redundant"]],
+            }
+        return unchanged
+
+    def _build_system(self, equations_indices, fixed):
+        """NewtonSolver of some equations, see _solve_equations, ready to solve.
+        Return it and, for the sympy equations, the dict param -> (point, axis)"""
+        if self.symbolic:
+            with self.timings.phase(PHASE_EQUATIONS):
+                equations = [self.equations[i] for i in equations_indices]
+                if len(fixed) > 0:
+                    replace = {
+                        self.points[p].params[axis]: _sympy().Float(value)
+                        for (p, axis), value in fixed.items()
+                    }
+                    equations = [equation.xreplace(replace) for equation in equations]
+                system = NewtonSolver(
+                    equations,
+                    self.initial_values,
+                    backend=self.backend,
+                    method=self.method,
+                    timings=self.timings,
+                    budget=self.budget,
+                )
+            params_variables = {
+                param: (point.index, axis)
+                for point in self.points
+                for axis, param in enumerate(point.params)
+            }
+            system.rank_max_work = self.rank_max_work
+            self._set_progress(system, params_variables)
+            return system, params_variables
+
+        with self.timings.phase(PHASE_EQUATIONS):
+            records = [self.equations_records[i] for i in equations_indices]
+            initial_values = {}
+            coordinates, rows = self.points.coordinates, self.points.rows
+            for record in records:
+                for p, axis in equation_variables(record):
+                    initial_values[(p, axis)] = float(coordinates[rows[p], axis])
+            initial_values.update(fixed)
+        key = (tuple(equations_indices), tuple(fixed))
+        system = self.systems.get(key)
+        if system is None:
+            system = KernelNewtonSolver(
+                records,
+                initial_values,
+                backend=self.backend,
+                fixed=fixed.keys(),
+                method=self.method,
+                structure=self.structures.pop(key, None),
+                timings=self.timings,
+                budget=self.budget,
+            )
+            self.systems[key] = system
+        else:
+            system.timings = self.timings
+            system.budget = self.budget
+            system.restart(initial_values, records)
+        system.rank_max_work = self.rank_max_work
+        self._set_progress(system, None)
+        return system, None
+
+    def _set_progress(self, system, params_variables):
+        """Give the progress callback of the solve to a system, its values
+        are converted to a dict (point, axis) -> value"""
+        system.progress = None
+        system.progress_interval = self.progress_interval
+        if self.progress is None:
+            return
+
+        def progress(values):
+            self.progress(self._variables_values(values, params_variables))
+
+        system.progress = progress
+
+    @staticmethod
+    def _variables_values(values, params_variables):
+        """Dict (point, axis) -> float of the values of a system"""
+        return {
+            param if params_variables is None else params_variables[param]: float(value)
+            for param, value in values.items()
+        }
+
+    def _solve_equations(self, equations_indices, fixed):
+        """Solve some equations, equations_indices are indices in
+        self.equations_records, fixed is a dict (point, axis) -> value of variables
+        used as constants.
+        Returned "values" is a dict (point, axis) -> value,
+        "redundant" and "equations_in_error" are indices in self.equations_records"""
+        try:
+            system, params_variables = self._build_system(equations_indices, fixed)
+        except Interrupted as e:
+            return _interrupted(e.reason)
+        ret = system.solve()
+
+        ret["history"] = convergence.remap(ret["history"], equations_indices)
+        # Solved, or the best values of an interrupted solve
+        if "values" in ret:
+            ret["values"] = self._variables_values(ret["values"], params_variables)
+        if ret["solved"]:
+            if self.progress is not None:
+                self.progress(ret["values"])
+            ret["redundant"] = [equations_indices[i] for i in ret["redundant"]]
+        else:
+            ret["equations_in_error"] = sorted(
+                equations_indices[i] for i in ret["equations_in_error"]
+            )
+        return ret
+
+    def _solve_component(self, equations_indices):
+        """Solve equations of one component, equations_indices are indices
+        in self.equations_records. Returned "values" is a dict (point, axis) -> value
+        and "equations_in_error" are indices in self.equations_records"""
+        if self.sequencing:
+            return self._solve_component_sequenced(equations_indices)
+        return self._solve_equations(equations_indices, {})
+
+    def _solve_component_sequenced(self, equations_indices):
+        """Solve equations of one component as a sequence of smaller systems
+        from its Dulmage-Mendelsohn decomposition : the over-determined part first
+        then each square block in order, then the under-determined part.
+        Values solved by a part are fixed for the next ones.
+        Same returned value as _solve_component, with a "sequence" report"""
+        dm = dulmage_mendelsohn(self._equations_variables(equations_indices))
+        parts = []
+        if len(dm["over"][0]) > 0:
+            parts.append(("over", dm["over"][0]))
+        for rows, _ in dm["blocks"]:
+            parts.append(("block", rows))
+        if len(dm["under"][0]) > 0:
+            parts.append(("under", dm["under"][0]))
+
+        values = {}
+        total = {"rank": 0, "rank_ok": True, "dof": 0}
+        iterations = 0
+        redundant = []
+        histories = []
+        sequence = {
+            "over": [equations_indices[i] for i in dm["over"][0]],
+            "blocks": [len(rows) for rows, _ in dm["blocks"]],
+            "under": [equations_indices[i] for i in dm["under"][0]],
+        }
+        for name, rows in parts:
+            ret = self._solve_equations([equations_indices[i] for i in rows], values)
+            iterations += ret["iterations"]
+            histories.append(ret["history"])
+            if not ret["solved"]:
+                sequence["failed"] = name
+                ret["sequence"] = sequence
+                ret["iterations"] = iterations
+                ret["history"] = convergence.concatenate(histories)
+                if ret["reason"] in REASONS:
+                    # Partial result : the parts solved and the best values
+                    ret["values"] = {**values, **ret.get("values", {})}
+                return ret
+            values.update(ret["values"])
+            _add_rank(total, ret)
+            redundant.extend(ret["redundant"])
+        return {
+            "solved": True,
+            "values": values,
+            "dof": total["dof"] if total["rank_ok"] else None,
+            "rank_ok": total["rank_ok"],
+            "rank": total["rank"],
+            "redundant": sorted(redundant),
+            "iterations": iterations,
+            "history": convergence.concatenate(histories),
+            "sequence": sequence,
+        }
+
+    def _component_payload(self, equations_indices):
+        """Describe the equations of a component with plain lists
+        to be solved by solve_payload in another process.
+        Points are renumbered from 0, "points" gives their index in self.points"""
+        local_points = {}
+        equations = []
+        for i in equations_indices:
+            kind, points, axis, value = self.equations_records[i]
+            local = []
+            for p in points:
+                if p not in local_points:
+                    local_points[p] = len(local_points)
+                local.append(local_points[p])
+            equations.append((kind, local, axis, value))
+        return {
+            "backend": self.backend,
+            "sequencing": self.sequencing,
+            "symbolic": self.symbolic,
+            "method": self.method,
+            "profile": self.timings.enabled,
+            "rank_max_work": self.rank_max_work,
+            # Wall clock time, shared by the processes
+            "deadline": (
+                None
+                if self.budget.deadline is None
+                else time.time() + self.budget.remaining()
+            ),
+            "equations": equations,
+            "points": list(local_points),
+            "coordinates": [list(self.points.xyz(p)) for p in local_points],
+        }
+
+    def _payload_ret(self, equations_indices, payload, ret):
+        """Convert back the return of solve_payload for this solver"""
+        if "timings" in ret:
+            self.timings.merge(ret.pop("timings"))
+        ret["history"] = convergence.remap(ret["history"], equations_indices)
+        if "values" in ret:
+            points = payload["points"]
+            ret["values"] = {
+                (points[p], axis): value for p, axis, value in ret["values"]
+            }
+        if ret["solved"]:
+            ret["redundant"] = [equations_indices[i] for i in ret["redundant"]]
+        else:
+            ret["equations_in_error"] = [
+                equations_indices[i] for i in ret["equations_in_error"]
+            ]
+        return ret
+
+    def _solve_components_in_pool(self, components, workers):
+        """Solve components with a pool of workers processes,
+        return the list of results, same index as components"""
+        payloads = [self._component_payload(c) for c in components]
+        # Small components are grouped to amortize inter-process communication
+        chunksize = max(1, len(payloads) // (workers * 4))
+        chunks = [
+            payloads[i : i + chunksize] for i in range(0, len(payloads), chunksize)
+        ]
+        # Workers stop on the deadline by themselves, but the cancel token
+        # is only seen here : running workers are then abandoned
+        poll = None if self.budget.token is None else CANCEL_POLL_INTERVAL
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        futures = []
+        with self.timings.phase(PHASE_WORKERS):
+            try:
+                futures = [executor.submit(solve_payloads, chunk) for chunk in chunks]
+                pending = futures
+                while len(pending) > 0 and not self.budget.cancelled:
+                    _, pending = concurrent.futures.wait(pending, timeout=poll)
+            finally:
+                # Not started chunks are dropped, no cancel_futures before python 3.9
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=not self.budget.cancelled)
+        results = []
+        for future, chunk in zip(futures, chunks):
+            if future.done() and not future.cancelled():
+                results.extend(future.result())
+            else:
+                results.extend(_interrupted(REASON_CANCELLED) for _ in chunk)
+        return [
+            self._payload_ret(c, payload, ret)
+            for c, payload, ret in zip(components, payloads, results)
+        ]
 
-    def solve(self):
+    def solve(
+        self,
+        workers=None,
+        profile=False,
+        history=False,
+        time_budget=None,
+        cancel=None,
+        progress=None,
+        progress_interval=DEFAULT_PROGRESS_INTERVAL,
+        rank_max_work=RANK_MAX_WORK,
+    ):
         """Solve and return an object representing the solve operation with
         - "solved" boolean, True if the solve process is a success
-        - "points", if "solved" is True, list of MeshPoint with up to date values
+        - "points", if "solved" is True, list of MeshPoint with up to date values,
+        views on self.points
         - "reason", if "solved" is False, try to explain why it failed
-        - "equations_in_error", if "solved" is False, list of equations in error"""
-        log.logger().debug(f"start: {self.equations} {self.initial_values}")
-        newton_solver = NewtonSolver(self.equations, self.initial_values)
-        ret = newton_solver.solve()
-        if ret["solved"]:
-            values = ret["values"]
-            # merge values in a list of MeshPoint
-            for point in self.points:
-                point.x_value = values.get(point.x_param, point.x_value)
-                point.y_value = values.get(point.y_param, point.y_value)
-                point.z_value = values.get(point.z_param, point.z_value)
-            ret["points"] = self.points
-            # TODO if rank_ok is False maybe I want
-            # self.find_which_to_remove_to_fix_jacobian() ?
-            del ret["values"]
+        - "equations_in_error", if "solved" is False, list of equations in error
+        - "redundant", if "solved" is True, list of the constraints with an equation
+        depending on the other ones (duplicated or implied by the others)
+        - "rank", "rank_ok" and "dof", if "solved" is True, rank of the jacobian,
+        whether it is full and degrees of freedom, None if unknown : the rank
+        analysis of a component is skipped over rank_max_work
+        - "components", list of the solve report of each independent component
+        - "iterations", total number of jacobian evaluations of the solve
+        - "timings", if profile is True, dict with "times" the time in seconds of
+        each phase of the solve and "counts" (iterations, jacobian evaluations,
+        eliminated variables...), see timings.py. Also logged in one line
+        - "history", if history is True, convergence history of the solved
+        components, see convergence.py, to be exported with convergence.to_csv
+        or convergence.to_json
+        - "partial_points", if "reason" is "timeout" or "cancelled", list of MeshPoint
+        with the best values found before the solve was stopped, not applied to
+        self.points, and "residual" the norm of the equations values at them
+        If there is a last solve (self.last_solve), only the components changed
+        since, by their equations or by their points coordinates, are solved.
+
+        Independent components of the equations system are solved separately, so
+        a failure only reports the constraints of the component that failed.
+        - workers: number of processes used to solve the components in parallel,
+        default_workers() if None, 1 to solve everything in this process
+        - profile: measure the phases of the solve, returned in timings
+        - history: return the convergence history
+        - time_budget: seconds after which the solve is stopped, None for no limit
+        - cancel: budget.CancelToken to stop the solve from another thread
+        - progress: called with a dict (point, axis) -> value of the current values
+        of a component every progress_interval iterations, and of its solution once
+        solved, from the solving thread. Not called for the components solved by
+        the workers processes
+        - rank_max_work: biggest rank.factorization_work of the rank analysis of
+        a component, None for no limit"""
+        self.timings = Timings() if profile else NO_TIMINGS
+        if time_budget is not None or cancel is not None:
+            self.budget = Budget(time_budget, cancel)
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.rank_max_work = rank_max_work
+        try:
+            with self.timings.phase(PHASE_OTHER):
+                ret = self._solve(workers, history)
+        finally:
+            timings, self.timings = self.timings, NO_TIMINGS
+            self.budget = NO_BUDGET
+            self.progress = None
+        if profile:
+            ret["timings"] = timings.as_dict()
+            log.logger().debug(f"timings: {timings}")
+        return ret
+
+    def _solve(self, workers, history):
+        log.logger().debug(f"start: {self.equations_records}")
+        with self.timings.phase(PHASE_COMPONENTS):
+            components = self.components()
+            unchanged = self._unchanged_components(components)
+        if workers is None:
+            workers = default_workers()
+        log.logger().debug(f"{len(components)} components, {workers} workers")
+        to_solve = [c for i, c in enumerate(components) if i not in unchanged]
+        log.logger().debug(f"{len(unchanged)} components unchanged")
+        self.timings.count("components", len(components))
+        self.timings.count("unchanged_components", len(unchanged))
+        if workers > 1 and len(to_solve) > 1:
+            solved = self._solve_components_in_pool(to_solve, workers)
+        else:
+            solved = []
+            for c in to_solve:
+                reason = self.budget.reason()
+                if reason is None:
+                    solved.append(self._solve_component(c))
+                else:
+                    solved.append(_interrupted(reason))
+        solved = iter(solved)
+        results = []
+        for i in range(len(components)):
+            if i in unchanged:
+                ret = dict(unchanged[i])
+                ret.update(
+                    {"solved": True, "values": {}, "iterations": 0, "unchanged": True}
+                )
+                results.append(ret)
+            else:
+                results.append(next(solved))
+
+        values = {}
+        total = {"rank": 0, "rank_ok": True, "dof": 0}
+        iterations = 0
+        redundant = []
+        failed = []
+        reports = []
+        histories = []
+        for index, (equations_indices, ret) in enumerate(zip(components, results)):
+            if history and "history" in ret:
+                component_history = ret["history"].copy()
+                component_history[:, convergence.COMPONENT] = index
+                histories.append(component_history)
+            report = {
+                "equations": equations_indices,
+                "solved": ret["solved"],
+                "iterations": ret["iterations"],
+            }
+            iterations += ret["iterations"]
+            if ret["solved"]:
+                values.update(ret["values"])
+                _add_rank(total, ret)
+                redundant.extend(ret["redundant"])
+                report["rank"] = ret["rank"]
+                report["dof"] = ret["dof"]
+                report["redundant"] = ret["redundant"]
+                report["unchanged"] = ret.get("unchanged", False)
+            else:
+                failed.append(ret)
+                report["reason"] = ret["reason"]
+                report["equations_in_error"] = ret["equations_in_error"]
+                if "residual" in ret:
+                    report["residual"] = ret["residual"]
+            if "sequence" in ret:
+                report["sequence"] = ret["sequence"]
+            reports.append(report)
+
+        if len(failed) == 0:
+            self.points.set_values(values)
+            self.last_solve = {
+                "points": self.points.copy(),
+                "components": {
+                    self._component_key(c): {
+                        "rank": ret["rank"],
+                        "rank_ok": ret["rank_ok"],
+                        "dof": ret["dof"],
+                        # Positions in the equations of the component
+                        "redundant": [c.index(i) for i in ret["redundant"]],
+                    }
+                    for c, ret in zip(components, results)
+                },
+            }
+            ret = {
+                "solved": True,
+                "points": list(self.points),
+                "dof": total["dof"] if total["rank_ok"] else None,
+                "rank_ok": total["rank_ok"],
+                "rank": total["rank"],
+                "redundant": list(
+                    dict.fromkeys(self.equations_constraints[i] for i in sorted(redundant))
+                ),
+                "iterations": iterations,
+                "components": reports,
+            }
+            if history:
+                ret["history"] = convergence.concatenate(histories)
             log.logger().debug(f"OK ret: {ret}")
             return ret
         else:
             # solve failed :(
-            ret["equations_in_error"] = [
-                self.equations_constraints[i] for i in ret["equations_in_error"]
-            ]
+            equations_in_error = []
+            for component_ret in failed:
+                equations_in_error.extend(component_ret["equations_in_error"])
+            interrupted = [r["reason"] for r in failed if r["reason"] in REASONS]
+            ret = {
+                "solved": False,
+                "reason": interrupted[0] if interrupted else failed[0]["reason"],
+                "equations_in_error": [
+                    self.equations_constraints[i] for i in equations_in_error
+                ],
+                "iterations": iterations,
+                "components": reports,
+            }
+            if interrupted:
+                # Solved components and best values of the interrupted ones
+                partial = self.points.copy()
+                for component_ret in results:
+                    partial.set_values(component_ret.get("values", {}))
+                ret["partial_points"] = list(partial)
+                ret["residual"] = float(numpy.linalg.norm(self.residuals(partial)))
+            if history:
+                ret["history"] = convergence.concatenate(histories)
             log.logger().debug(f"NOK ret: {ret}")
             return ret
 
-    def find_which_to_remove_to_fix_jacobian():
-        # TODO
-        raise Exception("TODO")
+    def residuals(self, points=None):
+        """Values of all the equations, same index as self.equations_records,
+        at the coordinates of points (a PointStore), self.points if None.
+        nan for the equations which cannot be evaluated there"""
+        points = self.points if points is None else points
+        coordinates, rows = points.coordinates, points.rows
+        residuals = numpy.zeros(len(self.equations_records))
+        groups = {}
+        for i, record in enumerate(self.equations_records):
+            kind, _, axis, value = record
+            group = groups.setdefault(kind, ([], [], [], []))
+            group[0].append(i)
+            group[1].append(
+                [coordinates[rows[p], a] for p, a in equation_points_variables(record)]
+            )
+            group[2].append(axis if axis is not None else 0)
+            group[3].append(value)
+        for kind, (indices, q, axes, values) in groups.items():
+            q = numpy.array(q, dtype=float)
+            axes = numpy.array(axes)
+            values = numpy.array(values, dtype=float)
+            try:
+                r, _ = batch_residual_and_gradient(kind, q, axes, values)
+                residuals[indices] = r
+            except EVALUATION_ERRORS:
+                # Degenerate coordinates (coincident points...), nan for the
+                # equations which cannot be evaluated
+                for k, i in enumerate(indices):
+                    try:
+                        residuals[i] = batch_residual_and_gradient(
+                            kind, q[k : k + 1], axes[k : k + 1], values[k : k + 1]
+                        )[0][0]
+                    except EVALUATION_ERRORS:
+                        residuals[i] = math.nan
+        return residuals
+
+    def find_which_to_remove_to_fix_jacobian(self, ret=None):
+        """Constraints to remove to get a full rank jacobian, from ret the result
+        of self.solve() (solved now if None) : the redundant constraints if
+        solved, else the conflicting ones (see NewtonSolver.find_conflicting)"""
+        if ret is None or (ret["solved"] and ret["rank"] is None):
+            # Solved again with the full rank analysis
+            ret = self.solve(rank_max_work=None)
+        if ret["solved"]:
+            return ret["redundant"]
+        return ret["equations_in_error"]
@@ -0,0 +1,447 @@
+# Benchmark of the solver on synthetic constraints systems
+#
+# Families of systems generated at any size, from a target geometry so they
+# are consistent, solved from a perturbed start :
+# - grid: braced square grid of distances, in a plane fixed in Z
+# - truss: 3D beam of cubic bays, distances on the bars
+# - angle_chain: chain of distances and angles between consecutive segments
+# - sketch: planar sketch of rectangles, on axis, fix and distances
+# - overconstrained: random distances between random points, more equations
+# than degrees of freedom
+#
+# Each case records the wall time and the peak memory (tracemalloc, in a
+# second run as it slows down the solve) of each phase, and the iterations.
+# The solve is profiled (Solver.solve(profile=True)), the time of its own
+# phases and its counters are recorded too.
+# Results are written to a JSON file, to be compared with a baseline, from
+# the directory containing the addon :
+#
+#   PYTHONPATH=<addon>/tests/mock python -m <addon>.tests.benchmark \
+#       --sizes 10 1000 100000 --output new.json --baseline baseline.json
+
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+from ..backends import (
+    BACKEND_AUTO,
+    BACKEND_NUMPY,
+    BACKEND_PYTHON,
+    BACKEND_SPARSE,
+    get_backend,
+    sparse_available,
+)
+from ..solver import METHOD_NEWTON, PointStore, Solver
+
+FORMAT_VERSION = 2
+# Number of equations of the cases, a few minutes. Bigger ones, up to
+# 100000, take hours with all the families
+DEFAULT_SIZES = [10, 100, 1000]
+# Biggest number of equations of the dense backends, a * a.transpose()
+# and its factorization are too big over it
+MAX_EQUATIONS = {BACKEND_PYTHON: 1000, BACKEND_NUMPY: 5000}
+# Noise added to the target coordinates for the start of the solve
+START_NOISE = 0.05
+# Ratio of the time of a case to its baseline reported as a regression
+DEFAULT_THRESHOLD = 1.2
+# Number of equations of the Solver methods adding more than one
+EQUATIONS_BY_CONSTRAINT = {"on_x": 2, "on_y": 2, "on_z": 2, "parallel": 3}
+
+
+class System:
+    """Points and constraints of a synthetic system : target coordinates,
+    start coordinates and a list of (Solver method name, arguments)"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.target = []
+        self.constraints = []
+
+    def point(self, x, y, z):
+        self.target.append((x, y, z))
+        return len(self.target) - 1
+
+    def add(self, name, *args):
+        self.constraints.append((name, args))
+
+    def distance(self, p0, p1):
+        self.add("distance_2_vertices", p0, p1, _distance(self.target, p0, p1))
+
+    def angle(self, p0, p1, p2, p3):
+        v0 = numpy.subtract(self.target[p1], self.target[p0])
+        v1 = numpy.subtract(self.target[p3], self.target[p2])
+        cos = v0 @ v1 / (numpy.linalg.norm(v0) * numpy.linalg.norm(v1))
+        self.add(
+            "angle", p0, p1, p2, p3, math.degrees(math.acos(max(-1, min(1, cos))))
+        )
+
+    def fix(self, p, axes="xyz"):
+        for axis in axes:
+            self.add(f"fix_{axis}", p, self.target[p]["xyz".index(axis)])
+
+    def start(self):
+        """Target coordinates with noise"""
+        noise = self.rng.normal(scale=START_NOISE, size=(len(self.target), 3))
+        return numpy.array(self.target, dtype=float).reshape(-1, 3) + noise
+
+    def nb_equations(self):
+        return sum(EQUATIONS_BY_CONSTRAINT.get(name, 1) for name, _ in self.constraints)
+
+
+def _distance(points, p0, p1):
+    return float(numpy.linalg.norm(numpy.subtract(points[p1], points[p0])))
+
+
+def _jitter(rng):
+    return rng.uniform(-0.2, 0.2)
+
+
+def grid(nb_equations, rng):
+    """Square grid of distances in a plane fixed in Z, about 3 equations per
+    point. Squares of the first row and column are braced by a diagonal :
+    the grid is rigid without redundant equations"""
+    n = max(2, round(math.sqrt(nb_equations / 3)))
+    s = System(rng)
+    for i in range(n):
+        for j in range(n):
+            s.point(i + _jitter(rng), j + _jitter(rng), 0.0)
+    for i in range(n):
+        for j in range(n):
+            p = i * n + j
+            s.fix(p, "z")
+            if i + 1 < n:
+                s.distance(p, p + n)
+            if j + 1 < n:
+                s.distance(p, p + 1)
+            if (i == 0 or j == 0) and i + 1 < n and j + 1 < n:
+                s.distance(p, p + n + 1)
+    s.fix(0, "xy")
+    s.fix(1, "x")
+    return s
+
+
+def truss(nb_equations, rng):
+    """3D lattice of bars standing on its fixed bottom layer, 3 equations
+    per point : each point is linked by 3 bars to points below or before
+    it, rigid and without redundant equations"""
+    n = max(2, round(math.pow(nb_equations / 3, 1 / 3)))
+    s = System(rng)
+
+    def index(i, j, k):
+        return (k * n + j) * n + i
+
+    for k in range(n):
+        for j in range(n):
+            for i in range(n):
+                s.point(i + _jitter(rng), j + _jitter(rng), k + _jitter(rng))
+    for k in range(n):
+        for j in range(n):
+            for i in range(n):
+                p = index(i, j, k)
+                if k == 0:
+                    s.fix(p)
+                    continue
+                s.distance(index(i, j, k - 1), p)
+                s.distance(index(i - 1, j, k) if i > 0 else index(1, j, k - 1), p)
+                s.distance(index(i, j - 1, k) if j > 0 else index(i, 1, k - 1), p)
+    return s
+
+
+def angle_chain(nb_equations, rng):
+    """Planar chain, 3 equations per point : distance, angle between the
+    consecutive segments and fix z"""
+    n = max(3, round(nb_equations / 3))
+    s = System(rng)
+    direction = 0.0
+    x = y = 0.0
+    for i in range(n):
+        s.point(x, y, 0.0)
+        # Not aligned segments, the angle equation is flat at 0 degrees
+        direction += rng.choice((-1, 1)) * rng.uniform(0.3, 1.2)
+        length = rng.uniform(0.5, 1.5)
+        x, y = x + length * math.cos(direction), y + length * math.sin(direction)
+    for i in range(n):
+        s.fix(i, "z")
+        if i + 1 < n:
+            s.distance(i, i + 1)
+        if i + 2 < n:
+            s.angle(i, i + 1, i + 1, i + 2)
+    s.fix(0, "xy")
+    return s
+
+
+def sketch(nb_equations, rng):
+    """Row of rectangles in the XY plane, about 14 equations each : on x and
+    on y edges, width and height, fix z, distance and on x to the next one"""
+    nb_rectangles = max(1, round(nb_equations / 14))
+    s = System(rng)
+    x = 0.0
+    for r in range(nb_rectangles):
+        width, height = rng.uniform(0.5, 2), rng.uniform(0.5, 2)
+        p0 = s.point(x, 0.0, 0.0)
+        p1 = s.point(x + width, 0.0, 0.0)
+        p2 = s.point(x + width, height, 0.0)
+        p3 = s.point(x, height, 0.0)
+        s.add("on_x", p0, p1)
+        s.add("on_x", p3, p2)
+        s.add("on_y", p0, p3)
+        s.add("on_y", p1, p2)
+        s.distance(p0, p1)
+        s.distance(p0, p3)
+        s.fix(p0, "z")
+        if r > 0:
+            s.distance(p0 - 3, p0)
+            s.add("on_x", p0 - 3, p0)
+        x += width + rng.uniform(0.5, 1)
+    s.fix(0, "xy")
+    return s
+
+
+def overconstrained(nb_equations, rng):
+    """Random points and distances between random pairs, 1.5 equations per
+    degree of freedom, redundant but consistent"""
+    n = max(4, round(nb_equations / 4.5))
+    s = System(rng)
+    for i in range(n):
+        s.point(*rng.uniform(0, math.pow(n, 1 / 3), size=3))
+    # A chain so everything is connected, then random pairs
+    for i in range(n - 1):
+        s.distance(i, i + 1)
+    while len(s.constraints) < nb_equations - 6:
+        p0, p1 = rng.choice(n, size=2, replace=False)
+        s.distance(int(p0), int(p1))
+    s.fix(0)
+    s.fix(1, "yz")
+    s.fix(2, "z")
+    return s
+
+
+FAMILIES = {
+    "grid": grid,
+    "truss": truss,
+    "angle_chain": angle_chain,
+    "sketch": sketch,
+    "overconstrained": overconstrained,
+}
+
+
+def generate(family, nb_equations, seed=0):
+    """System of family with about nb_equations equations"""
+    if family not in FAMILIES:
+        raise Exception(f"Unknown family '{family}'")
+    return FAMILIES[family](nb_equations, numpy.random.default_rng(seed))
+
+
+def build_solver(system, backend, method, start=None):
+    """Solver of system, from start coordinates or the target ones"""
+    coordinates = system.target if start is None else start
+    s = Solver(
+        PointStore(range(len(coordinates)), coordinates),
+        backend=backend,
+        method=method,
+    )
+    for constraint, (name, args) in enumerate(system.constraints):
+        getattr(s, name)(constraint, *args)
+    return s
+
+
+def _skipped(backend, nb_equations):
+    """Reason to skip a case, None to run it"""
+    if backend == BACKEND_AUTO:
+        backend = get_backend(BACKEND_AUTO, nb_equations).name
+    if backend == BACKEND_SPARSE and not sparse_available():
+        return "scipy not installed"
+    if nb_equations > MAX_EQUATIONS.get(backend, nb_equations):
+        return f"too big for {backend}"
+    return None
+
+
+def _run_phases(system, start, backend, method, workers, memory):
+    """Run the phases of a case, return (times, peak memory, solve result)"""
+    times = {}
+    peaks = {}
+    if memory:
+        tracemalloc.start()
+
+    def phase(name, f):
+        if memory:
+            tracemalloc.reset_peak()
+        t = time.perf_counter()
+        ret = f()
+        times[name] = time.perf_counter() - t
+        if memory:
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+        return ret
+
+    try:
+        s = phase("setup", lambda: build_solver(system, backend, method, start))
+        phase("components", s.components)
+        ret = phase("solve", lambda: s.solve(workers=workers, profile=True))
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return times, peaks, ret
+
+
+def run_case(family, size, backend, method, workers=1, memory=True, seed=0):
+    """Generate and solve a case, return its record"""
+    system = generate(family, size, seed)
+    record = {
+        "family": family,
+        "size": size,
+        "backend": backend,
+        "method": method,
+        "workers": workers,
+        "nb_points": len(system.target),
+        "nb_equations": system.nb_equations(),
+    }
+    skipped = _skipped(backend, record["nb_equations"])
+    if skipped is not None:
+        record["skipped"] = skipped
+        return record
+
+    start = system.start()
+    times, _, ret = _run_phases(system, start, backend, method, workers, False)
+    record["times"] = times
+    record["solve_phases"] = ret["timings"]["times"]
+    record["counts"] = ret["timings"]["counts"]
+    record["solved"] = ret["solved"]
+    record["iterations"] = ret["iterations"]
+    if ret["solved"]:
+        record["rank"] = ret["rank"]
+        record["redundant"] = len(ret["redundant"])
+    else:
+        record["reason"] = ret["reason"]
+    if memory:
+        _, peaks, _ = _run_phases(system, start, backend, method, workers, True)
+        record["peak_memory"] = peaks
+    return record
+
+
+def case_key(record):
+    return (
+        record["family"],
+        record["size"],
+        record["backend"],
+        record["method"],
+        record["workers"],
+    )
+
+
+def run(
+    families=None,
+    sizes=None,
+    backends=(BACKEND_AUTO,),
+    methods=(METHOD_NEWTON,),
+    workers=1,
+    memory=True,
+    seed=0,
+    progress=None,
+):
+    """Run all the cases, return the benchmark results
+    - progress: called with each case record"""
+    results = {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cases": [],
+    }
+    for family in families or list(FAMILIES):
+        for size in sizes or DEFAULT_SIZES:
+            for backend in backends:
+                for method in methods:
+                    record = run_case(
+                        family, size, backend, method, workers, memory, seed
+                    )
+                    results["cases"].append(record)
+                    if progress is not None:
+                        progress(record)
+    return results
+
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """Compare the total time of the cases of results with the same cases of
+    baseline. Return a list of (case key, time ratio, regression), regression
+    if the ratio is over threshold or the case is not solved anymore"""
+    reference = {case_key(r): r for r in baseline["cases"] if "times" in r}
+    comparison = []
+    for record in results["cases"]:
+        key = case_key(record)
+        if "times" not in record or key not in reference:
+            continue
+        before = reference[key]
+        ratio = sum(record["times"].values()) / max(
+            sum(before["times"].values()), 1e-9
+        )
+        regression = ratio > threshold or (before["solved"] and not record["solved"])
+        comparison.append((key, ratio, regression))
+    return comparison
+
+
+def format_record(record):
+    name = "{family} {size} {backend} {method}".format(**record)
+    if "skipped" in record:
+        return f"{name}: skipped, {record['skipped']}"
+    times = " ".join(f"{k} {v:.3f}s" for k, v in record["times"].items())
+    line = (
+        f"{name}: {record['nb_equations']} equations, "
+        f"{'solved' if record['solved'] else record['reason']}, "
+        f"{record['iterations']} iterations, {times}"
+    )
+    if "peak_memory" in record:
+        line += f", peak {max(record['peak_memory'].values()) / 1e6:.1f} MB"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the solver on synthetic constraints systems"
+    )
+    parser.add_argument("--families", nargs="+", choices=list(FAMILIES))
+    parser.add_argument("--sizes", nargs="+", type=int, help="number of equations")
+    parser.add_argument("--backends", nargs="+", default=[BACKEND_AUTO])
+    parser.add_argument("--methods", nargs="+", default=[METHOD_NEWTON])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="do not measure the peak memory"
+    )
+    parser.add_argument("--output", help="JSON file of the results")
+    parser.add_argument("--baseline", help="JSON file of results to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.families,
+        args.sizes,
+        args.backends,
+        args.methods,
+        args.workers,
+        not args.no_memory,
+        args.seed,
+        progress=lambda record: print(format_record(record), flush=True),
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = 0
+        for key, ratio, regression in compare(baseline, results, args.threshold):
+            regressions += regression
+            flag = " REGRESSION" if regression else ""
+            print(f"{' '.join(str(k) for k in key)}: x{ratio:.2f}{flag}")
+        return 1 if regressions > 0 else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,3 +16,11 @@ class SpaceView3D:
 
 class Panel:
     pass
+
+
+class AddonPreferences:
+    pass
+
+
+class Object:
+    pass
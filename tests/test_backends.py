@@ -0,0 +1,317 @@
+import numpy
+import pytest
+from .. import backends
+from ..backends import (
+    BACKEND_PYTHON,
+    BACKEND_NUMPY,
+    BACKEND_SPARSE,
+    BACKEND_AUTO,
+    BACKEND_KRYLOV,
+    BACKEND_KRYLOV_CHOLESKY,
+    SPARSE_MIN_EQUATIONS,
+    get_backend,
+    sparse_available,
+)
+from sympy import symbols, sqrt
+from .. import krylov
+from ..krylov import (
+    MIN_FORCING_TERM,
+    PRECONDITIONER_INCOMPLETE_CHOLESKY,
+    PRECONDITIONER_JACOBI,
+)
+from ..solver import METHOD_NEWTON, METHODS, Solver, NewtonSolver, MeshPoint
+from .benchmark import build_solver, generate
+from .test_solver import Vector3, equal_float
+
+ALL_BACKENDS = [BACKEND_PYTHON, BACKEND_NUMPY] + (
+    [BACKEND_SPARSE] if sparse_available() else []
+)
+# Approximate steps, only the solutions are the same
+KRYLOV_BACKENDS = [BACKEND_KRYLOV, BACKEND_KRYLOV_CHOLESKY]
+
+
+def newton_steps(equations, initial_values, backend, nb_steps):
+    """Run nb_steps newton steps and return the list of x, the steps"""
+    s = NewtonSolver(equations, dict(initial_values), backend=backend)
+    s.prepare_matrix()
+    steps = []
+    for _ in range(nb_steps):
+        s._eval_b()
+        s._eval_jacobian()
+        s._solve_least_squares()
+        steps.append([float(v) for v in s.x])
+        for i in range(s.nb_params):
+            s.values[s.params[i]] -= float(s.x[i])
+    return steps
+
+
+def assert_same_steps(equations, initial_values, nb_steps=3):
+    reference = newton_steps(equations, initial_values, BACKEND_PYTHON, nb_steps)
+    for backend in ALL_BACKENDS:
+        steps = newton_steps(equations, initial_values, backend, nb_steps)
+        for reference_step, step in zip(reference, steps):
+            for reference_value, value in zip(reference_step, step):
+                assert equal_float(value, reference_value)
+
+
+def dense(backend, a):
+    if backend == BACKEND_SPARSE:
+        return a.toarray()
+    return a
+
+
+def test_get_backend():
+    assert get_backend(BACKEND_PYTHON).name == BACKEND_PYTHON
+    assert get_backend(BACKEND_NUMPY).name == BACKEND_NUMPY
+    assert get_backend(BACKEND_AUTO, 10).name == BACKEND_NUMPY
+    assert get_backend(BACKEND_KRYLOV).name == BACKEND_KRYLOV
+    assert get_backend(BACKEND_KRYLOV_CHOLESKY).name == BACKEND_KRYLOV_CHOLESKY
+    if sparse_available():
+        assert get_backend(BACKEND_AUTO, SPARSE_MIN_EQUATIONS).name == BACKEND_SPARSE
+    with pytest.raises(Exception):
+        get_backend("nope")
+
+
+def test_get_backend_auto_without_scipy(monkeypatch):
+    monkeypatch.setattr(backends, "sparse_available", lambda: False)
+    assert get_backend(BACKEND_AUTO, 10).name == BACKEND_NUMPY
+    backend = get_backend(BACKEND_AUTO, SPARSE_MIN_EQUATIONS)
+    assert backend.name == BACKEND_KRYLOV_CHOLESKY
+
+
+@pytest.mark.parametrize("backend", ALL_BACKENDS)
+def test_backend_compute_aat(backend):
+    b = get_backend(backend)
+    nonzero = [(0, 0), (0, 1), (0, 2), (1, 0), (1, 2)]
+    a = b.jacobian(2, 3, nonzero)
+    b.set_jacobian(a, nonzero, [1, 2, 3, 4, 6])
+    rows, cols, values = b.nonzero_terms(a)
+    assert sorted(zip(rows.tolist(), cols.tolist(), values.tolist())) == [
+        (0, 0, 1),
+        (0, 1, 2),
+        (0, 2, 3),
+        (1, 0, 4),
+        (1, 2, 6),
+    ]
+    aat = dense(backend, b.compute_aat(a, b.matrix(2, 2)))
+    assert aat[0][0] == 14
+    assert aat[0][1] == 22
+    assert aat[1][0] == 22
+    assert aat[1][1] == 52
+
+
+@pytest.mark.parametrize("backend", ALL_BACKENDS)
+def test_backend_solve_linear_system(backend):
+    b = get_backend(backend)
+    nonzero = [(i, j) for i in range(3) for j in range(3)]
+    aat = b.jacobian(3, 3, nonzero)
+    b.set_jacobian(aat, nonzero, [42, 1, 2, 3, -2, 18, 4, 5, -6])
+    if backend == BACKEND_SPARSE:
+        aat = aat.tocsc()
+    rhs = b.vector(3)
+    b.set_vector(rhs, [42, 42, 42])
+    z = b.vector(3)
+    b.solve_linear_system(aat, rhs, z)
+    assert equal_float(42 * z[0] + 1 * z[1] + 2 * z[2], 42)
+    assert equal_float(3 * z[0] - 2 * z[1] + 18 * z[2], 42)
+    assert equal_float(4 * z[0] + 5 * z[1] - 6 * z[2], 42)
+
+
+@pytest.mark.parametrize("backend", ALL_BACKENDS)
+def test_backend_add_diagonal(backend):
+    b = get_backend(backend)
+    nonzero = [(0, 0), (0, 1), (1, 0), (1, 1)]
+    a = b.jacobian(2, 2, nonzero)
+    b.set_jacobian(a, nonzero, [1, 2, 3, 4])
+    aat = b.compute_aat(a, b.matrix(2, 2))
+    assert b.max_diagonal(aat) == 25
+    aat = dense(backend, b.add_diagonal(aat, 0.5))
+    assert aat[0][0] == 5.5
+    assert aat[0][1] == 11
+    assert aat[1][1] == 25.5
+
+
+def test_same_steps_linear():
+    x = symbols("x")
+    y = symbols("y")
+    assert_same_steps([x + y - 5, 2 * x - 3 * y], {x: 0, y: 0}, nb_steps=2)
+
+
+def test_same_steps_distance():
+    x0, y0, z0, x1, y1, z1 = symbols("x0 y0 z0 x1 y1 z1")
+    equations = [sqrt((x0 - x1) ** 2 + (y0 - y1) ** 2 + (z0 - z1) ** 2) - 30]
+    initial_values = {x0: 10, y0: 10, z0: 10, x1: 20, y1: 20, z1: 20}
+    assert_same_steps(equations, initial_values)
+
+
+def test_same_steps_perpendicular_and_angle():
+    points = [
+        MeshPoint(0, Vector3(0, 0, 0)),
+        MeshPoint(1, Vector3(10, 10, 10)),
+        MeshPoint(2, Vector3(5, 10, 5)),
+        MeshPoint(3, Vector3(7, 8, 9)),
+    ]
+    s = Solver(points)
+    s.perpendicular(42, 0, 1, 2, 3)
+    s.angle(43, 0, 2, 1, 3, 30)
+    s.same_distance(44, 0, 1, 2, 3)
+    s.parallel(45, 0, 3, 1, 2)
+    assert_same_steps(s.equations, s.initial_values)
+
+
+@pytest.mark.parametrize("backend", ALL_BACKENDS + KRYLOV_BACKENDS)
+def test_solver_backend_angle_2d(backend):
+    s = Solver(
+        [
+            MeshPoint(0, Vector3(0, 0, 0)),
+            MeshPoint(1, Vector3(1, 0, 0)),
+            MeshPoint(2, Vector3(0, 1, 0)),
+        ],
+        backend=backend,
+    )
+    s.angle(42, 0, 1, 0, 2, 45)
+    s.fix_x(43, 0, 0)
+    s.fix_y(43, 0, 0)
+    s.fix_z(43, 0, 0)
+    s.fix_x(44, 1, 1)
+    s.fix_y(44, 1, 0)
+    s.fix_z(44, 1, 0)
+    s.fix_z(45, 2, 0)
+    s.distance_2_vertices(46, 0, 2, 1.4142135623730951)
+    ret = s.solve()
+    assert ret["solved"]
+    p2 = ret["points"][2]
+    assert equal_float(p2.x, 1)
+    assert equal_float(p2.y, 1)
+    assert equal_float(p2.z, 0)
+
+
+def test_sparse_jacobian_structure():
+    x, y, z = symbols("x y z")
+    equations = [x - 3, x * y - z, z ** 2]
+    s = NewtonSolver(equations, {x: 1, y: 2, z: 3})
+    s.prepare_matrix()
+
+    x_index = s.params.index(x)
+    y_index = s.params.index(y)
+    z_index = s.params.index(z)
+    # Only derivatives on free symbols are stored
+    assert sorted(s.a_nonzero) == sorted(
+        [(0, x_index), (1, x_index), (1, y_index), (1, z_index), (2, z_index)]
+    )
+    assert s.a_eq[0][y_index] == 0
+    assert s.a_eq[1][y_index] == x
+
+
+@pytest.mark.skipif(not sparse_available(), reason="scipy not installed")
+def test_solver_sparse_chain():
+    # A long chain of unit distances on X fixed at its start
+    nb = 30
+    points = [MeshPoint(i, Vector3(1.1 * i, 0.1 * (i % 3), 0.0)) for i in range(nb)]
+    s = Solver(points, backend=BACKEND_SPARSE)
+    s.fix_x(0, 0, 0)
+    s.fix_y(0, 0, 0)
+    s.fix_z(0, 0, 0)
+    for i in range(nb - 1):
+        s.distance_2_vertices(i + 1, i, i + 1, 1.0)
+        s.on_x(i + 1, i, i + 1)
+    ret = s.solve()
+    assert ret["solved"]
+    points = ret["points"]
+    for i in range(nb - 1):
+        assert equal_float(points[i + 1].x - points[i].x, 1.0)
+        assert equal_float(points[i + 1].y, 0)
+
+
+@pytest.mark.skipif(not sparse_available(), reason="scipy not installed")
+def test_solver_sparse_redundant():
+    # Random redundant distances : a * a.transpose() is singular, the steps
+    # must still be the minimum norm ones
+    system = generate("overconstrained", 400)
+    assert len(system.constraints) > SPARSE_MIN_EQUATIONS
+    s = build_solver(system, BACKEND_SPARSE, METHOD_NEWTON, system.start())
+    ret = s.solve()
+    assert ret["solved"]
+
+
+@pytest.mark.parametrize("backend", KRYLOV_BACKENDS)
+def test_krylov_backend_steps(backend):
+    b = get_backend(backend)
+    # Accurate first step
+    b.forcing_term.value = MIN_FORCING_TERM
+    nonzero = [(0, 0), (0, 1), (1, 0), (1, 1), (2, 1)]
+    a = b.jacobian(3, 2, nonzero)
+    b.set_jacobian(a, nonzero, [1, 2, 3, 4, 2])
+    aat = b.compute_aat(a, b.matrix(3, 3))
+    assert b.max_diagonal(aat) == 25
+    aat = b.add_diagonal(aat, 0.5)
+    rhs = b.vector(3)
+    b.set_vector(rhs, [1, 2, 3])
+    z = b.vector(3)
+    b.solve_linear_system(aat, rhs, z)
+    x = b.vector(2)
+    b.multiply_transpose(a, z, x)
+    # Same damped step as a direct solve
+    dense = numpy.array([[1, 2], [3, 4], [0, 2]], dtype=float)
+    z = numpy.linalg.solve(dense @ dense.T + 0.5 * numpy.eye(3), [1, 2, 3])
+    expected = dense.T @ z
+    assert all(equal_float(value, ref) for value, ref in zip(x, expected))
+
+
+def test_krylov_backend_exhausted(monkeypatch):
+    monkeypatch.setattr(krylov, "MAX_ITERATIONS", 2)
+    b = get_backend(BACKEND_KRYLOV)
+    b.forcing_term.value = MIN_FORCING_TERM
+    nonzero = [(i, j) for i in range(10) for j in range(i, i + 3)]
+    a = b.jacobian(10, 12, nonzero)
+    b.set_jacobian(a, nonzero, numpy.arange(1.0, len(nonzero) + 1))
+    z = b.vector(10)
+    b.solve_linear_system(b.compute_aat(a, None), numpy.ones(10), z)
+    # Jacobi is replaced and the forcing term is not relaxed
+    assert b.iterations == 2
+    assert b.exhausted == 1
+    assert b.forcing_term.missed
+    assert b.preconditioner == PRECONDITIONER_INCOMPLETE_CHOLESKY
+    assert get_backend(BACKEND_KRYLOV).preconditioner == PRECONDITIONER_JACOBI
+
+
+def test_solver_krylov_ill_conditioned():
+    # Long chain of angles, too ill conditioned for jacobi
+    system = generate("angle_chain", 1000)
+    s = build_solver(system, BACKEND_KRYLOV, METHOD_NEWTON, system.start())
+    assert s.solve()["solved"]
+
+
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize("backend", KRYLOV_BACKENDS)
+def test_solver_krylov_grid(backend, method):
+    # Unit squares with redundant perpendicular constraints
+    nb = 6
+    points = [
+        MeshPoint(i * nb + j, Vector3(1.1 * i, 0.9 * j + 0.05 * i, 0.0))
+        for i in range(nb)
+        for j in range(nb)
+    ]
+    s = Solver(points, backend=backend, method=method)
+    s.fix_x(0, 0, 0)
+    s.fix_y(0, 0, 0)
+    s.fix_x(0, nb - 1, 0)
+    index = 1
+    for i in range(nb):
+        for j in range(nb):
+            p = i * nb + j
+            s.fix_z(index, p, 0)
+            if i + 1 < nb:
+                s.distance_2_vertices(index, p, p + nb, 1.0)
+            if j + 1 < nb:
+                s.distance_2_vertices(index, p, p + 1, 1.0)
+            if i + 1 < nb and j + 1 < nb:
+                s.perpendicular(index, p, p + 1, p, p + nb)
+            index += 1
+    ret = s.solve()
+    assert ret["solved"]
+    points = ret["points"]
+    for i in range(nb):
+        for j in range(nb):
+            assert equal_float(points[i * nb + j].x, i)
+            assert equal_float(points[i * nb + j].y, j)
@@ -0,0 +1,84 @@
+import threading
+import time
+import pytest
+from ..background import BackgroundSolve
+from .test_solver import chain_solver, equal_float
+
+
+def wait(background, timeout=30):
+    """Poll like the modal operator until the solve is done, return the values"""
+    values = {}
+    end = time.perf_counter() + timeout
+    while not background.done:
+        assert time.perf_counter() < end
+        values.update(background.progress())
+        time.sleep(0.001)
+    values.update(background.progress())
+    return values
+
+
+def test_background_solve():
+    s = chain_solver(nb_chains=2)
+    background = BackgroundSolve(s, workers=1, progress_interval=1)
+    assert not background.done
+    values = wait(background.start())
+    ret = background.result()
+    assert ret["solved"]
+    # Polled values end at the solution
+    assert len(values) > 0
+    for point in ret["points"]:
+        for axis in range(3):
+            if (point.index, axis) in values:
+                assert equal_float(values[(point.index, axis)], point.xyz[axis])
+    assert background.progress() == {}
+
+
+def test_background_solve_cancel():
+    s = chain_solver()
+    started = threading.Event()
+    background = BackgroundSolve(s, workers=1, progress_interval=1)
+    solve = s.solve
+
+    def slow_solve(**kwargs):
+        progress = kwargs["progress"]
+
+        def slow_progress(values):
+            progress(values)
+            started.set()
+            time.sleep(0.01)
+
+        return solve(**{**kwargs, "progress": slow_progress})
+
+    s.solve = slow_solve
+    start = [point.xyz for point in s.points]
+    background.start()
+    assert started.wait(30)
+    background.cancel()
+    assert background.done
+    ret = background.result()
+    assert ret["reason"] == "cancelled"
+    # Not applied, the caller restores its own coordinates
+    assert [point.xyz for point in s.points] == start
+    assert len(ret["partial_points"]) == len(start)
+
+
+def test_background_solve_error():
+    s = chain_solver()
+
+    def broken_solve(**kwargs):
+        raise Exception("broken")
+
+    s.solve = broken_solve
+    background = BackgroundSolve(s, workers=1).start()
+    wait(background)
+    # Raised in the polling thread
+    with pytest.raises(Exception, match="broken"):
+        background.result()
+
+
+def test_background_solve_time_budget():
+    background = BackgroundSolve(chain_solver(), workers=1, time_budget=0).start()
+    wait(background)
+    ret = background.result()
+    assert ret["reason"] == "timeout"
+    assert "residual" in ret
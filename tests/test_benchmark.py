@@ -0,0 +1,65 @@
+import json
+import pytest
+from ..backends import BACKEND_NUMPY, BACKEND_PYTHON
+from ..solver import METHOD_NEWTON
+from .benchmark import (
+    FAMILIES,
+    compare,
+    format_record,
+    generate,
+    main,
+    run,
+    run_case,
+)
+
+
+@pytest.mark.parametrize("family", list(FAMILIES))
+def test_benchmark_family_solved(family):
+    record = run_case(family, 100, BACKEND_NUMPY, METHOD_NEWTON)
+    assert record["solved"]
+    assert 50 < record["nb_equations"] < 200
+    assert set(record["times"]) == {"setup", "components", "solve"}
+    assert {"jacobian", "linear_solve", "rank"} <= set(record["solve_phases"])
+    assert record["counts"]["iterations"] == record["iterations"]
+    assert all(peak > 0 for peak in record["peak_memory"].values())
+
+
+def test_benchmark_generate():
+    system = generate("grid", 1000, seed=1)
+    assert system.constraints == generate("grid", 1000, seed=1).constraints
+    assert system.constraints != generate("grid", 1000, seed=2).constraints
+    # Start is close to the target
+    assert abs(system.start() - system.target).max() < 1
+    with pytest.raises(Exception):
+        generate("nope", 10)
+
+
+def test_benchmark_skipped():
+    record = run_case("grid", 2000, BACKEND_PYTHON, METHOD_NEWTON)
+    assert "too big" in record["skipped"]
+    assert "times" not in record
+    assert "skipped" in format_record(record)
+
+
+def test_benchmark_compare():
+    baseline = run(["sketch"], [10], memory=False)
+    results = json.loads(json.dumps(baseline))
+    ((key, ratio, regression),) = compare(baseline, results)
+    assert key[:2] == ("sketch", 10)
+    assert ratio == pytest.approx(1)
+    assert not regression
+    results["cases"][0]["times"]["solve"] += 10
+    assert compare(baseline, results)[0][2]
+    results = json.loads(json.dumps(baseline))
+    baseline["cases"][0]["size"] = 42
+    assert compare(baseline, results) == []
+
+
+def test_benchmark_main(tmp_path, capsys):
+    output = tmp_path / "results.json"
+    args = ["--families", "sketch", "--sizes", "10", "--no-memory"]
+    assert main(args + ["--output", str(output)]) == 0
+    results = json.loads(output.read_text())
+    assert len(results["cases"]) == 1
+    assert main(args + ["--baseline", str(output), "--threshold", "1000"]) == 0
+    assert "sketch 10" in capsys.readouterr().out
@@ -0,0 +1,34 @@
+import time
+import pytest
+from ..budget import (
+    NO_BUDGET,
+    REASON_CANCELLED,
+    REASON_TIMEOUT,
+    Budget,
+    CancelToken,
+    Interrupted,
+)
+
+
+def test_budget_timeout():
+    budget = Budget(0.02)
+    assert budget.reason() is None
+    assert 0 < budget.remaining() <= 0.02
+    budget.check()
+    time.sleep(0.03)
+    assert budget.remaining() == 0
+    with pytest.raises(Interrupted) as e:
+        budget.check()
+    assert e.value.reason == REASON_TIMEOUT
+
+
+def test_budget_cancel():
+    token = CancelToken()
+    budget = Budget(token=token)
+    assert budget.remaining() is None
+    budget.check()
+    token.cancel()
+    assert budget.cancelled
+    # Cancelled wins over the timeout
+    assert Budget(0, token).reason() == REASON_CANCELLED
+    NO_BUDGET.check()
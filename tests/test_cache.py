@@ -0,0 +1,169 @@
+import numpy
+import pytest
+from ..cache import PartialResults, SolutionCache
+from ..solver import Solver, MeshPoint
+from .test_solver import Vector3, equal_float
+
+
+def build_solver(points, distance=1.0):
+    s = Solver([MeshPoint(i, Vector3(*xyz)) for i, xyz in enumerate(points)])
+    s.fix_x(0, 0, 0)
+    s.fix_y(0, 0, 0)
+    s.fix_z(0, 0, 0)
+    for i in range(len(points) - 1):
+        s.distance_2_vertices(i + 1, i, i + 1, distance)
+        s.on_x(i + 1, i, i + 1)
+    return s
+
+
+def chain(nb):
+    return [(1.1 * i, 0.1 * (i % 3), 0.05 * (i % 2)) for i in range(nb)]
+
+
+def float32_coordinates(ret):
+    """Coordinates as blender would store them"""
+    return [tuple(float(numpy.float32(c)) for c in p.xyz) for p in ret["points"]]
+
+
+def test_cache_warm_start_reuses_systems():
+    cache = SolutionCache()
+    s = build_solver(chain(10))
+    assert cache.warm_start("object", s) is s
+    ret = s.solve()
+    assert ret["solved"]
+    cache.store("object", s)
+    systems = list(s.systems.values())
+
+    # Only a value changed
+    s2 = build_solver(float32_coordinates(ret), distance=2.0)
+    warm = cache.warm_start("object", s2)
+    assert warm is s
+    ret = warm.solve()
+    assert ret["solved"]
+    assert list(warm.systems.values()) == systems
+    points = ret["points"]
+    for i in range(9):
+        assert equal_float(points[i + 1].x - points[i].x, 2.0)
+        assert equal_float(points[i + 1].y, 0)
+
+
+def test_cache_warm_start_seeds_solved_coordinates():
+    cache = SolutionCache()
+    s = build_solver(chain(5))
+    ret = s.solve()
+    solved = [p.xyz for p in ret["points"]]
+    cache.store("object", s)
+
+    coordinates = float32_coordinates(ret)
+    # A point moved by the user is not seeded
+    coordinates[4] = (42.0, 1.0, 1.0)
+    s2 = build_solver(coordinates)
+    cache.warm_start("object", s2)
+    assert [s2.points[i].xyz for i in range(4)] == solved[:4]
+    assert s2.points[4].xyz == (42.0, 1.0, 1.0)
+
+
+def test_cache_invalidated_on_structure_and_topology_change():
+    cache = SolutionCache()
+    s = build_solver(chain(5))
+    s.solve()
+    cache.store("object", s, topology=(5, 4, 0))
+
+    # Topology change
+    s2 = build_solver(chain(5))
+    assert cache.warm_start("object", s2, topology=(5, 3, 0)) is s2
+    assert "object" not in cache
+
+    # Constraints change, only the changed component is solved
+    cache.store("object", s, topology=(5, 4, 0))
+    s3 = build_solver(chain(5))
+    s3.fix_x(42, 4, 10)
+    assert cache.warm_start("object", s3, topology=(5, 4, 0)) is s3
+    assert s3.last_solve is s.last_solve
+
+
+def test_cache_eviction():
+    cache = SolutionCache(max_entries=2, max_equations=100)
+    for key in ["a", "b", "c"]:
+        cache.store(key, build_solver(chain(3)))
+    assert len(cache) == 2
+    assert "a" not in cache
+
+    # "b" is used, so "c" is the least recently used
+    cache.warm_start("b", build_solver(chain(3)))
+    cache.store("d", build_solver(chain(3)))
+    assert "b" in cache
+    assert "c" not in cache
+
+    # Too many equations
+    cache.store("e", build_solver(chain(33)))
+    assert len(cache) == 1
+    cache.store("f", build_solver(chain(40)))
+    assert len(cache) == 0
+
+
+def build_two_components(first_constraints, points=None):
+    """Point 0 and 1 with the first_constraints of (0, 1, 2), points 2 and 3
+    with a duplicated distance, constraint 5, and points 4 and 5"""
+    if points is None:
+        points = [
+            (0, 0, 0),
+            (1.2, 0.1, 0),
+            (5, 0, 0),
+            (6.1, 0.2, 0),
+            (9, 0, 0),
+            (9, 3, 0),
+        ]
+    s = Solver([MeshPoint(i, Vector3(*xyz)) for i, xyz in enumerate(points)])
+    if 0 in first_constraints:
+        s.fix_x(0, 0, 0)
+        s.fix_y(0, 0, 0)
+    if 1 in first_constraints:
+        s.fix_z(1, 0, 0)
+    if 2 in first_constraints:
+        s.distance_2_vertices(2, 0, 1, 1)
+    s.fix_x(3, 2, 5)
+    s.fix_y(3, 2, 0)
+    s.fix_z(3, 2, 0)
+    s.distance_2_vertices(4, 2, 3, 1)
+    s.distance_2_vertices(5, 2, 3, 1)
+    s.fix_x(6, 4, 9)
+    s.fix_y(6, 4, 0)
+    s.fix_z(6, 4, 0)
+    s.distance_2_vertices(7, 4, 5, 2)
+    return s
+
+
+@pytest.mark.parametrize("first_constraints", [(0, 2), (1, 2), ()])
+def test_cache_warm_start_redundant_of_unchanged_components(first_constraints):
+    cache = SolutionCache()
+    s = build_two_components((0, 1, 2))
+    ret = s.solve()
+    assert ret["solved"]
+    assert ret["redundant"] == [5]
+    cache.store("object", s)
+
+    # Constraints of the other component deleted
+    s2 = build_two_components(first_constraints, float32_coordinates(ret))
+    warm = cache.warm_start("object", s2)
+    assert warm is s2
+    ret = warm.solve()
+    assert ret["solved"]
+    assert ret["components"][-2]["unchanged"]
+    assert ret["redundant"] == [5]
+
+
+def test_partial_results():
+    partials = PartialResults()
+    s = build_solver(chain(5))
+    ret = s.solve(time_budget=0)
+    assert ret["reason"] == "timeout"
+    partials.store("object", ret, topology=(5, 4, 0))
+    assert "object" in partials
+    partial = partials.get("object")
+    assert partial["reason"] == "timeout"
+    assert partial["residual"] == ret["residual"]
+    assert partial["partial_points"] == ret["partial_points"]
+    assert partial["topology"] == (5, 4, 0)
+    partials.discard("object")
+    assert partials.get("object") is None
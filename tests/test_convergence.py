@@ -0,0 +1,39 @@
+import io
+import json
+import math
+from ..convergence import COLUMNS, as_array, concatenate, remap, rows, to_csv, to_json
+
+
+def history():
+    return as_array(
+        [
+            (0, 0, 2.0, 0.0, 0.0, 1, 1),
+            (0, 1, math.nan, 0.5, 0.1, -1, 0),
+            (0, 1, 1e-9, 0.4, 0.025, 0, 1),
+        ]
+    )
+
+
+def test_convergence_remap():
+    remapped = remap(history(), [7, 12])
+    assert remapped[:, COLUMNS.index("worst_equation")].tolist() == [12, -1, 7]
+    assert concatenate([]).shape == (0, len(COLUMNS))
+    assert concatenate([history(), remapped]).shape == (6, len(COLUMNS))
+
+
+def test_convergence_rows():
+    (row, _, _) = rows(history(), {1: "distance"})
+    assert row == [0, 0, 2.0, 0.0, 0.0, 1, 1, "distance"]
+    assert all(isinstance(v, int) for v in row[:2])
+
+
+def test_convergence_export():
+    file = io.StringIO()
+    to_csv(history(), file)
+    lines = file.getvalue().splitlines()
+    assert lines[0] == ",".join(COLUMNS)
+    assert lines[2] == "0,1,nan,0.5,0.1,-1,0"
+    data = json.loads(to_json(history(), {0: 3}))
+    assert data["columns"][-1] == "worst_constraint"
+    assert data["rows"][1][2] is None
+    assert data["rows"][2][-1] == 3
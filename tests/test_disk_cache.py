@@ -0,0 +1,73 @@
+import os
+from ..disk_cache import StructureCache, EXTENSION
+from .test_cache import build_solver, chain, float32_coordinates
+from .test_solver import equal_float
+
+
+def test_disk_cache_load_stored_structure(tmp_path):
+    cache = StructureCache(str(tmp_path))
+    s = build_solver(chain(10))
+    assert not cache.load(s)
+    ret = s.solve()
+    assert ret["solved"]
+    cache.store(s)
+    assert len(os.listdir(tmp_path)) == 1
+
+    # Same structure, other values
+    s2 = build_solver(float32_coordinates(ret), distance=2.0)
+    assert cache.load(s2)
+    assert s2.components() == s.components()
+    assert len(s2.structures) == len(s.systems)
+    ret = s2.solve()
+    assert ret["solved"]
+    assert len(s2.structures) == 0
+    points = ret["points"]
+    for i in range(9):
+        assert equal_float(points[i + 1].x - points[i].x, 2.0)
+
+    # Other structure
+    s3 = build_solver(chain(10))
+    s3.fix_x(42, 4, 10)
+    assert not cache.load(s3)
+
+
+def test_disk_cache_stamp_and_broken_files(tmp_path):
+    cache = StructureCache(str(tmp_path))
+    s = build_solver(chain(5))
+    s.solve()
+    cache.store(s)
+
+    # Addon updated
+    updated = StructureCache(str(tmp_path))
+    updated._stamp = "other"
+    updated.store(s)
+    assert len(os.listdir(tmp_path)) == 2
+    assert cache.load(build_solver(chain(5)))
+
+    with open(cache.path(s), "wb") as f:
+        f.write(b"broken")
+    assert not cache.load(build_solver(chain(5)))
+    assert not os.path.exists(cache.path(s))
+
+
+def test_disk_cache_eviction(tmp_path):
+    cache = StructureCache(str(tmp_path))
+    solvers = [build_solver(chain(n)) for n in (5, 6, 7)]
+    for s in solvers:
+        s.solve()
+        cache.store(s)
+    sizes = [os.path.getsize(cache.path(s)) for s in solvers]
+    # Oldest first, the first one is used again
+    for i, s in enumerate(solvers):
+        os.utime(cache.path(s), (i, i))
+    assert cache.load(build_solver(chain(5)))
+
+    cache.max_bytes = sizes[0] + sizes[2]
+    cache.store(build_solver(chain(3)))
+    names = sorted(os.listdir(tmp_path))
+    assert all(name.endswith(EXTENSION) for name in names)
+    assert os.path.exists(cache.path(solvers[0]))
+    assert not os.path.exists(cache.path(solvers[1]))
+
+    cache.clear()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,53 @@
+import math
+import numpy
+import pytest
+
+from .. import dual
+from .test_solver import equal_float
+
+
+def test_dual_operators():
+    x, y = dual.variables([3.0, 2.0])
+    f = (x * y - 1 / x + x / y - 2 * y + 1 - x ** 2) / (y + 1)
+    value, gradient = dual.value_and_gradient(f, [3.0, 2.0])
+    assert equal_float(value, (6 - 1 / 3 + 1.5 - 4 + 1 - 9) / 3)
+    # Derivatives of the numerator over y + 1, minus f / (y + 1) for y
+    dx = (2 + 1 / 9 + 0.5 - 6) / 3
+    dy = (3 - 0.75 - 2) / 3 - value / 3
+    assert equal_float(gradient[0], dx)
+    assert equal_float(gradient[1], dy)
+
+
+def test_dual_functions():
+    (x,) = dual.variables([0.5])
+    for f, df in [
+        (dual.sqrt, lambda v: 0.5 / math.sqrt(v)),
+        (dual.cos, lambda v: -math.sin(v)),
+        (dual.sin, math.cos),
+        (dual.acos, lambda v: -1 / math.sqrt(1 - v * v)),
+    ]:
+        y = f(x)
+        assert equal_float(y.gradient[0], df(0.5))
+        # Plain values too
+        assert equal_float(f(0.5), y.value)
+
+
+def test_dual_batch():
+    q = numpy.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
+    x, y = dual.variables(q)
+    value, gradient = dual.value_and_gradient(dual.sqrt(x * y), q)
+    assert numpy.allclose(value, numpy.sqrt(q[:, 0] * q[:, 1]))
+    assert numpy.allclose(gradient[:, 0], 0.5 * q[:, 1] / value)
+    assert numpy.allclose(gradient[:, 1], 0.5 * q[:, 0] / value)
+
+
+def test_dual_constant():
+    value, gradient = dual.value_and_gradient(2.0, [1.0, 2.0])
+    assert value == 2.0
+    assert list(gradient) == [0.0, 0.0]
+
+
+def test_dual_exponent():
+    x, y = dual.variables([1.0, 2.0])
+    with pytest.raises(Exception):
+        x ** y
@@ -0,0 +1,129 @@
+from ..graph import (
+    AffineDisjointSet,
+    DisjointSet,
+    connected_components,
+    maximum_matching,
+    strongly_connected_components,
+    dulmage_mendelsohn,
+    reverse_cuthill_mckee,
+)
+
+
+def test_disjoint_set():
+    ds = DisjointSet(6)
+    assert ds.find(3) == 3
+    ds.union(0, 1)
+    ds.union(2, 3)
+    assert ds.find(0) == ds.find(1)
+    assert ds.find(2) == ds.find(3)
+    assert ds.find(0) != ds.find(2)
+    ds.union(1, 3)
+    assert ds.find(0) == ds.find(2)
+    assert ds.find(4) != ds.find(5)
+
+
+def test_connected_components():
+    equations_variables = [
+        ["x0", "y0"],
+        ["x5"],
+        ["y0", "z1"],
+        ["x5", "x6"],
+        [],
+        ["z1"],
+    ]
+    assert connected_components(equations_variables) == [[0, 2, 5], [1, 3], [4]]
+
+
+def test_connected_components_empty():
+    assert connected_components([]) == []
+
+
+def test_maximum_matching():
+    # Greedy would match row 0 with column 0 and be stuck for row 1
+    adjacency = [[0, 1], [0], [1, 2]]
+    match_row, match_col = maximum_matching(adjacency, 3)
+    assert match_row == [1, 0, 2]
+    assert match_col == [1, 0, 2]
+
+
+def test_maximum_matching_not_perfect():
+    adjacency = [[0], [0], [0, 1]]
+    match_row, match_col = maximum_matching(adjacency, 2)
+    assert sorted(c for c in match_row if c != -1) == [0, 1]
+    assert match_row.count(-1) == 1
+
+
+def test_strongly_connected_components():
+    # 0 -> 1 -> 2 -> 1, 3 -> 0
+    components = strongly_connected_components([[1], [2], [1], [0]])
+    assert [sorted(c) for c in components] == [[1, 2], [0], [3]]
+
+
+def test_dulmage_mendelsohn_chain():
+    # x = 1, y = x + 1, z * y = 2, (u, v) linked to z
+    equations_variables = [
+        ["x"],
+        ["x", "y"],
+        ["y", "z"],
+        ["z", "u", "v"],
+    ]
+    dm = dulmage_mendelsohn(equations_variables)
+    assert dm["over"] == ([], [])
+    assert dm["blocks"] == [([0], ["x"]), ([1], ["y"]), ([2], ["z"])]
+    assert dm["under"][0] == [3]
+    assert sorted(dm["under"][1]) == ["u", "v"]
+
+
+def test_dulmage_mendelsohn_loop_and_over():
+    equations_variables = [
+        ["x", "y"],
+        ["x", "y"],
+        ["y", "z"],
+        ["w"],
+        ["w"],
+    ]
+    dm = dulmage_mendelsohn(equations_variables)
+    assert dm["over"] == ([3, 4], ["w"])
+    assert dm["blocks"] == [([0, 1], ["x", "y"]) , ([2], ["z"])] or dm["blocks"] == [
+        ([0, 1], ["y", "x"]),
+        ([2], ["z"]),
+    ]
+    assert dm["under"] == ([], [])
+
+
+def test_affine_disjoint_set():
+    ds = AffineDisjointSet()
+    assert ds.find("x") == ("x", 1.0, 0.0)
+    # x = 2 y + 1, y = z - 3
+    assert ds.union("x", "y", 2, 1)
+    assert ds.union("y", "z", 1, -3)
+    assert not ds.union("x", "z")
+    assert ds.value("x") is None
+    assert ds.bind("z", 5)
+    assert ds.value("z") == 5
+    assert ds.value("y") == 2
+    assert ds.value("x") == 5
+    # Already bound
+    assert not ds.bind("x", 5)
+
+
+def test_affine_disjoint_set_constants():
+    ds = AffineDisjointSet()
+    assert ds.bind("x", 1)
+    assert ds.bind("y", 2)
+    # Both bound
+    assert not ds.union("x", "y")
+    assert ds.union("z", "x", 3, 0)
+    assert ds.value("z") == 3
+
+
+def test_reverse_cuthill_mckee():
+    # A path 0 - 3 - 1 - 4 - 2, and 5 alone
+    adjacency = [[3], [3, 4], [4], [0, 1], [1, 2], []]
+    order = reverse_cuthill_mckee(adjacency)
+    assert sorted(order) == list(range(6))
+    position = {node: k for k, node in enumerate(order)}
+    # Neighbours on the path are next to each other
+    for node, neighbours in enumerate(adjacency):
+        for neighbour in neighbours:
+            assert abs(position[node] - position[neighbour]) == 1
@@ -0,0 +1,212 @@
+import numpy
+import pytest
+from sympy import diff
+from ..kernels import (
+    EQUATION_EQUAL,
+    EQUATION_FIX,
+    EQUATION_DISTANCE,
+    EQUATION_SAME_DISTANCE,
+    EQUATION_PARALLEL,
+    EQUATION_PERPENDICULAR,
+    EQUATION_ANGLE,
+    RESIDUALS,
+    dual_kernel,
+    dual_batch_kernel,
+    equation_points_variables,
+    equation_variables,
+    batch_residual_and_gradient,
+)
+from ..solver import build_equation, MeshPoint, KernelNewtonSolver
+from .test_solver import Vector3, equal_float
+
+COORDINATES = [
+    (0.0, 0.0, 0.0),
+    (10.0, 10.0, 10.0),
+    (5.0, 10.0, 5.0),
+    (7.0, 8.0, 9.5),
+]
+
+RECORDS = [
+    (EQUATION_EQUAL, (0, 1), 1, 0),
+    (EQUATION_FIX, (2,), 2, 4.2),
+    (EQUATION_DISTANCE, (1, 3), None, 3),
+    (EQUATION_SAME_DISTANCE, (0, 1, 2, 3), None, 0),
+    (EQUATION_PARALLEL, (0, 1, 2, 3), 0, 0),
+    (EQUATION_PARALLEL, (0, 1, 2, 3), 1, 0),
+    (EQUATION_PARALLEL, (0, 1, 2, 3), 2, 0),
+    (EQUATION_PERPENDICULAR, (0, 1, 2, 3), None, 0),
+    (EQUATION_ANGLE, (0, 1, 2, 3), None, 30),
+    # Same point used twice
+    (EQUATION_ANGLE, (0, 1, 0, 2), None, 45),
+    (EQUATION_PERPENDICULAR, (0, 1, 0, 3), None, 0),
+]
+
+
+def assert_kernel_matches_sympy(record, kernel):
+    points = [MeshPoint(i, Vector3(*xyz)) for i, xyz in enumerate(COORDINATES)]
+    equation = build_equation(record, [points[p].params for p in record[1]])
+    values = {}
+    for point in points:
+        values.update(zip(point.params, point.xyz))
+
+    variables = equation_points_variables(record)
+    q = [points[p].xyz[axis] for p, axis in variables]
+    residual, gradient = kernel(q, record[2], record[3])
+    assert equal_float(residual, float(equation.evalf(subs=values)))
+
+    # Sum the gradient terms of repeated variables
+    derivatives = {}
+    for variable, g in zip(variables, gradient):
+        derivatives[variable] = derivatives.get(variable, 0) + g
+    assert list(derivatives) == equation_variables(record)
+    for (p, axis), g in derivatives.items():
+        expected = diff(equation, points[p].params[axis]).evalf(subs=values)
+        assert equal_float(g, float(expected))
+
+
+def batch_kernel(kind):
+    """Kernel of one equation, from the batched kernel of its kind"""
+
+    def kernel(q, axis, value):
+        residuals, gradients = batch_residual_and_gradient(
+            kind, numpy.array([q]), numpy.array([axis or 0]), numpy.array([value])
+        )
+        return float(residuals[0]), gradients[0].tolist()
+
+    return kernel
+
+
+@pytest.mark.parametrize("record", RECORDS)
+def test_kernel_matches_sympy(record):
+    assert_kernel_matches_sympy(record, batch_kernel(record[0]))
+
+
+@pytest.mark.parametrize("record", RECORDS)
+def test_dual_kernel_matches_sympy(record):
+    assert_kernel_matches_sympy(record, dual_kernel(RESIDUALS[record[0]]))
+
+
+@pytest.mark.parametrize("vectorize", [True, False])
+@pytest.mark.parametrize("kind", list(RESIDUALS))
+def test_dual_batch_kernel_matches_batch_kernel(kind, vectorize):
+    records = [record for record in RECORDS if record[0] == kind]
+    q = numpy.array(
+        [
+            [COORDINATES[p][a] for p, a in equation_points_variables(record)]
+            for record in records
+        ]
+    )
+    axes = numpy.array([record[2] or 0 for record in records])
+    values = numpy.array([record[3] for record in records], dtype=float)
+    expected = batch_residual_and_gradient(kind, q, axes, values)
+    residuals, gradients = dual_batch_kernel(RESIDUALS[kind], vectorize)(
+        q, axes, values
+    )
+    assert numpy.allclose(residuals, expected[0])
+    assert numpy.allclose(gradients, expected[1])
+
+
+def test_kernel_unknown_kind():
+    with pytest.raises(Exception):
+        batch_residual_and_gradient(
+            "nope", numpy.zeros((1, 1)), numpy.zeros(1), numpy.zeros(1)
+        )
+
+
+def test_kernel_newton_solver_fixed():
+    # p1 at distance 5 of p0, only p1 x is free
+    records = [
+        (EQUATION_DISTANCE, (0, 1), None, 5),
+    ]
+    initial_values = {(0, a): 0.0 for a in range(3)}
+    initial_values.update({(1, 0): 1.0, (1, 1): 3.0, (1, 2): 0.0})
+    fixed = [(0, 0), (0, 1), (0, 2), (1, 1), (1, 2)]
+    s = KernelNewtonSolver(records, initial_values, fixed=fixed)
+    assert s.params == [(1, 0)]
+    ret = s.solve()
+    assert ret["solved"]
+    assert equal_float(ret["values"][(1, 0)], 4)
+
+
+def test_kernel_newton_solver_presolve():
+    # p1 x = p0 x = 2, p1 y = p0 y, p0 y fixed twice : the second fix is kept
+    records = [
+        (EQUATION_FIX, (0,), 0, 2),
+        (EQUATION_EQUAL, (0, 1), 0, 0),
+        (EQUATION_EQUAL, (0, 1), 1, 0),
+        (EQUATION_FIX, (1,), 1, 3),
+        (EQUATION_FIX, (0,), 1, 3),
+        (EQUATION_DISTANCE, (0, 1), None, 5),
+    ]
+    initial_values = {(p, a): 0.5 * p + a for p in range(2) for a in range(3)}
+    s = KernelNewtonSolver(records, initial_values)
+    assert s.kept == [4, 5]
+    assert s.eliminated == 4
+    assert s.params == [(0, 2), (1, 2)]
+    ret = s.solve()
+    assert ret["solved"]
+    values = ret["values"]
+    assert equal_float(values[(1, 0)], 2)
+    assert equal_float(values[(0, 1)], 3)
+    assert equal_float(abs(values[(1, 2)] - values[(0, 2)]), 5)
+    # The kept fix is redundant
+    rank_ok, rank = s.test_rank()
+    assert not rank_ok
+    assert rank == 5
+
+
+def test_kernel_newton_solver_structure():
+    records = [
+        (EQUATION_FIX, (0,), 0, 1),
+        (EQUATION_FIX, (0,), 1, 2),
+        (EQUATION_EQUAL, (0, 1), 1, 0),
+        (EQUATION_DISTANCE, (0, 1), None, 5),
+    ]
+    initial_values = {(p, a): 0.5 * p + a for p in range(2) for a in range(3)}
+    fixed = [(0, 2), (1, 2)]
+    s = KernelNewtonSolver(records, initial_values, fixed=fixed)
+    assert s.solve()["solved"]
+
+    # Same structure, other values
+    records[0] = (EQUATION_FIX, (0,), 0, -1)
+    records[3] = (EQUATION_DISTANCE, (0, 1), None, 3)
+    initial_values[(1, 2)] = 1.5
+    restarted = KernelNewtonSolver(
+        records, initial_values, fixed=fixed, structure=s.structure_state()
+    )
+    ret = restarted.solve()
+    assert ret["solved"]
+    expected = KernelNewtonSolver(records, initial_values, fixed=fixed).solve()
+    assert ret["values"] == expected["values"]
+    assert equal_float(ret["values"][(1, 0)], -1 + 8.75 ** 0.5)
+
+
+@pytest.mark.parametrize("record", RECORDS)
+def test_batch_kernel_rows(record):
+    kind, points, axis, value = record
+    # 3 copies of the same equation on shifted coordinates, each row
+    # evaluated on its own by automatic differentiation
+    kernel = dual_kernel(RESIDUALS[kind])
+    q = []
+    expected = []
+    for shift in range(3):
+        coordinates = [
+            [c + shift * (a + 1) for a, c in enumerate(xyz)] for xyz in COORDINATES
+        ]
+        q.append([coordinates[p][a] for p, a in equation_points_variables(record)])
+        expected.append(kernel(q[-1], axis, value))
+    residuals, gradients = batch_residual_and_gradient(
+        kind, numpy.array(q), numpy.array([axis or 0] * 3), numpy.array([value] * 3)
+    )
+    for (residual, gradient), r, g in zip(expected, residuals, gradients):
+        assert equal_float(residual, r)
+        for g0, g1 in zip(gradient, g):
+            assert equal_float(g0, g1)
+
+
+def test_batch_kernel_zero_length():
+    q = numpy.array([[1.0, 2.0, 3.0, 1.0, 2.0, 3.0]])
+    with pytest.raises(FloatingPointError):
+        batch_residual_and_gradient(
+            EQUATION_DISTANCE, q, numpy.array([0]), numpy.array([1.0])
+        )
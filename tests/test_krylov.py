@@ -0,0 +1,182 @@
+import numpy
+import pytest
+from .. import krylov
+from ..krylov import (
+    PRECONDITIONER_JACOBI,
+    PRECONDITIONER_INCOMPLETE_CHOLESKY,
+    BlockCholesky,
+    ForcingTerm,
+    Jacobian,
+    NormalOperator,
+    least_squares,
+    preconditioner,
+)
+
+PRECONDITIONERS = [PRECONDITIONER_JACOBI, PRECONDITIONER_INCOMPLETE_CHOLESKY]
+
+
+def jacobian(dense):
+    """Jacobian of the non zero terms of a dense matrix"""
+    dense = numpy.asarray(dense, dtype=float)
+    nonzero = [(i, j) for i, j in zip(*numpy.nonzero(dense))]
+    a = Jacobian(dense.shape[0], dense.shape[1], nonzero)
+    a.values[:] = [dense[i, j] for i, j in nonzero]
+    return a
+
+
+def solve(dense, b, name, damping=0.0):
+    """Step x = a.transpose() * z of least_squares"""
+    a = jacobian(dense)
+    operator = NormalOperator(a, damping)
+    z, _, _ = least_squares(operator, b, preconditioner(name, operator), 1e-12, 1000)
+    return a.transpose_dot(z)
+
+
+def random_matrix(nb_rows, nb_cols, seed=42):
+    random = numpy.random.default_rng(seed)
+    dense = random.normal(size=(nb_rows, nb_cols))
+    dense[random.random(size=dense.shape) < 0.6] = 0
+    return dense
+
+
+def test_jacobian_products():
+    dense = random_matrix(5, 7)
+    a = jacobian(dense)
+    v = numpy.arange(7.0)
+    w = numpy.arange(5.0)
+    assert numpy.allclose(a.dot(v), dense @ v)
+    assert numpy.allclose(a.transpose_dot(w), dense.T @ w)
+    assert numpy.allclose(a.rows_norms(), numpy.sum(dense * dense, axis=1))
+
+
+@pytest.mark.parametrize("name", PRECONDITIONERS)
+def test_least_squares_minimum_norm(name):
+    # Less equations than variables, the step is the minimum norm solution
+    dense = random_matrix(20, 30)
+    b = numpy.arange(20.0)
+    x = solve(dense, b, name)
+    assert numpy.allclose(x, numpy.linalg.pinv(dense) @ b)
+
+
+@pytest.mark.parametrize("name", PRECONDITIONERS)
+def test_least_squares_redundant(name):
+    # Duplicated compatible equations, same step as without them
+    dense = random_matrix(10, 30)
+    dense = numpy.vstack([dense, dense[:3]])
+    b = numpy.arange(13.0)
+    b[10:] = b[:3]
+    x = solve(dense, b, name)
+    assert numpy.allclose(x, numpy.linalg.pinv(dense) @ b)
+    assert numpy.allclose(dense @ x, b)
+
+
+def test_least_squares_inconsistent():
+    # Duplicated incompatible equations, the least squares step
+    dense = random_matrix(10, 30)
+    dense = numpy.vstack([dense, dense[:3]])
+    b = numpy.arange(13.0)
+    x = solve(dense, b, PRECONDITIONER_JACOBI)
+    # Rows scaled by the jacobi preconditioner : the same ones here,
+    # the duplicated rows have the same norms
+    assert numpy.allclose(x, numpy.linalg.pinv(dense) @ b)
+
+
+@pytest.mark.parametrize("name", PRECONDITIONERS)
+def test_least_squares_damped(name):
+    dense = random_matrix(20, 15)
+    b = numpy.arange(20.0)
+    damping = 0.5
+    x = solve(dense, b, name, damping)
+    z = numpy.linalg.solve(dense @ dense.T + damping * numpy.eye(20), b)
+    assert numpy.allclose(x, dense.T @ z)
+
+
+def test_least_squares_tolerance():
+    dense = random_matrix(200, 300)
+    a = jacobian(dense)
+    operator = NormalOperator(a)
+    b = numpy.ones(200)
+    jacobi = preconditioner(PRECONDITIONER_JACOBI, operator)
+    _, loose, _ = least_squares(operator, b, jacobi, 1e-1, 1000)
+    z, tight, converged = least_squares(operator, b, jacobi, 1e-10, 1000)
+    assert 0 < loose < tight
+    assert converged
+    assert numpy.linalg.norm(a.dot(a.transpose_dot(z)) - b) < 1e-8
+
+
+def test_block_cholesky_exact(monkeypatch):
+    # A chain, its gram matrix is tridiagonal : nothing is dropped
+    monkeypatch.setattr(krylov, "BLOCK_SIZE", 4)
+    monkeypatch.setattr(krylov, "CHOLESKY_SHIFT", 0.0)
+    nb = 18
+    dense = numpy.zeros((nb, nb + 1))
+    for i in range(nb):
+        dense[i, i] = 2.0 + i % 3
+        dense[i, i + 1] = -1.0
+    factorization = BlockCholesky(NormalOperator(jacobian(dense), 0.25))
+    gram = dense @ dense.T + 0.25 * numpy.eye(nb)
+    r = numpy.arange(nb, dtype=float)
+    # L * L.transpose() = gram
+    assert numpy.allclose(
+        factorization.backward(factorization.forward(r)), numpy.linalg.solve(gram, r)
+    )
+
+
+def test_block_cholesky_zero_rows():
+    dense = numpy.zeros((3, 2))
+    dense[0, 0] = 1.0
+    factorization = BlockCholesky(NormalOperator(jacobian(dense)))
+    assert numpy.all(numpy.isfinite(factorization.forward(numpy.ones(3))))
+
+
+def test_preconditioner_unknown():
+    with pytest.raises(Exception):
+        preconditioner("nope", NormalOperator(jacobian([[1.0]])))
+
+
+def test_forcing_term():
+    forcing_term = ForcingTerm()
+    assert forcing_term.next([10.0]) == krylov.MAX_FORCING_TERM
+    # Fast convergence of the Newton iterations, tighter steps
+    assert forcing_term.next([1.0]) == pytest.approx(0.009)
+    # Slow convergence, looser steps
+    assert forcing_term.next([0.9]) == krylov.MAX_FORCING_TERM
+    # No progress, tighter steps
+    assert forcing_term.next([0.9]) == pytest.approx(krylov.MAX_FORCING_TERM / 10)
+    assert forcing_term.next([0.0]) == krylov.MIN_FORCING_TERM
+
+
+def test_least_squares_exhausted():
+    dense = random_matrix(200, 300)
+    operator = NormalOperator(jacobian(dense))
+    jacobi = preconditioner(PRECONDITIONER_JACOBI, operator)
+    _, iterations, converged = least_squares(operator, numpy.ones(200), jacobi, 1e-10, 3)
+    assert iterations == 3
+    assert not converged
+
+
+def test_forcing_term_missed():
+    forcing_term = ForcingTerm()
+    forcing_term.next([10.0])
+    assert forcing_term.next([1.0]) == pytest.approx(0.009)
+    # Slow convergence after a step less accurate than asked : not looser
+    forcing_term.missed = True
+    assert forcing_term.next([0.9]) == pytest.approx(0.009)
+    assert not forcing_term.missed
+    assert forcing_term.next([0.8]) == krylov.MAX_FORCING_TERM
+
+
+def test_least_squares_check():
+    dense = random_matrix(200, 300)
+    operator = NormalOperator(jacobian(dense))
+    jacobi = preconditioner(PRECONDITIONER_JACOBI, operator)
+    checks = []
+
+    def check():
+        checks.append(True)
+        if len(checks) > 3:
+            raise StopIteration
+
+    with pytest.raises(StopIteration):
+        least_squares(operator, numpy.ones(200), jacobi, 1e-10, 1000, check)
+    assert len(checks) == 4
@@ -0,0 +1,104 @@
+import numpy
+
+from ..rank import BLOCK_SIZE, factorization_work, gram_terms, rank_analysis
+
+
+def nonzero_terms(a):
+    rows, cols = numpy.nonzero(a)
+    return rows, cols, a[rows, cols]
+
+
+def analysis(a, spectrum=False):
+    a = numpy.asarray(a, dtype=float)
+    return rank_analysis(*nonzero_terms(a), a.shape[0], 1e-4, spectrum)
+
+
+def test_gram_terms():
+    a = numpy.array([[1.0, 2, 0], [0, 3, 4], [5, 0, 6]])
+    i, j, values = gram_terms(*nonzero_terms(a))
+    gram = numpy.zeros((3, 3))
+    numpy.add.at(gram, (i, j), values)
+    assert numpy.all(i >= j)
+    assert numpy.allclose(gram, numpy.tril(a @ a.T))
+
+
+def test_rank_analysis():
+    ret = analysis([[1, 2, 3], [4, 5, 6], [5, 7, 9], [0, 0, 1]])
+    assert ret["rank"] == 3
+    # Sum of the first two rows
+    assert ret["redundant"] == [2]
+
+
+def test_rank_analysis_duplicated_and_zero_rows():
+    ret = analysis([[1, 0, 0], [0, 0, 0], [1, 0, 0], [0, 1, 0]])
+    assert ret["rank"] == 2
+    assert ret["redundant"] == [1, 2]
+
+
+def test_rank_analysis_empty():
+    ret = analysis(numpy.zeros((0, 3)), spectrum=True)
+    assert ret["rank"] == 0
+    assert ret["redundant"] == []
+    assert len(ret["singular_values"]) == 0
+
+
+def test_rank_analysis_spectrum():
+    a = numpy.array([[3.0, 0, 0], [0, 0, 2], [0, 0, 4]])
+    ret = analysis(a, spectrum=True)
+    assert ret["rank"] == 2
+    assert numpy.allclose(ret["singular_values"], [numpy.sqrt(20), 3, 0])
+
+
+def test_rank_analysis_small_singular_values():
+    # Far under the precision of the gram matrix eigenvalues
+    q, _ = numpy.linalg.qr(numpy.random.default_rng(3).normal(size=(4, 4)))
+    expected = [2, 1, 1e-9, 1e-11]
+    ret = analysis(q @ numpy.diag(expected) @ q.T, spectrum=True)
+    assert numpy.allclose(ret["singular_values"], expected, rtol=1e-4, atol=0)
+
+
+def test_rank_analysis_same_as_numpy():
+    rng = numpy.random.default_rng(42)
+    for _ in range(20):
+        nb_equations = int(rng.integers(1, 40))
+        a = rng.normal(size=(nb_equations, int(rng.integers(1, 40))))
+        a[rng.random(a.shape) < 0.7] = 0
+        # Some combinations of rows
+        for k in rng.integers(0, nb_equations, size=3):
+            a[k] = a[rng.integers(0, nb_equations)] - 2 * a[rng.integers(0, nb_equations)]
+        assert analysis(a)["rank"] == numpy.linalg.matrix_rank(a, tol=1e-8)
+
+
+def test_rank_analysis_banded():
+    # Chain of distances along x, shuffled so the band is only found back by
+    # the reordering, with a closing duplicate of the first equation
+    n = 4 * BLOCK_SIZE
+    a = numpy.zeros((n + 1, n + 1))
+    for k in range(n):
+        a[k, k] = 1
+        a[k, k + 1] = -1
+    a[n] = a[0]
+    order = numpy.random.default_rng(0).permutation(n + 1)
+    ret = analysis(a[order])
+    assert ret["rank"] == n
+    assert len(ret["redundant"]) == 1
+    assert order[ret["redundant"][0]] in (0, n)
+
+
+def test_rank_analysis_max_work():
+    n = 4 * BLOCK_SIZE
+    chain = numpy.zeros((n, n + 1))
+    for k in range(n):
+        chain[k, k] = 1
+        chain[k, k + 1] = -1
+    dense = numpy.random.default_rng(0).normal(size=(n, n + 1))
+    works = []
+    for a in (chain, dense):
+        i, j, _ = gram_terms(*nonzero_terms(a))
+        works.append(factorization_work(i, j, n))
+    # A band of 1 against the whole matrix
+    assert 0 < 4 * works[0] < works[1]
+    ret = rank_analysis(*nonzero_terms(dense), n, 1e-4, True, works[1] - 1)
+    assert ret == {"rank": None, "redundant": None, "singular_values": None}
+    ret = rank_analysis(*nonzero_terms(dense), n, 1e-4, max_work=works[1])
+    assert ret["rank"] == n
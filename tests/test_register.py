@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+MOCK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock")
+# Modules too slow to import at blender startup, only needed by a solve
+HEAVY_MODULES = ["sympy", "mpmath", "scipy"]
+
+BENCHMARK = """
+import json, sys, time
+sys.path[:0] = [{mock!r}, {root!r}]
+start = time.perf_counter()
+import {package}
+imported = time.perf_counter()
+{package}.register()
+registered = time.perf_counter()
+{package}.unregister()
+print(json.dumps({{
+    "import": imported - start,
+    "register": registered - start,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_register():
+    """Import and register the addon with the blender mocks in a new interpreter,
+    return a dict with "import" and "register" (import included) durations
+    in seconds and "heavy" the heavy modules imported"""
+    package = __package__.rsplit(".", 1)[0]
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = BENCHMARK.format(mock=MOCK, root=root, package=package, heavy=HEAVY_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_register_does_not_import_heavy_modules():
+    timings = measure_register()
+    print(f"import {timings['import']:.3f}s register {timings['register']:.3f}s")
+    assert timings["heavy"] == []
@@ -1,6 +1,28 @@
 import pytest
 import math
-from ..solver import Solver, EPSILON, NewtonSolver, symbols, sqrt, MeshPoint
+import json
+import os
+import random
+import subprocess
+import sys
+import types
+import numpy
+from sympy import symbols, sqrt
+from ..solver import (
+    Solver,
+    EPSILON,
+    NewtonSolver,
+    MeshPoint,
+    PointStore,
+    solve_payload,
+    METHOD_NEWTON,
+    METHOD_LEVENBERG_MARQUARDT,
+    METHOD_BROYDEN,
+    METHODS,
+)
+from ..budget import CancelToken
+from ..kernels import RESIDUALS, register_kind
+from .. import convergence
 
 
 class Vector3:
@@ -99,6 +121,30 @@ def test_newton_solver_eval_jacobian():
     assert s.a[1][z_index] == 1
 
 
+def test_newton_solver_compiled_matches_evalf():
+    x = symbols("x")
+    y = symbols("y")
+    z = symbols("z")
+    equations = [
+        sqrt((x - y) ** 2 + z ** 2) - 3,
+        x * y - z ** 3,
+        x - 4,
+    ]
+    initial_values = {x: 1.5, y: -2.25, z: 0.75}
+    s = NewtonSolver(equations, initial_values)
+    s.prepare_matrix()
+
+    s._eval_b()
+    s._eval_jacobian()
+
+    for i in range(s.nb_equations):
+        assert equal_float(s.b[i], float(equations[i].evalf(subs=initial_values)))
+        for j in range(s.nb_params):
+            ref = float(s.a_eq[i][j].evalf(subs=initial_values))
+            assert equal_float(s.a[i][j], ref)
+            assert isinstance(s.a[i][j], (int, float))
+
+
 def test_compute_aat():
     x = symbols("x")
     y = symbols("y")
@@ -775,3 +821,774 @@ def test_solver_angle_2d():
     assert equal_float(p2.x, 1)
     assert equal_float(p2.y, 1)
     assert equal_float(p2.z, 0)
+
+
+def test_solver_components():
+    s = Solver(
+        [
+            MeshPoint(0, Vector3(0, 0, 0)),
+            MeshPoint(1, Vector3(1, 1, 1)),
+            MeshPoint(2, Vector3(10, 10, 10)),
+            MeshPoint(3, Vector3(20, 20, 20)),
+        ]
+    )
+    # First cluster on 0 and 1
+    s.fix_x(42, 0, 0)
+    s.fix_y(42, 0, 0)
+    s.fix_z(42, 0, 0)
+    s.distance_2_vertices(43, 0, 1, 2)
+    # Second cluster on 2 and 3
+    s.distance_2_vertices(44, 2, 3, 30)
+
+    assert len(s.components()) == 2
+
+    ret = s.solve()
+    assert ret["solved"]
+    assert len(ret["components"]) == 2
+    points = ret["points"]
+    p0, p1, p2, p3 = points
+    assert equal_float(math.sqrt((p0.x - p1.x) ** 2 + (p0.y - p1.y) ** 2 + (p0.z - p1.z) ** 2), 2)
+    assert equal_float(math.sqrt((p2.x - p3.x) ** 2 + (p2.y - p3.y) ** 2 + (p2.z - p3.z) ** 2), 30)
+
+
+def test_solver_components_error_only_in_failing_component():
+    s = Solver(
+        [
+            MeshPoint(0, Vector3(0, 0, 0)),
+            MeshPoint(1, Vector3(1, 1, 1)),
+            MeshPoint(2, Vector3(10, 10, 10)),
+            MeshPoint(3, Vector3(20, 20, 20)),
+        ]
+    )
+    # This cluster is fine
+    s.distance_2_vertices(42, 0, 1, 2)
+    # This one can't be solved
+    s.distance_2_vertices(43, 2, 3, 30)
+    s.distance_2_vertices(44, 2, 3, 20)
+
+    ret = s.solve()
+    assert ret["solved"] is False
+    assert 42 not in ret["equations_in_error"]
+    assert set(ret["equations_in_error"]) <= {43, 44}
+    assert len(ret["equations_in_error"]) > 0
+    reports = ret["components"]
+    assert len(reports) == 2
+    assert reports[0]["solved"]
+    assert reports[1]["solved"] is False
+
+
+def build_two_clusters_solver():
+    s = Solver(
+        [
+            MeshPoint(0, Vector3(0, 0, 0)),
+            MeshPoint(1, Vector3(1, 1, 1)),
+            MeshPoint(2, Vector3(10, 10, 10)),
+            MeshPoint(3, Vector3(20, 20, 20)),
+        ]
+    )
+    s.fix_x(42, 0, 0)
+    s.fix_y(42, 0, 0)
+    s.fix_z(42, 0, 0)
+    s.distance_2_vertices(43, 0, 1, 2)
+    s.distance_2_vertices(44, 2, 3, 30)
+    s.on_x(45, 2, 3)
+    return s
+
+
+def test_solve_payload():
+    s = build_two_clusters_solver()
+    components = s.components()
+    payload = s._component_payload(components[1])
+    assert payload["points"] == [2, 3]
+    assert payload["equations"][0] == ("distance", [0, 1], None, 30)
+    assert "sympy" not in repr(payload)
+
+    ret = solve_payload(payload)
+    assert ret["solved"]
+    values = {(p, axis): value for p, axis, value in ret["values"]}
+    assert len(values) == 6
+    (x2, y2, z2), (x3, y3, z3) = [[values[(p, a)] for a in range(3)] for p in range(2)]
+    assert isinstance(x2, float)
+    assert equal_float(math.sqrt((x2 - x3) ** 2 + (y2 - y3) ** 2 + (z2 - z3) ** 2), 30)
+    assert equal_float(y2, y3)
+    assert equal_float(z2, z3)
+
+
+def test_solver_components_in_pool():
+    ref = build_two_clusters_solver().solve(workers=1)
+    ret = build_two_clusters_solver().solve(workers=2)
+    assert ret["solved"]
+    assert ret["rank"] == ref["rank"]
+    for point, ref_point in zip(ret["points"], ref["points"]):
+        for value, ref_value in zip(point.xyz, ref_point.xyz):
+            assert equal_float(value, ref_value)
+
+
+def test_solver_components_in_pool_same_point():
+    # Components on different axes of point 0 : x fixed, y and z equal to p1
+    points = [MeshPoint(0, Vector3(0, 3, 0)), MeshPoint(1, Vector3(1, 1, 1))]
+    for workers in (1, 2):
+        s = Solver(points)
+        s.fix_x(0, 0, 5.0)
+        s.on_x(1, 0, 1)
+        assert len(s.components()) > 1
+        ret = s.solve(workers=workers)
+        assert ret["solved"]
+        assert [p.xyz for p in ret["points"]] == [(5, 1, 1), (1, 1, 1)]
+
+
+def test_solver_components_in_pool_error():
+    s = build_two_clusters_solver()
+    s.distance_2_vertices(46, 2, 3, 20)
+    ret = s.solve(workers=2)
+    assert ret["solved"] is False
+    assert set(ret["equations_in_error"]) <= {44, 45, 46}
+    assert len(ret["equations_in_error"]) > 0
+
+
+SPAWN_WORKERS = """
+import concurrent.futures, importlib, json, multiprocessing, sys
+sys.path[:0] = [{root!r}]
+# Solver.solve pool too
+multiprocessing.set_start_method("spawn")
+solver = importlib.import_module("{package}.solver")
+points = [solver.MeshPoint.from_xyz(i, i, i % 2, 0) for i in range(4)]
+s = solver.Solver(points)
+s.fix_x(0, 0, 0)
+s.distance_2_vertices(1, 0, 1, 2)
+s.distance_2_vertices(2, 2, 3, 3)
+payloads = [s._component_payload(c) for c in s.components()]
+context = multiprocessing.get_context("spawn")
+with concurrent.futures.ProcessPoolExecutor(2, mp_context=context) as executor:
+    spawned = executor.submit(solver.solve_payloads, payloads).result()
+print(json.dumps({{
+    "bpy": "bpy" in sys.modules,
+    "spawned": [ret["values"] for ret in spawned],
+    "expected": [ret["values"] for ret in solver.solve_payloads(payloads)],
+    "solved": s.solve(workers=2)["solved"],
+}}))
+"""
+
+
+def test_solver_workers_spawned():
+    # Workers started by spawn (windows, macos) import the package again,
+    # in a plain python without the blender modules
+    package = __package__.rsplit(".", 1)[0]
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = SPAWN_WORKERS.format(root=root, package=package)
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True, env=env
+    ).stdout
+    ret = json.loads(output.strip().splitlines()[-1])
+    assert not ret["bpy"]
+    assert ret["spawned"] == ret["expected"]
+    assert ret["solved"]
+
+
+def test_solver_sequencing():
+    s = Solver(
+        [
+            MeshPoint(0, Vector3(0, 0, 0)),
+            MeshPoint(1, Vector3(1, 1, 1)),
+            MeshPoint(2, Vector3(2, 0.5, 1)),
+        ],
+        sequencing=True,
+    )
+    s.fix_x(42, 0, 0)
+    s.fix_y(42, 0, 0)
+    s.fix_z(42, 0, 0)
+    s.on_x(43, 0, 1)
+    s.distance_2_vertices(44, 0, 1, 3)
+    s.fix_z(45, 2, 0)
+    s.fix_y(45, 2, 1)
+    s.distance_2_vertices(46, 1, 2, 2)
+    ret = s.solve()
+    assert ret["solved"]
+    sequence = ret["components"][0]["sequence"]
+    assert sequence["over"] == []
+    # Chain of tiny blocks, not a single system
+    assert sequence["blocks"] == [1] * 9
+    assert sequence["under"] == []
+
+    p0, p1, p2 = ret["points"]
+    assert equal_float(p1.y, 0)
+    assert equal_float(p1.z, 0)
+    assert equal_float(p1.x, 3)
+    d = math.sqrt((p1.x - p2.x) ** 2 + (p1.y - p2.y) ** 2 + (p1.z - p2.z) ** 2)
+    assert equal_float(d, 2)
+
+
+def test_solver_sequencing_over_determined_error():
+    s = Solver(
+        [MeshPoint(0, Vector3(0, 0, 0)), MeshPoint(1, Vector3(1, 1, 1))],
+        sequencing=True,
+    )
+    s.fix_x(42, 0, 0)
+    s.fix_x(43, 0, 1)
+    s.distance_2_vertices(44, 0, 1, 3)
+    ret = s.solve()
+    assert ret["solved"] is False
+    assert set(ret["equations_in_error"]) <= {42, 43}
+    assert ret["components"][0]["sequence"]["failed"] == "over"
+
+
+def test_solver_symbolic_same_as_kernels():
+    # Fully constrained, so both must find the same solution
+    def build():
+        s = Solver(
+            [
+                MeshPoint(0, Vector3(0, 0, 0)),
+                MeshPoint(1, Vector3(1, 0.2, 0)),
+                MeshPoint(2, Vector3(0.1, 1, 0)),
+            ]
+        )
+        for p in range(3):
+            s.fix_z(42, p, 0)
+        s.fix_x(43, 0, 0)
+        s.fix_y(43, 0, 0)
+        s.on_x(44, 0, 1)
+        s.distance_2_vertices(45, 0, 1, 2)
+        s.distance_2_vertices(46, 0, 2, 3)
+        s.perpendicular(47, 0, 1, 0, 2)
+        return s
+
+    kernels = build().solve()
+    s = build()
+    s.symbolic = True
+    symbolic = s.solve()
+    assert kernels["solved"]
+    assert symbolic["solved"]
+    for p0, p1 in zip(kernels["points"], symbolic["points"]):
+        assert equal_float(p0.x, p1.x)
+        assert equal_float(p0.y, p1.y)
+        assert equal_float(p0.z, p1.z)
+
+
+def build_random_chain_solver(seed, method):
+    """Chain of distances and angles from a random, far from the solution, mesh"""
+    rnd = random.Random(seed)
+    nb = 8
+    points = [
+        MeshPoint(
+            i, Vector3(rnd.uniform(-1, 1), rnd.uniform(-1, 1), rnd.uniform(-1, 1))
+        )
+        for i in range(nb)
+    ]
+    s = Solver(points, method=method)
+    s.fix_x(0, 0, 0)
+    s.fix_y(0, 0, 0)
+    s.fix_z(0, 0, 0)
+    for i in range(nb - 1):
+        s.distance_2_vertices(i + 1, i, i + 1, rnd.uniform(0.5, 5))
+    for i in range(nb - 3):
+        s.angle(100 + i, i, i + 1, i + 1, i + 2, rnd.uniform(20, 160))
+    s.perpendicular(200, 0, 1, 2, 3)
+    return s
+
+
+def test_solver_levenberg_marquardt():
+    # Not a hand picked mesh : more robust than Newton over a range of them
+    solved = {METHOD_NEWTON: 0, METHOD_LEVENBERG_MARQUARDT: 0}
+    for seed in range(20):
+        for method in solved:
+            s = build_random_chain_solver(seed, method)
+            ret = s.solve()
+            if not ret["solved"]:
+                continue
+            solved[method] += 1
+            for kind, points, axis, value in s.equations_records:
+                if kind == "distance":
+                    p0, p1 = [ret["points"][p] for p in points]
+                    d = (p0.x - p1.x) ** 2 + (p0.y - p1.y) ** 2 + (p0.z - p1.z) ** 2
+                    assert equal_float(d ** 0.5, value)
+    assert solved[METHOD_LEVENBERG_MARQUARDT] >= solved[METHOD_NEWTON]
+    assert solved[METHOD_LEVENBERG_MARQUARDT] > 0
+
+
+def test_newton_solver_levenberg_marquardt():
+    x = symbols("x")
+    y = symbols("y")
+    equations = [
+        x + y - 5,
+        2 * x - 3 * y,
+    ]
+    s = NewtonSolver(equations, {x: 0, y: 0}, method=METHOD_LEVENBERG_MARQUARDT)
+    ret = s.solve()
+    assert ret["solved"]
+    assert equal_float(ret["values"][x], 3)
+    assert equal_float(ret["values"][y], 2)
+    assert ret["iterations"] > 0
+
+
+def test_solver_unknown_method():
+    with pytest.raises(Exception):
+        Solver([], method="nope")
+
+
+def build_chain_solver(nb, method):
+    """Chain of unit distances in the XY plane, fixed at its start"""
+    points = [
+        MeshPoint(i, Vector3(1.1 * i, 0.3 * (i % 3), 0.2 * (i % 2)))
+        for i in range(nb)
+    ]
+    s = Solver(points, method=method)
+    s.fix_x(0, 0, 0)
+    s.fix_y(0, 0, 0)
+    s.fix_z(0, 0, 0)
+    for i in range(nb - 1):
+        s.distance_2_vertices(i + 1, i, i + 1, 1.0)
+        s.fix_z(i + 1, i + 1, 0)
+    return s
+
+
+def test_solver_broyden():
+    newton = build_chain_solver(20, METHOD_NEWTON).solve()
+    ret = build_chain_solver(20, METHOD_BROYDEN).solve()
+    assert ret["solved"]
+    assert ret["iterations"] < newton["iterations"]
+    points = ret["points"]
+    for i in range(19):
+        p0 = points[i]
+        p1 = points[i + 1]
+        d = (p0.x - p1.x) ** 2 + (p0.y - p1.y) ** 2 + (p0.z - p1.z) ** 2
+        assert equal_float(d, 1.0)
+        assert equal_float(p1.z, 0)
+
+
+def test_newton_solver_broyden_update():
+    x, y, z = symbols("x y z")
+    equations = [x * y - 2, y * z + x - 3]
+    s = NewtonSolver(equations, {x: 1, y: 2, z: 3}, method=METHOD_BROYDEN)
+    s.prepare_matrix()
+    s._eval_jacobian()
+    dx = [0.1, -0.2, 0.3]
+    db = [0.5, -0.25]
+    s._broyden_update(numpy.array(dx), numpy.array(db))
+    # Secant equation : updated jacobian * dx == db, row by row
+    for i in range(2):
+        adx = 0
+        for (row, col), value in zip(s.a_nonzero, s.nonzero_values):
+            if row == i:
+                adx += value * dx[col]
+        assert equal_float(adx, db[i])
+    # and the structure is kept
+    assert len(s.nonzero_values) == len(s.a_nonzero)
+
+
+def test_solver_incremental():
+    s = build_two_clusters_solver()
+    ret = s.solve()
+    assert ret["solved"]
+    assert [c["unchanged"] for c in ret["components"]] == [False, False]
+
+    # Same constraints plus one in the second cluster, from the solved points
+    s2 = build_two_clusters_solver()
+    for point, solved in zip(s2.points, ret["points"]):
+        point.x_value, point.y_value, point.z_value = solved.xyz
+    s2.fix_x(46, 2, 10)
+    s2.last_solve = s.last_solve
+    ret2 = s2.solve()
+    assert ret2["solved"]
+    assert [c["unchanged"] for c in ret2["components"]] == [True, False]
+    assert ret2["components"][0]["iterations"] == 0
+    assert ret2["components"][0]["rank"] == ret["components"][0]["rank"]
+    assert equal_float(ret2["points"][2].x, 10)
+
+    # A moved point is solved again
+    s3 = build_two_clusters_solver()
+    for point, solved in zip(s3.points, ret2["points"]):
+        point.x_value, point.y_value, point.z_value = solved.xyz
+    s3.fix_x(46, 2, 10)
+    s3.points[1].x_value += 1
+    s3.last_solve = s2.last_solve
+    ret3 = s3.solve()
+    assert ret3["solved"]
+    assert [c["unchanged"] for c in ret3["components"]] == [False, True]
+
+
+def test_solver_redundant():
+    s = Solver(
+        [
+            MeshPoint(0, Vector3(0, 0, 0)),
+            MeshPoint(1, Vector3(1, 1, 1)),
+            MeshPoint(2, Vector3(10, 10, 10)),
+        ]
+    )
+    s.fix_x(42, 0, 0)
+    s.fix_y(42, 0, 0)
+    s.fix_z(42, 0, 0)
+    s.distance_2_vertices(43, 0, 1, 2)
+    # Same constraint again
+    s.distance_2_vertices(44, 0, 1, 2)
+    s.distance_2_vertices(45, 0, 2, 3)
+    ret = s.solve()
+    assert ret["solved"]
+    assert ret["rank_ok"] is False
+    assert ret["redundant"] == [44]
+    assert ret["components"][0]["redundant"] == [4]
+
+
+def build_conflicting_chain_solver(n):
+    """Chain of n distances of 1 along x, its ends fixed n + 0.5 apart"""
+    s = Solver([MeshPoint(i, Vector3(i * 1.1, 0, 0)) for i in range(n + 1)])
+    s.fix_x(0, 0, 0)
+    s.fix_y(0, 0, 0)
+    s.fix_z(0, 0, 0)
+    for i in range(n):
+        s.on_x(1 + i, i, i + 1)
+        s.distance_2_vertices(1 + n + i, i, i + 1, 1)
+    s.fix_x(1 + 2 * n, n, n + 0.5)
+    return s
+
+
+def test_solver_conflict_localized():
+    n = 20
+    s = build_conflicting_chain_solver(n)
+    ret = s.solve(workers=1)
+    assert ret["solved"] is False
+    # Residuals are on all the distances, but removing one of them,
+    # or the last fix, is enough
+    assert len(ret["equations_in_error"]) == 1
+    assert n + 1 <= ret["equations_in_error"][0] <= 2 * n + 1
+    assert s.find_which_to_remove_to_fix_jacobian(ret) == ret["equations_in_error"]
+
+
+def test_solver_find_which_to_remove_to_fix_jacobian():
+    s = Solver([MeshPoint(0, Vector3(0, 0, 0)), MeshPoint(1, Vector3(1, 1, 1))])
+    s.fix_x(42, 0, 0)
+    s.fix_y(42, 0, 0)
+    s.fix_z(42, 0, 0)
+    s.distance_2_vertices(43, 0, 1, 2)
+    s.distance_2_vertices(44, 0, 1, 2)
+    assert s.find_which_to_remove_to_fix_jacobian() == [44]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_solver_rank_max_work(workers):
+    s = Solver([MeshPoint(i, Vector3(i, 1, 1)) for i in range(4)])
+    for p in (0, 2):
+        s.fix_x(42 + p, p, 0)
+        s.fix_y(42 + p, p, 0)
+        s.fix_z(42 + p, p, 0)
+        s.distance_2_vertices(43 + p, p, p + 1, 2)
+    # Same constraint again
+    s.distance_2_vertices(46, 0, 1, 2)
+    ret = s.solve(workers=workers, rank_max_work=0)
+    assert ret["solved"]
+    # Rank analysis skipped
+    assert ret["rank"] is None
+    assert ret["rank_ok"] is None
+    assert ret["dof"] is None
+    assert ret["redundant"] == []
+    # Done on demand, the unchanged components are solved again for it
+    skipped = ret
+    ret = s.solve(workers=workers, rank_max_work=None)
+    assert [c["unchanged"] for c in ret["components"]] == [False, False]
+    assert ret["rank_ok"] is False
+    assert ret["redundant"] == [46]
+    # Known ranks are kept by the next solves
+    ret = s.solve(workers=workers)
+    assert [c["unchanged"] for c in ret["components"]] == [True, True]
+    assert ret["rank"] == 8
+    assert s.find_which_to_remove_to_fix_jacobian(skipped) == [46]
+
+
+def _sum_distances_residual(params, axis, value, f):
+    """|p0-p1| + |p1-p2| - value"""
+    (x0, y0, z0), (x1, y1, z1), (x2, y2, z2) = params
+    return (
+        f.sqrt((x0 - x1) ** 2 + (y0 - y1) ** 2 + (z0 - z1) ** 2)
+        + f.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2 + (z1 - z2) ** 2)
+        - value
+    )
+
+
+@pytest.mark.parametrize("symbolic", [False, True])
+def test_solver_custom_equation(symbolic):
+    if "sum_distances" not in RESIDUALS:
+        register_kind("sum_distances", _sum_distances_residual)
+    s = Solver(
+        [
+            MeshPoint(0, Vector3(0, 0, 0)),
+            MeshPoint(1, Vector3(1, 1, 0)),
+            MeshPoint(2, Vector3(3, 0, 0)),
+        ],
+        symbolic=symbolic,
+    )
+    for p in (0, 2):
+        s.fix_x(p, p, 2 * p)
+        s.fix_y(p, p, 0)
+        s.fix_z(p, p, 0)
+    s.fix_z(1, 1, 0)
+    s.fix_x(1, 1, 2)
+    s.custom_equation(3, "sum_distances", (0, 1, 2), 6)
+    ret = s.solve(workers=1)
+    assert ret["solved"]
+    p1 = ret["points"][1]
+    assert equal_float(abs(p1.y), math.sqrt(5))
+    with pytest.raises(Exception):
+        s.custom_equation(4, "nope", (0, 1), 0)
+
+
+def test_point_store():
+    store = PointStore([7, 3], [[1, 2, 3], [4, 5, 6]])
+    assert len(store) == 2
+    assert 3 in store and 0 not in store
+    assert store.xyz(3) == (4.0, 5.0, 6.0)
+    point = store[7]
+    assert store[7] is point
+    assert (point.index, point.xyz) == (7, (1.0, 2.0, 3.0))
+    assert [p.index for p in store] == [7, 3]
+    # Points are views on the store
+    store.set_values({(7, 1): 42.0, (3, 2): -1.0})
+    assert point.y == 42.0
+    assert store.xyz(3) == (4.0, 5.0, -1.0)
+    point.x_value = 10
+    assert store.coordinates[0, 0] == 10
+    # MeshPoint are light
+    assert not hasattr(point, "__dict__")
+
+    copy = store.copy()
+    assert not store.moved(copy, 1e-9).any()
+    copy.coordinates[1, 0] += 1
+    assert store.moved(copy, 1e-9).tolist() == [False, True]
+    assert PointStore([3]).moved(store, 1e-9).tolist() == [True]
+    assert PointStore([5]).moved(store, 1e-9).tolist() == [True]
+    with pytest.raises(Exception):
+        PointStore([1, 1])
+    with pytest.raises(Exception):
+        PointStore([1], [[1, 2, 3], [4, 5, 6]])
+
+
+def test_point_store_from_vertices():
+    vertices = [types.SimpleNamespace(co=(i, 2 * i, 3 * i)) for i in range(10)]
+    store = PointStore.from_vertices(vertices, [2, 5])
+    assert store.xyz(5) == (5.0, 10.0, 15.0)
+    assert PointStore.from_points([MeshPoint(4, Vector3(1, 2, 3))]).xyz(4) == (
+        1.0,
+        2.0,
+        3.0,
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_solver_sparse_points(workers):
+    # Only the constrained vertices of a big mesh, by their mesh index
+    store = PointStore([499999, 12, 70000], [[0, 0, 0], [1.1, 0.1, 0], [5, 5, 5]])
+    s = Solver(store)
+    s.fix_x(0, 499999, 0)
+    s.fix_y(0, 499999, 0)
+    s.fix_z(0, 499999, 0)
+    s.distance_2_vertices(1, 499999, 12, 2)
+    s.on_x(2, 499999, 12)
+    s.fix_x(3, 70000, 1)
+    assert s.points_indices() == [12, 70000, 499999]
+    ret = s.solve(workers=workers)
+    assert ret["solved"]
+    assert [p.index for p in ret["points"]] == [499999, 12, 70000]
+    assert equal_float(abs(store.xyz(12)[0]), 2)
+    assert equal_float(store.xyz(12)[1], 0)
+    assert store.xyz(70000) == (1.0, 5.0, 5.0)
+
+
+@pytest.mark.parametrize("workers, symbolic", [(1, False), (2, False), (1, True)])
+def test_solver_profile(workers, symbolic):
+    points = [MeshPoint.from_xyz(i, i * 1.1, 0.1 * i, 1) for i in range(9)]
+    s = Solver(points, symbolic=symbolic)
+    for component in range(3):
+        p0, p1, p2 = 3 * component, 3 * component + 1, 3 * component + 2
+        s.fix_x(0, p0, 1)
+        s.fix_y(0, p0, 1)
+        s.fix_z(0, p0, 1)
+        s.distance_2_vertices(1, p0, p1, 2)
+        s.distance_2_vertices(2, p1, p2, 2)
+        s.fix_z(3, p1, 1)
+        s.fix_z(3, p2, 1)
+    assert "timings" not in s.solve(workers=workers)
+    s.points[0].x_value = 0.5
+    s.points[3].x_value = 0.5
+    ret = s.solve(workers=workers, profile=True)
+    assert ret["solved"]
+    times, counts = ret["timings"]["times"], ret["timings"]["counts"]
+    for phase in ("components", "equations", "presolve", "jacobian", "rank"):
+        assert times[phase] >= 0
+    assert ("workers" in times) == (workers > 1)
+    # Only the moved components are solved again
+    assert counts["components"] == 3
+    assert counts["unchanged_components"] == 1
+    assert counts["iterations"] == ret["iterations"] > 0
+    # One jacobian evaluation by iteration, and one for the rank of each component
+    assert counts["jacobian_evaluations"] == ret["iterations"] + 2
+    # Fixed coordinates are eliminated, x and y of two points left
+    assert counts["eliminated_variables"] == 10
+    assert counts["variables"] == 8
+    assert s.timings.enabled is False
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("method", [METHOD_NEWTON, METHOD_LEVENBERG_MARQUARDT])
+def test_solver_history(workers, method):
+    points = [MeshPoint.from_xyz(i, i * 1.1, 0.1 * i, 1) for i in range(6)]
+    s = Solver(points, method=method)
+    for component in range(2):
+        p0, p1, p2 = 3 * component, 3 * component + 1, 3 * component + 2
+        s.fix_x(10 * component, p0, 0)
+        s.fix_y(10 * component, p0, 0)
+        s.fix_z(10 * component, p0, 0)
+        s.distance_2_vertices(10 * component + 1, p0, p1, 2)
+        s.distance_2_vertices(10 * component + 2, p1, p2, 2)
+    ret = s.solve(workers=workers, history=True)
+    assert ret["solved"]
+    history = ret["history"]
+    assert history.shape[1] == len(convergence.COLUMNS)
+    for component in range(2):
+        rows = history[history[:, 0] == component]
+        # The start of the solve then one row by step
+        assert rows[0, 3] == 0
+        assert rows[-1, 1] == ret["components"][component]["iterations"]
+        assert rows[-1, 2] < 1e-8 < rows[0, 2]
+        assert numpy.all(rows[1:, 3] > 0)
+        assert numpy.all(rows[1:, 4] > 0) == (method == METHOD_LEVENBERG_MARQUARDT)
+        # Worst equations are distances of this component
+        for worst in rows[:-1, 5].astype(int):
+            assert s.equations_constraints[worst] in (
+                10 * component + 1,
+                10 * component + 2,
+            )
+    assert "history" not in s.solve(workers=workers)
+
+
+class CountdownToken(CancelToken):
+    """Cancelled after a number of checks"""
+
+    def __init__(self, checks):
+        super().__init__()
+        self.checks = checks
+
+    @property
+    def cancelled(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+def chain_solver(method=METHOD_NEWTON, symbolic=False, nb_points=8, nb_chains=1):
+    """Chains of distances, far from the solution, one component each"""
+    points = [
+        MeshPoint.from_xyz(c * nb_points + i, i * 1.5, 0.3 * (i % 2), c)
+        for c in range(nb_chains)
+        for i in range(nb_points)
+    ]
+    s = Solver(points, method=method, symbolic=symbolic)
+    for c in range(nb_chains):
+        first = c * nb_points
+        s.fix_x(first, first, 0)
+        s.fix_y(first, first, 0)
+        s.fix_z(first, first, c)
+        for p in range(first + 1, first + nb_points):
+            s.distance_2_vertices(p, p - 1, p, 1)
+            s.fix_z(p, p, c)
+    return s
+
+
+@pytest.mark.parametrize("symbolic", [False, True])
+@pytest.mark.parametrize("method", METHODS)
+def test_solver_cancelled(method, symbolic):
+    s = chain_solver(method, symbolic)
+    start = s.points.coordinates.copy()
+    start_residual = numpy.linalg.norm(s.residuals())
+    # Cancelled a few checks before the end of the solve
+    counter = CountdownToken(1000)
+    assert chain_solver(method, symbolic).solve(cancel=counter)["solved"]
+    ret = s.solve(cancel=CountdownToken(1000 - counter.checks - 4))
+    assert not ret["solved"]
+    assert ret["reason"] == "cancelled"
+    assert ret["equations_in_error"] == []
+    assert ret["iterations"] > 0
+    # Best values found, not applied
+    assert numpy.array_equal(s.points.coordinates, start)
+    partial = PointStore.from_points(ret["partial_points"])
+    assert ret["residual"] < start_residual
+    assert equal_float(ret["residual"], numpy.linalg.norm(s.residuals(partial)))
+    assert ret["components"][0]["residual"] <= ret["residual"] + EPSILON
+    # The budget is only for this solve
+    assert s.solve()["solved"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_solver_time_budget(workers):
+    s = chain_solver(nb_chains=2)
+    ret = s.solve(workers=workers, time_budget=0)
+    assert ret["reason"] == "timeout"
+    assert [c["reason"] for c in ret["components"]] == ["timeout"] * 2
+    # Nothing solved, the start
+    partial = [point.xyz for point in ret["partial_points"]]
+    assert partial == [point.xyz for point in s.points]
+    assert equal_float(ret["residual"], numpy.linalg.norm(s.residuals()))
+    assert s.solve(workers=workers, time_budget=60)["solved"]
+
+
+def test_solver_cancelled_pool():
+    s = chain_solver(nb_chains=2)
+    token = CancelToken()
+    token.cancel()
+    ret = s.solve(workers=2, cancel=token)
+    assert ret["reason"] == "cancelled"
+    assert len(ret["partial_points"]) == 16
+
+
+def test_solver_residuals():
+    s = chain_solver(nb_points=3)
+    s.angle(5, 0, 1, 1, 2, 90)
+    residuals = s.residuals()
+    assert len(residuals) == len(s.equations_records)
+    assert equal_float(residuals[3], math.hypot(1.5, 0.3) - 1)
+    s.solve()
+    assert numpy.abs(s.residuals()).max() < 1e-8
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_solver_residuals_coincident_points(workers):
+    s = chain_solver(nb_points=3, nb_chains=2)
+    # Angle and distance of coincident points, not defined
+    s.points[1].x_value, s.points[1].y_value, s.points[1].z_value = s.points[0].xyz
+    s.angle(6, 0, 1, 1, 2, 90)
+    residuals = s.residuals()
+    assert set(numpy.flatnonzero(numpy.isnan(residuals))) == {3, 14}
+    # Partial result of a solve stopped before any step
+    ret = s.solve(workers=workers, time_budget=0)
+    assert ret["reason"] == "timeout"
+    assert math.isnan(ret["residual"])
+
+
+@pytest.mark.parametrize("symbolic", [False, True])
+@pytest.mark.parametrize("method", METHODS)
+def test_solver_progress(method, symbolic):
+    s = chain_solver(method, symbolic, nb_chains=2)
+    calls = []
+    ret = s.solve(progress=calls.append, progress_interval=1)
+    assert ret["solved"]
+    # Each iteration of each component, and its solution
+    assert len(calls) >= ret["iterations"] + 2
+    for values in calls:
+        for (p, axis), value in values.items():
+            assert 0 <= p < 16 and 0 <= axis < 3
+            assert isinstance(value, float)
+    solution = {}
+    for values in calls:
+        solution.update(values)
+    for point in ret["points"]:
+        for axis in range(3):
+            if (point.index, axis) in solution:
+                assert equal_float(solution[(point.index, axis)], point.xyz[axis])
+    # Only the solutions with a bigger interval
+    fewer = []
+    assert chain_solver(method, symbolic, nb_chains=2).solve(
+        progress=fewer.append, progress_interval=1000
+    )["solved"]
+    assert len(fewer) == 2
+    # Not called by the next solves
+    nb_calls = len(calls)
+    s.points[1].x_value = 0.5
+    assert s.solve()["solved"]
+    assert len(calls) == nb_calls
@@ -0,0 +1,49 @@
+import time
+from ..timings import NO_TIMINGS, Timings, timed
+
+
+def test_timings_exclusive():
+    timings = Timings()
+    with timings.phase("outer"):
+        time.sleep(0.01)
+        with timings.phase("inner"):
+            time.sleep(0.02)
+    # The inner phase is not counted in the outer one
+    assert 0.01 <= timings.times["outer"] < 0.02
+    assert timings.times["inner"] >= 0.02
+    with timings.phase("inner"):
+        pass
+    assert list(timings.times) == ["outer", "inner"]
+
+
+def test_timings_counts_and_merge():
+    timings = Timings()
+    timings.count("iterations", 3)
+    timings.count("iterations")
+    other = Timings()
+    other.count("iterations", 2)
+    other.times["jacobian"] = 0.5
+    timings.merge(other.as_dict())
+    assert timings.as_dict() == {
+        "times": {"jacobian": 0.5},
+        "counts": {"iterations": 6},
+    }
+    assert str(timings) == "jacobian_ms=500.000 iterations=6"
+
+
+def test_timed():
+    class Solver:
+        def __init__(self, timings):
+            self.timings = timings
+
+        @timed("jacobian")
+        def evaluate(self, value):
+            return value + 1
+
+    timings = Timings()
+    assert Solver(timings).evaluate(1) == 2
+    assert "jacobian" in timings.times
+    # Not profiled, nothing recorded
+    assert Solver(NO_TIMINGS).evaluate(1) == 2
+    NO_TIMINGS.count("iterations")
+    assert not NO_TIMINGS.enabled
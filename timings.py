@@ -0,0 +1,111 @@
+# Opt-in instrumentation of the solve, see Solver.solve(profile=True)
+#
+# Time of each phase and counters, to tell where the time of a slow solve
+# goes. Times are exclusive : a phase started inside another one (a jacobian
+# evaluation inside the rank test for example) is not counted twice.
+# Without profile the solvers use NO_TIMINGS, which does nothing.
+
+import contextlib
+import functools
+import time
+
+# Phases of a solve
+PHASE_COMPONENTS = "components"
+# Equations of a system : sympy equations or records and initial values
+PHASE_EQUATIONS = "equations"
+# Removal of the simple equations : presolve or sympy substitution
+PHASE_PRESOLVE = "presolve"
+# Jacobian structure, symbolic derivatives, compilation and matrices allocation
+PHASE_STRUCTURE = "structure"
+PHASE_RESIDUALS = "residuals"
+PHASE_JACOBIAN = "jacobian"
+PHASE_LINEAR_SOLVE = "linear_solve"
+PHASE_RANK = "rank"
+# Waiting for the worker processes, their own phases are added to the others
+PHASE_WORKERS = "workers"
+# Rest of the solve : results of the components, update of the points
+PHASE_OTHER = "other"
+
+
+class Timings:
+    """Times in seconds of the phases and counters of a solve"""
+
+    enabled = True
+
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+        # Running phases, the last one is charged for the time
+        self._stack = []
+        self._start = None
+
+    def _charge(self, name, now):
+        self.times[name] = self.times.get(name, 0.0) + now - self._start
+        self._start = now
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager timing a phase, the phase it interrupts is paused"""
+        now = time.perf_counter()
+        if self._stack:
+            self._charge(self._stack[-1], now)
+        else:
+            self._start = now
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge(name, time.perf_counter())
+            self._stack.pop()
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def merge(self, other):
+        """Add the as_dict() of other timings, of a worker process for example"""
+        for name, value in other["times"].items():
+            self.times[name] = self.times.get(name, 0.0) + value
+        for name, value in other["counts"].items():
+            self.count(name, value)
+
+    def as_dict(self):
+        return {"times": dict(self.times), "counts": dict(self.counts)}
+
+    def __str__(self):
+        """One line of name=value, times in milliseconds"""
+        times = (f"{name}_ms={value * 1000:.3f}" for name, value in self.times.items())
+        counts = (f"{name}={value}" for name, value in self.counts.items())
+        return " ".join([*times, *counts])
+
+
+class NoTimings:
+    """Timings doing nothing, when the solve is not profiled"""
+
+    enabled = False
+
+    def phase(self, name):
+        return contextlib.nullcontext()
+
+    def count(self, name, value=1):
+        pass
+
+    def merge(self, other):
+        pass
+
+
+NO_TIMINGS = NoTimings()
+
+
+def timed(name):
+    """Decorator of the methods of an object with a timings attribute,
+    each call is timed as the phase name"""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timings.phase(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator